@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Benchmark: YEAR()/MONTH() filters vs half-open date ranges on a multi-year attendance table
+#
+# Usage: python benchmarks/attendance_date_range_benchmark.py [employees] [years] [iterations]
+# Seeds a scratch table (attendance_range_bench) shaped like attendance, with one row per
+# employee per weekday over the given number of years, and drops it afterwards.
+# Uses DB_CONFIG from config_production.py (DB_HOST / DB_USER / ... environment variables).
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from config_production import DB_CONFIG
+
+TABLE = 'attendance_range_bench'
+
+
+def month_bounds(year, month):
+    # Same bounds as flask_backend_mysql.month_bounds
+    first_day = date(year, month, 1)
+    return first_day, date(year + (month == 12), month % 12 + 1, 1)
+
+
+def seed(connection, employees, years):
+    cursor = connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            employee_id INT NOT NULL,
+            date DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            total_hours DECIMAL(5,2) NULL,
+            INDEX idx_bench_date (date),
+            INDEX idx_bench_employee_date (employee_id, date)
+        )
+    """)
+    start = date.today().replace(day=1) - timedelta(days=365 * years)
+    day = start
+    batch = []
+    while day < date.today():
+        if day.weekday() < 5:
+            for employee_id in range(1, employees + 1):
+                batch.append((employee_id, day, random.choice(['Present', 'Present', 'Late', 'Half Day']),
+                              round(random.uniform(4, 9), 2)))
+            if len(batch) >= 5000:
+                cursor.executemany(f"INSERT INTO {TABLE} (employee_id, date, status, total_hours) VALUES (%s, %s, %s, %s)", batch)
+                batch = []
+        day += timedelta(days=1)
+    if batch:
+        cursor.executemany(f"INSERT INTO {TABLE} (employee_id, date, status, total_hours) VALUES (%s, %s, %s, %s)", batch)
+    connection.commit()
+    cursor.execute(f"ANALYZE TABLE {TABLE}")
+    cursor.fetchall()
+    cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+    rows = cursor.fetchone()[0]
+    cursor.close()
+    return rows
+
+
+def run(cursor, query, params, iterations):
+    cursor.execute("EXPLAIN " + query, params)
+    plan = cursor.fetchall()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cursor.execute(query, params)
+        cursor.fetchall()
+    return plan, (time.perf_counter() - started) * 1000 / iterations
+
+
+def main():
+    employees = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    connection = mysql.connector.connect(**DB_CONFIG)
+    try:
+        rows = seed(connection, employees, years)
+        print(f"Seeded {rows} rows ({employees} employees x {years} years) into {TABLE}")
+        last_month = date.today().replace(day=1) - timedelta(days=1)
+        year, month = last_month.year, last_month.month
+        cases = [
+            ('YEAR()/MONTH()',
+             f"SELECT employee_id, date, status FROM {TABLE} WHERE YEAR(date) = %s AND MONTH(date) = %s",
+             (year, month)),
+            ('half-open range',
+             f"SELECT employee_id, date, status FROM {TABLE} WHERE date >= %s AND date < %s",
+             month_bounds(year, month)),
+        ]
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        print(f"Month {year}-{month:02d}, {iterations} iterations each")
+        for label, query, params in cases:
+            plan, ms_per_op = run(cursor, query, params, iterations)
+            print(f"\n{label:<18}{ms_per_op:>10.3f} ms/op")
+            for row in plan:
+                print(f"  type={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra') or ''}")
+        cursor.close()
+    finally:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.close()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Benchmark: EXPLAIN plans and latency for the hot lookups with and without the index pack (migration 4)
+#
+# Usage: python benchmarks/index_pack_benchmark.py [iterations]
+# Apply the migration first (python flask_backend_mysql.py migrate). "before" runs each query with
+# IGNORE INDEX for the new index so both plans come from the same data set.
+# Uses DB_CONFIG from config_production.py (DB_HOST / DB_USER / ... environment variables).
+
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from config_production import DB_CONFIG
+
+# name: (index, query with {hint} after the indexed table, params from sample)
+CASES = {
+    'clock_in_check': (
+        'idx_attendance_employee_date',
+        "SELECT id, clock_in_time, clock_out_time FROM attendance {hint} WHERE employee_id = %s AND date = %s",
+        lambda sample: (sample['employee_id'], date.today())
+    ),
+    'scheduler_due_scan': (
+        'idx_scheduled_emails_status_time',
+        "SELECT id FROM scheduled_emails {hint} WHERE status = 'pending' AND scheduled_time <= NOW() ORDER BY scheduled_time ASC",
+        lambda sample: ()
+    ),
+    'previous_message_id': (
+        'idx_scheduled_emails_company_sent',
+        """SELECT message_id, email_type, sent_at FROM scheduled_emails {hint}
+           WHERE company_id = %s AND status = 'sent' AND message_id IS NOT NULL
+           ORDER BY sent_at DESC LIMIT 1""",
+        lambda sample: (sample['company_id'],)
+    ),
+    'tender_today_update': (
+        'idx_tender_updates_tender_created',
+        "SELECT tender_id, MAX(id) AS latest_id FROM tender_updates {hint} WHERE DATE(created_at) = CURDATE() GROUP BY tender_id",
+        lambda sample: ()
+    ),
+    'lead_latest_assignment': (
+        'idx_lead_assignments_lead_assigned',
+        "SELECT lead_id, MAX(assigned_at) AS latest_assignment_time FROM lead_assignments {hint} GROUP BY lead_id",
+        lambda sample: ()
+    ),
+    'vendor_registration_by_email': (
+        'idx_vendor_registrations_email_created',
+        "SELECT id, status, created_at FROM vendor_registrations {hint} WHERE email = %s ORDER BY created_at DESC LIMIT 1",
+        lambda sample: (sample['email'],)
+    ),
+    'employees_by_name': (
+        'idx_users_type_name',
+        "SELECT id, name, employee_id FROM users {hint} WHERE user_type = 'employee' ORDER BY name",
+        lambda sample: ()
+    ),
+}
+
+
+def load_sample(cursor):
+    """Pick real keys so the plans reflect production selectivity"""
+    def first(query, default):
+        try:
+            cursor.execute(query)
+            row = cursor.fetchone()
+        except mysql.connector.Error:
+            return default
+        return list(row.values())[0] if row else default
+    return {
+        'employee_id': first("SELECT employee_id FROM attendance ORDER BY id DESC LIMIT 1", 1),
+        'company_id': first("SELECT company_id FROM scheduled_emails ORDER BY id DESC LIMIT 1", 1),
+        'email': first("SELECT email FROM vendor_registrations ORDER BY id DESC LIMIT 1", ''),
+    }
+
+
+def explain(cursor, query, params):
+    cursor.execute("EXPLAIN " + query, params)
+    return cursor.fetchall()
+
+
+def time_query(cursor, query, params, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cursor.execute(query, params)
+        cursor.fetchall()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def print_plan(label, plan, ms_per_op):
+    print(f"  {label:<7}{ms_per_op:>10.3f} ms/op")
+    for row in plan:
+        print(f"         table={row.get('table')} type={row.get('type')} key={row.get('key')} "
+              f"rows={row.get('rows')} extra={row.get('Extra') or ''}")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    sample = load_sample(cursor)
+    print(f"Running {iterations} iterations per query against {DB_CONFIG['host']}/{DB_CONFIG['database']}")
+    for name, (index_name, template, make_params) in CASES.items():
+        params = make_params(sample)
+        before = template.format(hint=f"IGNORE INDEX ({index_name})")
+        after = template.format(hint='')
+        print(f"\n{name} ({index_name})")
+        try:
+            time_query(cursor, after, params, 5)  # warm the buffer pool
+            print_plan('before', explain(cursor, before, params), time_query(cursor, before, params, iterations))
+            print_plan('after', explain(cursor, after, params), time_query(cursor, after, params, iterations))
+        except mysql.connector.Error as e:
+            print(f"  skipped: {e}")
+    cursor.close()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Benchmark: one SMTP connection per email vs the pooled sessions in smtp_pool.py
+#
+# Usage: python benchmarks/smtp_pool_benchmark.py [messages] [delay_ms]
+# Starts a local stub SMTP server (aiosmtpd if installed, else the stdlib smtpd module on
+# Python <= 3.11) and sends the same messages both ways. delay_ms adds a sleep to every new
+# connection on the stub to stand in for the TCP + TLS + AUTH cost of a real provider.
+
+import os
+import smtplib
+import sys
+import threading
+import time
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_pool import SmtpSessionPool
+
+HOST = '127.0.0.1'
+PORT = 8025
+
+
+class StubCounters:
+    connections = 0
+    messages = 0
+
+
+def start_stub(delay):
+    """Local SMTP sink that counts connections and messages; returns a stop() callable"""
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import SMTP as AioSMTP
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                StubCounters.messages += 1
+                return '250 OK'
+
+        class CountingSMTP(AioSMTP):
+            def connection_made(self, transport):
+                StubCounters.connections += 1
+                time.sleep(delay)
+                super().connection_made(transport)
+
+        class CountingController(Controller):
+            def factory(self):
+                return CountingSMTP(self.handler)
+
+        controller = CountingController(Handler(), hostname=HOST, port=PORT)
+        controller.start()
+        return controller.stop
+    except ImportError:
+        import asyncore
+        import smtpd
+
+        class Sink(smtpd.SMTPServer):
+            def handle_accepted(self, conn, addr):
+                StubCounters.connections += 1
+                time.sleep(delay)
+                super().handle_accepted(conn, addr)
+
+            def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+                StubCounters.messages += 1
+
+        Sink((HOST, PORT), None)
+        thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05}, daemon=True)
+        thread.start()
+        # Drop the listener and every open session, like a server restart
+        return asyncore.close_all
+
+
+def build_message(i):
+    msg = MIMEText(f"Benchmark message {i}", 'plain')
+    msg['From'] = 'portal@example.com'
+    msg['To'] = f"vendor{i}@example.com"
+    msg['Subject'] = f"Benchmark {i}"
+    return msg.as_string()
+
+
+def send_unpooled(messages):
+    # What every send path did before: connect, send one message, quit
+    for i, message in enumerate(messages):
+        server = smtplib.SMTP(HOST, PORT, timeout=30)
+        server.sendmail('portal@example.com', [f"vendor{i}@example.com"], message)
+        server.quit()
+
+
+def send_pooled(pool, messages):
+    smtp = {'smtp_server': HOST, 'smtp_port': PORT, 'smtp_username': '', 'smtp_password': ''}
+    for i, message in enumerate(messages):
+        pool.send(smtp, 'portal@example.com', [f"vendor{i}@example.com"], message)
+
+
+def run(label, fn):
+    StubCounters.connections = StubCounters.messages = 0
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10}{elapsed * 1000:>10.1f} ms{StubCounters.connections:>14}{StubCounters.messages:>10}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    stop = start_stub(delay)
+    try:
+        time.sleep(0.2)
+        messages = [build_message(i) for i in range(count)]
+        pool = SmtpSessionPool(size=2, max_messages=100, allow_plaintext=True)
+        print(f"{count} messages, {delay * 1000:.0f} ms connection setup on the stub")
+        print(f"{'mode':<10}{'total':>13}{'connections':>14}{'messages':>10}")
+        run('per-email', lambda: send_unpooled(messages))
+        run('pooled', lambda: send_pooled(pool, messages))
+        pool.close_all()
+        print(f"pool stats: {pool.snapshot()}")
+    finally:
+        stop()
+
+
+if __name__ == '__main__':
+    main()
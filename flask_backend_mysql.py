@@ -1,14 +1,22 @@
 ﻿#!/usr/bin/env python3
 # Flask backend for Yellowstone Management Portal with MySQL
 
-from flask import Flask, jsonify, request, send_file, session, send_from_directory, redirect, make_response
+from flask import Flask, jsonify, request, send_file, session, send_from_directory, redirect, make_response, g, has_request_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import date, datetime, timedelta
 from urllib.parse import unquote
 import threading
 import time
+import socket
+import heapq
+import re
+import itertools
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
 from mysql.connector import Error
 import bcrypt
@@ -27,7 +35,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Tabl
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from io import BytesIO
+from io import BytesIO, StringIO
 import zipfile
 import uuid
 import secrets
@@ -35,6 +43,9 @@ import csv
 import pandas as pd
 from werkzeug.utils import secure_filename
 import json
+import logging
+from logging.handlers import RotatingFileHandler
+from smtp_pool import SmtpSessionPool
 
 # Import configuration
 try:
@@ -134,115 +145,1210 @@ def generate_vendor_password():
     password = ''.join(secrets.choice(characters) for _ in range(password_length))
     return password
 
-def load_smtp_settings_from_db():
-    """Load SMTP settings from database and update global variables"""
-    global SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
-    try:
-        query = """
-        SELECT setting_key, setting_value
-        FROM system_settings
-        WHERE setting_category = 'email' AND setting_key IN ('smtp_server', 'smtp_port', 'smtp_username', 'smtp_password')
-        """
-        settings = execute_query(query, fetch_all=True)
-        
-        for setting in settings:
-            key = setting['setting_key']
-            value = setting['setting_value']
-            
-            if key == 'smtp_server':
-                SMTP_SERVER = value if value else 'smtp.gmail.com'
-            elif key == 'smtp_port':
-                SMTP_PORT = int(value) if value else 587
-            elif key == 'smtp_username':
-                SMTP_USERNAME = value if value else ''
-            elif key == 'smtp_password':
-                SMTP_PASSWORD = value if value else ''
-        
-        # print(f"✅ SMTP settings loaded from database: {SMTP_USERNAME}")
-    except Exception as e:
-        # print(f"⚠️ Could not load SMTP settings from database, using defaults: {e}")
-        # Use existing hardcoded values as fallback
-        pass
+# system_settings is read through one in-process snapshot. Writes in this process bump its
+# version so the next read reloads; other workers pick changes up within SETTINGS_CACHE_TTL.
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', '60'))
+
+class SettingsSnapshot:
+    """Cached {category: {key: value}} copy of system_settings with a version stamp"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = 0
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._settings = {}
+        self._reloads = 0
+
+    def bump(self):
+        """Mark the snapshot stale after a settings write"""
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def get(self):
+        with self._lock:
+            if self._loaded_version == self._version and time.time() - self._loaded_at < self.ttl:
+                return self._settings
+            version = self._version
+        try:
+            rows = execute_query("SELECT setting_key, setting_value, setting_category FROM system_settings", fetch_all=True)
+        except Exception as e:
+            print(f"⚠️ Could not load system settings, using the previous snapshot: {e}")
+            return self._settings
+        settings = {}
+        for row in rows:
+            value = row['setting_value']
+            settings.setdefault(row['setting_category'], {})[row['setting_key']] = value.strip() if isinstance(value, str) else value
+        with self._lock:
+            # A bump that raced with this load leaves the snapshot stale for the next caller
+            self._settings = settings
+            self._loaded_version = version
+            self._loaded_at = time.time()
+            self._reloads += 1
+        return settings
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'loaded_version': self._loaded_version,
+                'age_seconds': round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+                'reloads': self._reloads,
+                'ttl': self.ttl
+            }
+
+settings_snapshot = SettingsSnapshot(SETTINGS_CACHE_TTL)
 
 def get_smtp_settings():
-    """Get current SMTP settings (returns database values or fallback to globals)"""
-    try:
-        query = """
-        SELECT setting_key, setting_value
-        FROM system_settings
-        WHERE setting_category = 'email' AND setting_key IN ('smtp_server', 'smtp_port', 'smtp_username', 'smtp_password', 'from_name', 'reply_to')
-        """
-        settings = execute_query(query, fetch_all=True)
-        
-        result = {}
-        for setting in settings:
-            result[setting['setting_key']] = setting['setting_value']
-        
-        return {
-            'smtp_server': result.get('smtp_server', SMTP_SERVER),
-            'smtp_port': int(result.get('smtp_port', SMTP_PORT)),
-            'smtp_username': result.get('smtp_username', SMTP_USERNAME),
-            'smtp_password': result.get('smtp_password', SMTP_PASSWORD),
-            'from_name': result.get('from_name', 'YellowStone XPs'),
-            'reply_to': result.get('reply_to', '')
-        }
-    except Exception as e:
-        # Return global values as fallback
-        return {
-            'smtp_server': SMTP_SERVER,
-            'smtp_port': SMTP_PORT,
-            'smtp_username': SMTP_USERNAME,
-            'smtp_password': SMTP_PASSWORD,
-            'from_name': 'YellowStone XPs',
-            'reply_to': ''
+    """Current SMTP settings from the settings snapshot, falling back to the configured defaults"""
+    email = settings_snapshot.get().get('email', {})
+    return {
+        'smtp_server': email.get('smtp_server') or SMTP_SERVER,
+        'smtp_port': int(email.get('smtp_port') or SMTP_PORT),
+        'smtp_username': email.get('smtp_username') or SMTP_USERNAME,
+        'smtp_password': email.get('smtp_password') or SMTP_PASSWORD,
+        'from_name': email.get('from_name') or 'YellowStone XPs',
+        'reply_to': email.get('reply_to') or ''
+    }
+
+# Every email path sends through one pool of logged-in SMTP sessions (see smtp_pool.py)
+smtp_pool = SmtpSessionPool(
+    size=int(os.environ.get('SMTP_POOL_SIZE', '4')),
+    max_messages=int(os.environ.get('SMTP_MAX_MESSAGES_PER_SESSION', '100')),
+    probe_after=float(os.environ.get('SMTP_PROBE_AFTER', '30')),        # NOOP before reusing a session idle this long
+    max_idle=float(os.environ.get('SMTP_MAX_IDLE', '240')),
+    timeout=float(os.environ.get('SMTP_TIMEOUT', '30')),
+    allow_plaintext=os.environ.get('SMTP_ALLOW_PLAINTEXT', '0') == '1'  # local stub servers only
+)
+
+def send_smtp_message(smtp, to_addrs, message):
+    """Send an already-rendered message from the configured account over a pooled session"""
+    return smtp_pool.send(smtp, smtp['smtp_username'], to_addrs, message)
+
+# ============================================================================
+# EMAIL OUTBOX
+# ============================================================================
+# Request handlers render a message and queue it on email_outbox (enqueue_email); a pool of
+# worker threads per process claims queued rows and delivers them. Delivery is at-least-once:
+# a worker that dies mid-send leaves its row in 'sending' and it is requeued once its lease
+# (EMAIL_LEASE_SECONDS) runs out.
+EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', '4'))
+EMAIL_OUTBOX_DOMAIN_CONCURRENCY = int(os.environ.get('EMAIL_OUTBOX_DOMAIN_CONCURRENCY', '2'))  # sends in flight per recipient domain
+EMAIL_OUTBOX_DOMAIN_LIMITS = os.environ.get('EMAIL_OUTBOX_DOMAIN_LIMITS', '')   # per-domain overrides, e.g. "gmail.com=1,outlook.com=1"
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', '60'))      # seconds before the first retry, doubled per attempt
+EMAIL_OUTBOX_RETRY_MAX_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_MAX_DELAY', '3600'))
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', '5'))  # enqueues in this process wake the pool sooner
+EMAIL_LEASE_SECONDS = int(os.environ.get('EMAIL_LEASE_SECONDS', '120'))        # claim lease, renewed by LeaseHeartbeat while work is in progress
+EMAIL_WORKERS_EMBEDDED = os.environ.get('EMAIL_WORKERS_EMBEDDED', '1') == '1'   # 0: run `python flask_backend_mysql.py email-workers` instead
+
+def email_worker_id():
+    """Lease owner name for this process (host:pid, so forked workers differ)"""
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+class LeaseHeartbeat:
+    """Keeps extending the leases on rows this process has claimed until they are released"""
+
+    def __init__(self, lease_seconds):
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._held = {}
+        self._beats = 0
+        self._failures = 0
+
+    def hold(self, table, ids):
+        with self._lock:
+            self._held.setdefault(table, set()).update(ids)
+
+    def release(self, table, ids):
+        with self._lock:
+            self._held.get(table, set()).difference_update(ids)
+
+    def start(self):
+        threading.Thread(target=self._run, name='email-lease-heartbeat', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(1, self.lease_seconds / 3))
+            with self._lock:
+                held = {table: list(ids) for table, ids in self._held.items() if ids}
+            for table, ids in held.items():
+                placeholders = ', '.join(['%s'] * len(ids))
+                try:
+                    result = execute_query(f"""
+                        UPDATE {table} SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                        WHERE claimed_by = %s AND id IN ({placeholders})
+                    """, [self.lease_seconds, email_worker_id()] + ids)
+                except Exception as e:
+                    # e.g. DatabaseUnavailableError; keep beating so leases renew once the database is back
+                    print(f"❌ Email lease heartbeat error ({table}): {e}")
+                    result = None
+                with self._lock:
+                    if result is None:
+                        self._failures += 1
+                    else:
+                        self._beats += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'lease_seconds': self.lease_seconds,
+                'held': {table: len(ids) for table, ids in self._held.items()},
+                'beats': self._beats,
+                'failures': self._failures
+            }
+
+lease_heartbeat = LeaseHeartbeat(EMAIL_LEASE_SECONDS)
+
+def claim_rows(table, select_sql, params, set_sql='', set_params=(), pick=None):
+    """Claim a batch of rows for this process and return them.
+
+    select_sql selects `id` (plus anything the caller needs) and ends in FOR UPDATE SKIP LOCKED,
+    so concurrent claimers skip each other's candidates instead of waiting or double-claiming.
+    pick(rows) may narrow the batch; the rows kept get claimed_by and a fresh lease (plus
+    set_sql, e.g. a status change) in the same transaction.
+    """
+    with db_transaction():
+        rows = execute_query(select_sql, params, fetch_all=True)
+        if pick:
+            rows = pick(rows)
+        if rows:
+            ids = [row['id'] for row in rows]
+            placeholders = ', '.join(['%s'] * len(ids))
+            execute_query(f"""
+                UPDATE {table}
+                SET claimed_by = %s, lease_expires_at = NOW() + INTERVAL %s SECOND{set_sql}
+                WHERE id IN ({placeholders})
+            """, [email_worker_id(), EMAIL_LEASE_SECONDS] + list(set_params) + ids)
+    return rows
+
+def parse_domain_limits(spec):
+    """"gmail.com=1, outlook.com=2" -> {'gmail.com': 1, 'outlook.com': 2}"""
+    limits = {}
+    for item in spec.split(','):
+        domain, _, limit = item.partition('=')
+        if domain.strip() and limit.strip().isdigit():
+            limits[domain.strip().lower()] = max(1, int(limit))
+    return limits
+
+def recipient_domain(address):
+    return address.rsplit('@', 1)[-1].strip().strip('>').lower() if '@' in address else ''
+
+class EmailOutbox:
+    """Claims queued email_outbox rows and delivers them over the pooled SMTP sessions.
+
+    - at most `workers` sends in flight per process, and at most the domain limit per recipient domain
+    - rows are claimed with claim_rows (SKIP LOCKED + lease), so several processes can share the table;
+      the per-batch claim token fences the final status write against a claim that was taken over
+    - failed sends are retried with exponential backoff until max_attempts; 5xx rejections fail at once
+    """
+
+    def __init__(self, workers, domain_limit, domain_limits, poll_interval, retry_delay, retry_max_delay):
+        self.workers = max(1, workers)
+        self.domain_limit = max(1, domain_limit)
+        self.domain_limits = domain_limits
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._executor = None
+        self._stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'cancelled': 0, 'requeued': 0}
+
+    def limit_for(self, domain):
+        return self.domain_limits.get(domain, self.domain_limit)
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='email-outbox')
+        threading.Thread(target=self._run, name='email-outbox-dispatcher', daemon=True).start()
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _run(self):
+        last_requeue = 0
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                if not schema_registry.has_column('email_outbox', 'lease_expires_at'):
+                    continue
+                if time.time() - last_requeue >= EMAIL_LEASE_SECONDS / 2:
+                    self._requeue_stale()
+                    last_requeue = time.time()
+                for job in self._claim():
+                    self._executor.submit(self._deliver, job)
+            except Exception as e:
+                print(f"❌ Email outbox dispatcher error: {e}")
+
+    def _requeue_stale(self):
+        # Rows whose worker stopped renewing its lease; attempts was already counted when they were claimed,
+        # so a row that keeps killing its worker fails once it is out of attempts instead of cycling forever
+        with db_transaction():
+            execute_query("""
+                UPDATE scheduled_emails se
+                JOIN email_outbox o ON o.scheduled_email_id = se.id
+                SET se.status = 'failed', se.error_message = 'Lease expired mid-send on the final attempt'
+                WHERE o.status = 'sending' AND o.lease_expires_at < NOW() AND o.attempts >= o.max_attempts
+                  AND se.status = 'pending'
+            """)
+            execute_query("""
+                UPDATE email_outbox
+                SET status = 'failed', claim_token = NULL, claimed_by = NULL, last_error = 'Lease expired mid-send on the final attempt'
+                WHERE status = 'sending' AND lease_expires_at < NOW() AND attempts >= max_attempts
+            """)
+            failed = execute_query("SELECT ROW_COUNT() AS failed", fetch_one=True)['failed']
+            execute_query("""
+                UPDATE email_outbox
+                SET status = 'queued', claim_token = NULL, claimed_by = NULL, last_error = 'Lease expired mid-send, requeued'
+                WHERE status = 'sending' AND lease_expires_at < NOW()
+            """)
+            requeued = execute_query("SELECT ROW_COUNT() AS requeued", fetch_one=True)['requeued']
+        if failed:
+            self._bump('failed', failed)
+            print(f"❌ Failed {failed} outbox emails whose lease expired on their final attempt")
+        if requeued:
+            self._bump('requeued', requeued)
+            print(f"⚠️ Requeued {requeued} outbox emails left in 'sending'")
+
+    def _claim(self):
+        with self._lock:
+            busy = dict(self._in_flight)
+        free = self.workers - sum(busy.values())
+        if free <= 0:
+            return []
+
+        def pick(candidates):
+            picked = []
+            for row in candidates:
+                domain = row['recipient_domain']
+                if busy.get(domain, 0) < self.limit_for(domain):
+                    busy[domain] = busy.get(domain, 0) + 1
+                    picked.append(row)
+                    if len(picked) == free:
+                        break
+            return picked
+
+        token = uuid.uuid4().hex
+        claimed = claim_rows('email_outbox', """
+            SELECT id, recipient_domain FROM email_outbox
+            WHERE status = 'queued' AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (free * 4,),
+            set_sql=", status = 'sending', claim_token = %s, claimed_at = NOW(), attempts = attempts + 1",
+            set_params=(token,), pick=pick)
+        if not claimed:
+            return []
+        jobs = execute_query("""
+            SELECT o.id, o.claim_token, o.recipients, o.recipient_domain, o.message, o.attempts, o.max_attempts,
+                   o.scheduled_email_id, se.status AS scheduled_status
+            FROM email_outbox o
+            LEFT JOIN scheduled_emails se ON se.id = o.scheduled_email_id
+            WHERE o.claim_token = %s
+        """, (token,), fetch_all=True)
+        lease_heartbeat.hold('email_outbox', [job['id'] for job in jobs])
+        with self._lock:
+            for job in jobs:
+                self._in_flight[job['recipient_domain']] = self._in_flight.get(job['recipient_domain'], 0) + 1
+        self._bump('claimed', len(jobs))
+        return jobs
+
+    def _deliver(self, job):
+        try:
+            if job['scheduled_email_id'] and job['scheduled_status'] not in (None, 'pending'):
+                # Cancelled (or otherwise settled) after it was queued
+                execute_query("""
+                    UPDATE email_outbox SET status = 'cancelled', claim_token = NULL, message = NULL
+                    WHERE id = %s AND claim_token = %s
+                """, (job['id'], job['claim_token']))
+                self._bump('cancelled')
+                return
+            try:
+                refused = send_smtp_message(get_smtp_settings(), json.loads(job['recipients']), job['message'])
+            except Exception as e:
+                self._record_failure(job, e)
+            else:
+                self._record_sent(job, refused)
+        except Exception as e:
+            print(f"❌ Email outbox could not record the result for email {job['id']}: {e}")
+        finally:
+            lease_heartbeat.release('email_outbox', [job['id']])
+            with self._lock:
+                domain = job['recipient_domain']
+                self._in_flight[domain] -= 1
+                if not self._in_flight[domain]:
+                    del self._in_flight[domain]
+            self._wake.set()
+
+    def _record_sent(self, job, refused):
+        # The rendered body is dropped once delivered; it can carry login credentials
+        with db_transaction():
+            execute_query("""
+                UPDATE email_outbox
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, claim_token = NULL, message = NULL, last_error = %s
+                WHERE id = %s AND claim_token = %s
+            """, (f"Refused recipients: {refused}" if refused else None, job['id'], job['claim_token']))
+            if job['scheduled_email_id']:
+                execute_query("""
+                    UPDATE scheduled_emails SET status = 'sent', sent_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND status = 'pending'
+                """, (job['scheduled_email_id'],))
+        self._bump('sent')
+
+    @staticmethod
+    def _is_permanent(error):
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return True
+        code = getattr(error, 'smtp_code', None)
+        return isinstance(code, int) and 500 <= code < 600 and not isinstance(error, smtplib.SMTPAuthenticationError)
+
+    def _record_failure(self, job, error):
+        message = str(error)[:2000]
+        if job['attempts'] < job['max_attempts'] and not self._is_permanent(error):
+            delay = min(self.retry_delay * 2 ** (job['attempts'] - 1), self.retry_max_delay)
+            execute_query("""
+                UPDATE email_outbox
+                SET status = 'queued', claim_token = NULL, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s AND claim_token = %s
+            """, (message, delay, job['id'], job['claim_token']))
+            self._bump('retried')
+            print(f"⚠️ Email {job['id']} failed (attempt {job['attempts']}/{job['max_attempts']}), retrying in {delay}s: {message}")
+            return
+        with db_transaction():
+            execute_query("""
+                UPDATE email_outbox SET status = 'failed', claim_token = NULL, last_error = %s
+                WHERE id = %s AND claim_token = %s
+            """, (message, job['id'], job['claim_token']))
+            if job['scheduled_email_id']:
+                execute_query("""
+                    UPDATE scheduled_emails SET status = 'failed', error_message = %s
+                    WHERE id = %s AND status = 'pending'
+                """, (message, job['scheduled_email_id']))
+        self._bump('failed')
+        print(f"❌ Email {job['id']} failed after {job['attempts']} attempt(s): {message}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = dict(self._in_flight)
+        stats['workers'] = self.workers
+        stats['domain_limit'] = self.domain_limit
+        stats['domain_limits'] = self.domain_limits
+        stats['worker_id'] = email_worker_id()
+        return stats
+
+email_outbox = EmailOutbox(
+    EMAIL_OUTBOX_WORKERS,
+    EMAIL_OUTBOX_DOMAIN_CONCURRENCY,
+    parse_domain_limits(EMAIL_OUTBOX_DOMAIN_LIMITS),
+    EMAIL_OUTBOX_POLL_INTERVAL,
+    EMAIL_OUTBOX_RETRY_DELAY,
+    EMAIL_OUTBOX_RETRY_MAX_DELAY
+)
+
+def enqueue_email(msg, to_addrs, email_type='transactional', scheduled_email_id=None):
+    """Queue a MIME message for the outbox workers; returns the outbox id.
+
+    Joins the caller's db_transaction if there is one, so the email is only queued if the
+    caller's writes commit; the workers are woken once that transaction commits. Returns None when scheduled_email_id is already queued. Until
+    the email_outbox migration has run, unscheduled messages are sent inline instead.
+    """
+    recipients = [to_addrs] if isinstance(to_addrs, str) else list(to_addrs)
+    message = msg.as_string()
+    if not schema_registry.has_table('email_outbox'):
+        if scheduled_email_id is not None:
+            raise RuntimeError("email_outbox table is missing; run python flask_backend_mysql.py migrate")
+        send_smtp_message(get_smtp_settings(), recipients, message)
+        return None
+    subject = str(msg['Subject'] or '')[:500] or None
+    with db_transaction():
+        execute_query("""
+            INSERT INTO email_outbox (email_type, recipients, recipient_domain, subject, message, max_attempts, scheduled_email_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE scheduled_email_id = scheduled_email_id
+        """, (email_type, json.dumps(recipients), recipient_domain(recipients[0]), subject, message,
+              EMAIL_OUTBOX_MAX_ATTEMPTS, scheduled_email_id))
+        inserted = execute_query("SELECT ROW_COUNT() AS inserted, LAST_INSERT_ID() AS id", fetch_one=True)
+    # A wake before commit would find nothing claimable and sleep out the poll interval
+    after_commit(email_outbox.wake)
+    return inserted['id'] if inserted['inserted'] == 1 else None
+
+# Connection pool settings (override via environment)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))        # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', '300'))       # recycle connections idle longer than this
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', '30'))    # ping on checkout after this much idle time
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))     # seconds before a connect attempt gives up
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT"""
+    pass
+
+class PooledConnection:
+    """Wrapper around a pooled MySQL connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise AttributeError(name)
+        return getattr(raw, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def invalidate(self):
+        """Give the slot back but drop the connection (e.g. after a lost-connection error)"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, healthy=False)
+
+    def __del__(self):
+        # Safety net for handlers that return early without closing their connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class DBConnectionPool:
+    """Bounded MySQL connection pool with health checks on checkout and idle recycling"""
+
+    def __init__(self, config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_idle=DB_POOL_MAX_IDLE, ping_after=DB_POOL_PING_AFTER, connect=None):
+        self.config = dict(config)
+        self.config.setdefault('connection_timeout', DB_CONNECT_TIMEOUT)
+        # Driver connect function; tests can pass a stub instead of mysql.connector.connect
+        self._connect_fn = connect
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []  # (connection, returned_at), most recently used last
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'exhausted': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'discarded': 0,
+            'peak_in_use': 0
         }
 
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _discard(self, raw):
+        self._bump('discarded')
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _connect(self):
+        raw = (self._connect_fn or mysql.connector.connect)(**self.config)
+        self._bump('created')
+        return raw
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                raw, returned_at = self._idle.pop()
+            idle_for = time.time() - returned_at
+            if idle_for > self.max_idle:
+                self._bump('recycled')
+                self._discard(raw)
+                continue
+            if idle_for > self.ping_after:
+                try:
+                    raw.ping(reconnect=False)
+                except Exception:
+                    self._bump('failed_health_checks')
+                    self._discard(raw)
+                    continue
+            self._bump('reused')
+            return raw
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        started = time.time()
+        if not self._slots.acquire(blocking=False):
+            self._bump('waits')
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump('exhausted')
+                raise PoolExhaustedError(f"Connection pool exhausted ({self.size} in use, waited {self.timeout}s)")
+        try:
+            raw = self._checkout_idle() or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += time.time() - started
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        return PooledConnection(self, raw)
+
+    def release(self, raw, healthy=True):
+        """Return a connection to the pool, dropping any open transaction or unread rows"""
+        try:
+            if healthy and getattr(raw, 'unread_result', False):
+                raw.consume_results()
+            if healthy and raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+        now = time.time()
+        stale = []
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, now))
+            # Recycle connections that have sat idle too long (oldest are at the front)
+            while self._idle and now - self._idle[0][1] > self.max_idle:
+                stale.append(self._idle.pop(0)[0])
+            self._stats['recycled'] += len(stale)
+        if not healthy:
+            self._discard(raw)
+        for conn in stale:
+            self._discard(conn)
+        self._slots.release()
+
+    def snapshot(self):
+        """Pool metrics for /api/health and the admin pool endpoint"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['in_use'] = self._in_use
+            stats['idle'] = len(self._idle)
+        wait_total = stats.pop('wait_time_total')
+        stats['avg_wait_ms'] = round(wait_total * 1000 / stats['checkouts'], 2) if stats['checkouts'] else 0.0
+        return stats
+
+db_pool = DBConnectionPool(DB_CONFIG)
+
+# Transient error handling: retry with jittered backoff, circuit breaker while the primary is down
+DB_RETRY_ATTEMPTS = max(1, int(os.environ.get('DB_RETRY_ATTEMPTS', '3')))
+DB_RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', '0.05'))  # seconds, doubled per attempt
+DB_RETRY_MAX_DELAY = float(os.environ.get('DB_RETRY_MAX_DELAY', '1.0'))
+DB_BREAKER_FAILURES = int(os.environ.get('DB_BREAKER_FAILURES', '5'))        # consecutive failures before opening
+DB_BREAKER_RESET_SECONDS = float(os.environ.get('DB_BREAKER_RESET_SECONDS', '30'))
+
+# Deadlock / lock wait timeout: the server rolled the statement back, so re-running is safe
+DB_RETRYABLE_LOCK_ERRORS = {1205, 1213}
+# Can't connect / server gone away / lost connection / connection dropped mid-query
+DB_CONNECTION_ERRORS = {2002, 2003, 2006, 2013, 2055}
+
+class DatabaseUnavailableError(Error):
+    """Raised by execute_query when no connection can be obtained (DB down or breaker open)"""
+    pass
+
+class CircuitBreaker:
+    """Fail fast after repeated connection failures; let one probe through after reset_timeout"""
+
+    def __init__(self, failure_threshold=DB_BREAKER_FAILURES, reset_timeout=DB_BREAKER_RESET_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0, 'last_error': None}
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+            if self._state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != 'closed':
+                print("✅ Database reachable again, closing circuit breaker")
+            self._state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give back a half-open probe that never reached the database, leaving the state as is"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if error is not None:
+                self._stats['last_error'] = str(error)
+            if self._state == 'half_open' or (self._state == 'closed' and self._failures >= self.failure_threshold):
+                if self._state == 'closed':
+                    self._stats['opened'] += 1
+                    print(f"🚨 Database circuit breaker opened after {self._failures} failures")
+                self._state = 'open'
+                self._opened_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['consecutive_failures'] = self._failures
+            stats['retry_in_seconds'] = (
+                round(max(0.0, self.reset_timeout - (time.time() - self._opened_at)), 1)
+                if self._state == 'open' else 0
+            )
+        return stats
+
+db_breaker = CircuitBreaker()
+
+def is_connection_error(error):
+    return getattr(error, 'errno', None) in DB_CONNECTION_ERRORS
+
+def is_retryable_error(error, query):
+    """Lock conflicts are always safe to retry; lost connections only for reads (a write may have landed)"""
+    errno = getattr(error, 'errno', None)
+    if errno in DB_RETRYABLE_LOCK_ERRORS:
+        return True
+    if errno in (2013, 2055):
+        return is_read_query(query)
+    return errno in DB_CONNECTION_ERRORS
+
+def _retry_delay(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * (2 ** attempt)))
+
+# Optional read replicas, e.g. DB_REPLICA_HOSTS="10.0.0.5:3306,10.0.0.6"
+DB_REPLICA_HOSTS = [h.strip() for h in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+DB_REPLICA_STICKY_SECONDS = float(os.environ.get('DB_REPLICA_STICKY_SECONDS', '5'))  # read-your-writes window
+
+def build_replica_pools(hosts, base_config=DB_CONFIG, connect=None):
+    """One pool per replica host, sharing credentials/database with the primary config"""
+    pools = []
+    for host in hosts:
+        name, _, port = host.partition(':')
+        config = dict(base_config, host=name)
+        if port:
+            config['port'] = int(port)
+        pools.append(DBConnectionPool(config, connect=connect))
+    return pools
+
+replica_pools = build_replica_pools(DB_REPLICA_HOSTS)
+_replica_counter = itertools.count()
+
+def is_read_query(query):
+    """True for plain reads that are safe to serve from a replica"""
+    head = query.lstrip().lower()
+    if not head.startswith(('select', 'with', 'show')):
+        return False
+    return 'for update' not in head and 'lock in share mode' not in head and 'last_insert_id' not in head
+
+def _mark_primary_sticky():
+    """After a write, keep this session's reads on the primary for DB_REPLICA_STICKY_SECONDS"""
+    until = time.time() + DB_REPLICA_STICKY_SECONDS
+    if has_request_context():
+        g._db_wrote = True
+        session['_db_primary_until'] = until
+    else:
+        _db_local.primary_until = until
+
+def _reads_pinned_to_primary():
+    if has_request_context():
+        return bool(g.get('_db_wrote')) or session.get('_db_primary_until', 0) > time.time()
+    return getattr(_db_local, 'primary_until', 0) > time.time()
+
+def get_connection_for(query):
+    """Route plain reads to a replica (round robin) unless the caller wrote recently; else primary"""
+    if replica_pools and is_read_query(query) and not _reads_pinned_to_primary():
+        pool = replica_pools[next(_replica_counter) % len(replica_pools)]
+        try:
+            return pool.acquire()
+        except Exception as e:
+            print(f"⚠️ Replica {pool.config.get('host')} unavailable, reading from primary: {e}")
+    return get_db_connection()
+
 # Database connection helper
 def get_db_connection():
-    """Get MySQL database connection"""
-    try:
-        # Attempting to connect to MySQL database
-        # Database connection details
-        
-        import mysql.connector
-        connection = mysql.connector.connect(**DB_CONFIG)
-        # Database connection successful
-        return connection
-    except Error as e:
-        print(f"âŒ Error connecting to MySQL: {e}")
-        print(f"âŒ Connection details: {DB_CONFIG}")
+    """Check out a MySQL connection from the shared pool (close() returns it to the pool).
+
+    Returns None straight away while the circuit breaker is open.
+    """
+    if not db_breaker.allow_request():
         return None
+    for attempt in range(DB_RETRY_ATTEMPTS):
+        try:
+            connection = db_pool.acquire()
+            db_breaker.record_success()
+            return connection
+        except PoolExhaustedError as e:
+            # A full pool says nothing about database health
+            print(f"❌ {e}")
+            db_breaker.release_probe()
+            return None
+        except Error as e:
+            if is_connection_error(e) and attempt + 1 < DB_RETRY_ATTEMPTS:
+                time.sleep(_retry_delay(attempt))
+                continue
+            db_breaker.record_failure(e)
+            print(f"❌ Error connecting to MySQL at {DB_CONFIG.get('host')}:{DB_CONFIG.get('port')}: {e}")
+            return None
 
-def execute_query(query, params=None, fetch_one=False, fetch_all=False):
-    """Execute MySQL query and return results as dictionaries"""
+# Request/job-scoped unit of work: connection bound to the current thread
+_db_local = threading.local()
+
+@contextmanager
+def db_session():
+    """Reuse one pooled connection for every execute_query call in the block.
+
+    Used per request or per background job; nested calls share the outer connection.
+    """
+    if getattr(_db_local, 'connection', None) is not None:
+        yield _db_local.connection
+        return
     connection = get_db_connection()
     if not connection:
-        # No database connection available
-        if fetch_all:
-            return []
+        raise DatabaseUnavailableError(msg="Database connection failed")
+    _db_local.connection = connection
+    _db_local.transaction_depth = 0
+    try:
+        yield connection
+    finally:
+        _db_local.connection = None
+        connection.close()
+
+@contextmanager
+def db_transaction():
+    """Run the block as one transaction: a single commit on success, rollback on any exception.
+
+    Inside the block execute_query does not commit per statement and re-raises MySQL
+    errors so a failed step aborts the whole unit. Nested blocks join the outer transaction.
+    """
+    with db_session() as connection:
+        if _db_local.transaction_depth:
+            _db_local.transaction_depth += 1
+            try:
+                yield connection
+            finally:
+                _db_local.transaction_depth -= 1
+            return
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+        _db_local.transaction_depth = 1
+        _db_local.after_commit = []
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                pass
+            raise
+        else:
+            callbacks, _db_local.after_commit = _db_local.after_commit, []
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"❌ After-commit callback failed: {e}")
+        finally:
+            _db_local.transaction_depth = 0
+            _db_local.after_commit = []
+
+def after_commit(callback):
+    """Run callback once the current thread's outermost db_transaction commits (dropped on rollback).
+
+    Outside a transaction it runs straight away.
+    """
+    if getattr(_db_local, 'connection', None) is not None and getattr(_db_local, 'transaction_depth', 0):
+        _db_local.after_commit.append(callback)
+    else:
+        callback()
+
+# Compact row mode (execute_query/stream_query with compact=True): plain tuples that share one
+# column index per result shape instead of a dict per row
+_row_types = {}
+_row_types_lock = threading.Lock()
+
+def compact_row_type(columns):
+    """Tuple subclass for a result shape; rows support row['column'] and row.column lookups"""
+    columns = tuple(columns)
+    row_type = _row_types.get(columns)
+    if row_type is not None:
+        return row_type
+    index = {name: position for position, name in enumerate(columns)}
+    _tuple_get = tuple.__getitem__
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return _tuple_get(self, index[key])
+        return _tuple_get(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return _tuple_get(self, index[name])
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        position = index.get(key)
+        return default if position is None else _tuple_get(self, position)
+
+    def as_dict(self):
+        return dict(zip(columns, self))
+
+    row_type = type('CompactRow', (tuple,), {
+        '__slots__': (),
+        'columns': columns,
+        'index': index,
+        '__getitem__': __getitem__,
+        '__getattr__': __getattr__,
+        'get': get,
+        'keys': lambda self: columns,
+        'as_dict': as_dict
+    })
+    with _row_types_lock:
+        return _row_types.setdefault(columns, row_type)
+
+def _compact_rows(cursor, rows):
+    row_type = compact_row_type(cursor.column_names)
+    return [row_type(row) for row in rows]
+
+class RowProjection:
+    """Map compact rows straight to JSON-ready dicts.
+
+    spec maps output keys to a column name, a (column, convert) pair, or a callable
+    taking the whole row. Column positions are resolved once per result shape; the
+    (columns, plan) pair is swapped in as one tuple so concurrent requests never pair
+    one shape's columns with another shape's plan.
+    """
+
+    def __init__(self, spec):
+        self.spec = dict(spec)
+        self._compiled = (None, ())
+
+    def _compile(self, row_type):
+        plan = []
+        for key, source in self.spec.items():
+            if callable(source):
+                plan.append((key, None, source))
+            elif isinstance(source, tuple):
+                plan.append((key, row_type.index[source[0]], source[1]))
+            else:
+                plan.append((key, row_type.index[source], None))
+        compiled = (row_type.columns, tuple(plan))
+        self._compiled = compiled
+        return compiled
+
+    def __call__(self, row):
+        columns, plan = self._compiled
+        if type(row).columns is not columns:
+            columns, plan = self._compile(type(row))
+        get = tuple.__getitem__
+        result = {}
+        for key, position, convert in plan:
+            if position is None:
+                result[key] = convert(row)
+            elif convert is None:
+                result[key] = get(row, position)
+            else:
+                result[key] = convert(get(row, position))
+        return result
+
+    def all(self, rows):
+        return [self(row) for row in rows]
+
+# Per-connection cache of server-side prepared statements (execute_query(..., prepared=True))
+DB_STMT_CACHE_SIZE = int(os.environ.get('DB_STMT_CACHE_SIZE', '32'))
+_stmt_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_stmt_cache_lock = threading.Lock()
+
+def _bump_stmt_stat(key):
+    with _stmt_cache_lock:
+        _stmt_cache_stats[key] += 1
+
+def _statement_cache(connection):
+    """LRU of query text -> (prepared cursor, query) kept on the underlying connection"""
+    raw = getattr(connection, '_raw', connection)
+    cache = getattr(raw, '_portal_stmt_cache', None)
+    if cache is None:
+        cache = OrderedDict()
+        raw._portal_stmt_cache = cache
+    return cache
+
+def _prepared_cursor(connection, query):
+    cache = _statement_cache(connection)
+    entry = cache.get(query)
+    if entry is not None:
+        cache.move_to_end(query)
+        _bump_stmt_stat('hits')
+        return entry
+    _bump_stmt_stat('misses')
+    # The cursor re-prepares when handed a different query object, so keep the one it saw
+    entry = (connection.cursor(prepared=True), query)
+    cache[query] = entry
+    while len(cache) > DB_STMT_CACHE_SIZE:
+        _, (old_cursor, _old_query) = cache.popitem(last=False)
+        _bump_stmt_stat('evictions')
+        try:
+            old_cursor.close()
+        except Exception:
+            pass
+    return entry
+
+def _drop_prepared_cursor(connection, query):
+    entry = _statement_cache(connection).pop(query, None)
+    if entry:
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+
+def _execute_prepared(connection, query, params, fetch_one, fetch_all, in_transaction, compact=False):
+    cursor, cached_query = _prepared_cursor(connection, query)
+    try:
+        cursor.execute(cached_query, params)
+        rows = cursor.fetchall() if cursor.with_rows else []
+    except Exception:
+        _drop_prepared_cursor(connection, query)
+        raise
+    if compact:
+        rows = _compact_rows(cursor, rows)
+    else:
+        columns = cursor.column_names
+        rows = [dict(zip(columns, row)) for row in rows]
+    if fetch_one:
+        return rows[0] if rows else None
+    if not fetch_all and not in_transaction:
+        connection.commit()
+    return rows
+
+def get_statement_cache_stats():
+    """Hit/miss/eviction counters for the prepared statement cache"""
+    with _stmt_cache_lock:
+        stats = dict(_stmt_cache_stats)
+    stats['max_per_connection'] = DB_STMT_CACHE_SIZE
+    return stats
+
+# Per-request query instrumentation (Server-Timing headers + N+1 warnings)
+DB_N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', '10'))
+
+_SQL_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_SQL_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)", re.IGNORECASE)
+
+def normalize_sql(query):
+    """Fingerprint a statement: literals become ?, IN lists collapse, whitespace is squeezed"""
+    text = _SQL_STRING_RE.sub('?', str(query))
+    text = _SQL_NUMBER_RE.sub('?', text)
+    text = _SQL_IN_LIST_RE.sub('IN (?)', text)
+    return ' '.join(text.split())
+
+# Slow-query log: statements slower than DB_SLOW_QUERY_MS go to a rotating JSON-lines file
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '500'))
+DB_SLOW_QUERY_LOG = os.environ.get('DB_SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.log'))
+DB_FINGERPRINT_LIMIT = int(os.environ.get('DB_FINGERPRINT_LIMIT', '1000'))  # distinct statements tracked in memory
+
+def _build_slow_query_logger():
+    logger = logging.getLogger('portal.slow_queries')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        try:
+            os.makedirs(os.path.dirname(DB_SLOW_QUERY_LOG) or '.', exist_ok=True)
+            handler = RotatingFileHandler(DB_SLOW_QUERY_LOG, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+        except OSError as e:
+            print(f"⚠️ Slow-query log disabled: {e}")
+    return logger
+
+slow_query_logger = _build_slow_query_logger()
+_query_fingerprints = {}  # fingerprint -> {'calls', 'total', 'max', 'rows', 'slow'}
+_query_fingerprints_lock = threading.Lock()
+
+def _params_shape(params):
+    """Describe parameter types without logging the values themselves"""
+    if params is None:
         return None
-    
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        if len(params) > 10:
+            return f"{type(params).__name__}[{len(params)}]"
+        return [type(value).__name__ for value in params]
+    return type(params).__name__
+
+def _query_source():
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+def _record_query(query, elapsed, params=None, row_count=None):
+    """Add one statement's timing to the fingerprint totals, slow log and current request's DB stats"""
+    fingerprint = normalize_sql(query)
+    slow = elapsed * 1000 >= DB_SLOW_QUERY_MS
+    with _query_fingerprints_lock:
+        entry = _query_fingerprints.get(fingerprint)
+        if entry is None and len(_query_fingerprints) < DB_FINGERPRINT_LIMIT:
+            entry = _query_fingerprints[fingerprint] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'slow': 0}
+        if entry is not None:
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['rows'] += row_count or 0
+            entry['slow'] += int(slow)
+    if slow:
+        slow_query_logger.info(json.dumps({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'fingerprint': fingerprint,
+            'params_shape': _params_shape(params),
+            'duration_ms': round(elapsed * 1000, 2),
+            'rows': row_count,
+            'endpoint': _query_source()
+        }))
+    if not has_request_context():
+        return
+    stats = g.get('_db_stats')
+    if stats is None:
+        stats = g._db_stats = {'count': 0, 'total': 0.0, 'slowest': 0.0, 'slowest_sql': None, 'statements': {}}
+    stats['count'] += 1
+    stats['total'] += elapsed
+    stats['statements'][fingerprint] = stats['statements'].get(fingerprint, 0) + 1
+    if elapsed > stats['slowest']:
+        stats['slowest'] = elapsed
+        stats['slowest_sql'] = fingerprint
+
+@app.after_request
+def add_db_timing_headers(response):
+    """Expose per-request DB usage as Server-Timing and flag repeated statements"""
+    stats = g.get('_db_stats')
+    if not stats:
+        return response
+    response.headers.add('Server-Timing', f'db;dur={stats["total"] * 1000:.2f};desc="{stats["count"]} queries"')
+    response.headers.add('Server-Timing', f'db-slowest;dur={stats["slowest"] * 1000:.2f}')
+    for fingerprint, count in stats['statements'].items():
+        if count > DB_N_PLUS_ONE_THRESHOLD:
+            print(f"⚠️ Possible N+1 in {request.method} {request.path}: statement ran {count} times: {fingerprint[:200]}")
+    return response
+
+def get_top_query_fingerprints(limit=20):
+    """Statements with the most total DB time since startup"""
+    with _query_fingerprints_lock:
+        items = [(fingerprint, dict(entry)) for fingerprint, entry in _query_fingerprints.items()]
+    items.sort(key=lambda item: item[1]['total'], reverse=True)
+    return [{
+        'fingerprint': fingerprint,
+        'calls': entry['calls'],
+        'total_ms': round(entry['total'] * 1000, 2),
+        'avg_ms': round(entry['total'] * 1000 / entry['calls'], 2),
+        'max_ms': round(entry['max'] * 1000, 2),
+        'rows': entry['rows'],
+        'slow_calls': entry['slow']
+    } for fingerprint, entry in items[:limit]]
+
+def execute_query(query, params=None, fetch_one=False, fetch_all=False, prepared=False, compact=False):
+    """Execute MySQL query and return results as dictionaries.
+
+    prepared=True runs the statement through the connection's prepared statement
+    cache (binary protocol, parsed once per connection); use it for hot, fixed SQL.
+    compact=True returns CompactRow tuples instead of dicts (see RowProjection).
+    Deadlocks and dropped connections are retried with backoff (outside transactions);
+    raises DatabaseUnavailableError when no connection can be obtained.
+    """
+    for attempt in range(DB_RETRY_ATTEMPTS):
+        try:
+            return _execute_query_once(query, params, fetch_one, fetch_all, prepared, compact,
+                                       retry=attempt + 1 < DB_RETRY_ATTEMPTS)
+        except Error as e:
+            if isinstance(e, DatabaseUnavailableError) or getattr(_db_local, 'connection', None) is not None:
+                raise
+            print(f"🔁 Transient MySQL error ({e.errno}), retrying ({attempt + 2}/{DB_RETRY_ATTEMPTS})")
+            time.sleep(_retry_delay(attempt))
+
+def _execute_query_once(query, params, fetch_one, fetch_all, prepared, compact, retry=False):
+    bound_connection = getattr(_db_local, 'connection', None)
+    in_transaction = bool(bound_connection is not None and _db_local.transaction_depth)
+    connection = bound_connection or get_connection_for(query)
+    if not connection:
+        raise DatabaseUnavailableError(msg="Database unavailable")
+
+    if replica_pools and not is_read_query(query):
+        _mark_primary_sticky()
+
     cursor = None
+    row_count = None
+    connection_lost = False
+    started = time.perf_counter()
     try:
-        cursor = connection.cursor(dictionary=True)
+        if prepared:
+            result = _execute_prepared(connection, query, params, fetch_one, fetch_all, in_transaction, compact)
+            row_count = len(result) if isinstance(result, list) else int(result is not None)
+            return result
+
+        # Buffer single-row reads so leftover rows never linger on a pooled connection
+        cursor = connection.cursor(dictionary=not compact, buffered=fetch_one)
         cursor.execute(query, params)
         
         if fetch_one:
             result = cursor.fetchone()
+            if compact and result is not None:
+                result = compact_row_type(cursor.column_names)(result)
             return result
         elif fetch_all:
             results = cursor.fetchall()
+            if compact:
+                return _compact_rows(cursor, results)
             return results if results else []
         else:
             # For INSERT, UPDATE, DELETE queries
             results = cursor.fetchall()
-            connection.commit()
+            if not in_transaction:
+                connection.commit()
             return results if results else []
     except Error as e:
+        connection_lost = is_connection_error(e)
+        if connection_lost and getattr(connection, '_pool', None) is db_pool:
+            db_breaker.record_failure(e)
+        if retry and bound_connection is None and is_retryable_error(e, query):
+            if not connection_lost:
+                connection.rollback()
+            raise
         print(f"❌ MySQL query error: {e}")
         print(f"Query: {query}")
         print(f"Params: {params}")
-        if connection:
+        if in_transaction:
+            raise
+        if connection and not connection_lost:
             connection.rollback()
         if fetch_all:
             return []
@@ -250,17 +1356,1025 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False):
     except Exception as e:
         print(f"❌ Unexpected error in execute_query: {e}")
         print(f"Query: {query}")
+        if in_transaction:
+            raise
         if connection:
             connection.rollback()
         if fetch_all:
             return []
         return None
     finally:
+        if cursor is not None and row_count is None:
+            try:
+                row_count = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+            except Exception:
+                row_count = None
+        _record_query(query, time.perf_counter() - started, params, row_count)
         if cursor:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        # Connections bound by db_session/db_transaction are released by the context manager
+        if connection and bound_connection is None:
+            if connection_lost:
+                connection.invalidate()
+            else:
+                connection.close()
+
+# Rows per multi-row INSERT statement in execute_many
+DB_BULK_CHUNK_SIZE = int(os.environ.get('DB_BULK_CHUNK_SIZE', '500'))
+
+def execute_many(table, columns, rows, update_columns=None, chunk_size=None):
+    """Insert many rows using chunked multi-row INSERT statements.
+
+    rows may be tuples (in `columns` order) or dicts keyed by column name. When
+    update_columns is given the statement becomes INSERT ... ON DUPLICATE KEY UPDATE
+    for those columns. All chunks are written in one transaction; returns the number
+    of rows written, or None if the batch failed and was rolled back.
+    """
+    values = [tuple(row[c] for c in columns) if isinstance(row, dict) else tuple(row) for row in rows]
+    if not values:
+        return 0
+    chunk_size = max(1, int(chunk_size or DB_BULK_CHUNK_SIZE))
+    row_placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    suffix = ''
+    if update_columns:
+        suffix = ' ON DUPLICATE KEY UPDATE ' + ', '.join(f"{c} = VALUES({c})" for c in update_columns)
+    in_outer_transaction = bool(getattr(_db_local, 'connection', None) is not None and _db_local.transaction_depth)
+    try:
+        with db_transaction():
+            for start in range(0, len(values), chunk_size):
+                chunk = values[start:start + chunk_size]
+                query = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                         + ', '.join([row_placeholders] * len(chunk)) + suffix)
+                execute_query(query, [v for row in chunk for v in row])
+    except Exception as e:
+        print(f"❌ Bulk insert into {table} failed: {e}")
+        if in_outer_transaction:
+            raise
+        return None
+    return len(values)
+
+# Rows fetched per round trip when streaming with stream_query
+DB_STREAM_BATCH_SIZE = int(os.environ.get('DB_STREAM_BATCH_SIZE', '500'))
+
+def stream_query(query, params=None, batch_size=None, compact=False):
+    """Run query now and return an iterator that fetches its rows lazily from an unbuffered cursor.
+
+    The connection is checked out and the statement executed before this returns, so an
+    outage raises DatabaseUnavailableError (503) before any response is built. The pooled
+    connection stays checked out until the iterator is exhausted or closed, so consume it
+    promptly (e.g. straight into a streamed response); a fetch error mid-stream is re-raised
+    so the response is cut short instead of ending as a valid but truncated body.
+    compact=True yields CompactRow tuples instead of dicts.
+    """
+    bound_connection = getattr(_db_local, 'connection', None)
+    connection = bound_connection or get_connection_for(query)
+    if not connection:
+        raise DatabaseUnavailableError(msg="Database unavailable")
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=not compact)
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        # Only time-to-first-batch is counted; the rest is fetched while the response streams
+        _record_query(query, time.perf_counter() - started, params)
+    except Error as e:
+        print(f"❌ MySQL stream error: {e}")
+        print(f"Query: {query}")
+        print(f"Params: {params}")
+        _release_stream(connection, cursor, bound_connection, e)
+        raise
+    row_type = compact_row_type(cursor.column_names) if compact else None
+    return _stream_rows(connection, cursor, bound_connection, row_type, batch_size or DB_STREAM_BATCH_SIZE, query)
+
+def _stream_rows(connection, cursor, bound_connection, row_type, batch_size, query):
+    error = None
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row_type(row) if row_type else row
+    except Error as e:
+        error = e
+        print(f"❌ MySQL stream error: {e}")
+        print(f"Query: {query}")
+        raise
+    finally:
+        _release_stream(connection, cursor, bound_connection, error)
+
+def _release_stream(connection, cursor, bound_connection, error=None):
+    connection_lost = error is not None and is_connection_error(error)
+    if connection_lost and getattr(connection, '_pool', None) is db_pool:
+        db_breaker.record_failure(error)
+    if cursor:
+        try:
             cursor.close()
-        if connection:
+        except Exception:
+            pass
+    # Connections bound by db_session/db_transaction are released by the context manager
+    if bound_connection is None:
+        if connection_lost:
+            connection.invalidate()
+        else:
             connection.close()
 
+def stream_json_array(rows, transform=None, flush_every=200):
+    """Stream an iterable of rows as a JSON array response without materializing it"""
+    def generate():
+        yield '['
+        chunk = []
+        first = True
+        for row in rows:
+            item = app.json.dumps(transform(row) if transform else row)
+            chunk.append(item if first else ',' + item)
+            first = False
+            if len(chunk) >= flush_every:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+        yield ']'
+    return app.response_class(generate(), mimetype='application/json')
+
+def stream_csv(header, rows, filename, flush_bytes=65536):
+    """Stream CSV rows (lists) as a file download without building the whole file in memory"""
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= flush_bytes:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    response = app.response_class(generate(), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+# ==================== SCHEMA REGISTRY ====================
+class SchemaRegistry:
+    """In-memory table -> columns map for the current database.
+
+    Loaded once (at startup, or lazily on first use) and reloaded only on invalidate()
+    or after migrations, so handlers never query information_schema per request.
+    If the schema cannot be read, lookups optimistically report that things exist.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None
+        self._loaded_at = None
+
+    def refresh(self):
+        """Reload from information_schema; returns False if the schema could not be read"""
+        try:
+            rows = execute_query("""
+                SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+            """, fetch_all=True)
+        except Exception as e:
+            print(f"⚠️ Could not load schema registry: {e}")
+            rows = None
+        tables = {}
+        for row in rows or []:
+            tables.setdefault(row['table_name'].lower(), set()).add(row['column_name'].lower())
+        with self._lock:
+            self._tables = {name: frozenset(columns) for name, columns in tables.items()} if rows else None
+            self._loaded_at = datetime.now() if rows else None
+        return self._tables is not None
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+            self._loaded_at = None
+
+    def _get_tables(self):
+        tables = self._tables
+        if tables is None:
+            self.refresh()
+            tables = self._tables
+        return tables
+
+    def has_table(self, table):
+        tables = self._get_tables()
+        return True if tables is None else table.lower() in tables
+
+    def has_column(self, table, column):
+        tables = self._get_tables()
+        if tables is None:
+            return True
+        return column.lower() in tables.get(table.lower(), ())
+
+    def columns(self, table):
+        tables = self._get_tables() or {}
+        return sorted(tables.get(table.lower(), ()))
+
+    def snapshot(self):
+        tables = self._tables
+        return {
+            'loaded': tables is not None,
+            'loaded_at': self._loaded_at.isoformat() if self._loaded_at else None,
+            'tables': len(tables) if tables else 0
+        }
+
+schema_registry = SchemaRegistry()
+
+# ==================== STATS ENGINE ====================
+# Dashboard, organization and health counts come from one aggregate query, cached for
+# STATS_CACHE_TTL seconds and dropped whenever broadcast_database_change reports a write.
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '15'))
+
+class TTLCache:
+    """Keyed cache with per-entry expiry; clear() also discards loads that were in flight"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.time():
+            return entry
+        return None
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._fresh(key)
+            if entry:
+                self._stats['hits'] += 1
+                return entry[0]
+        # One loader at a time, so a burst of pollers after expiry costs a single query
+        with self._load_lock:
+            with self._lock:
+                entry = self._fresh(key)
+                if entry:
+                    self._stats['hits'] += 1
+                    return entry[0]
+                self._stats['misses'] += 1
+                generation = self._generation
+            value = loader()
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (value, time.time() + self.ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats, ttl=self.ttl, entries=len(self._entries))
+
+stats_cache = TTLCache(STATS_CACHE_TTL)
+
+# Tables in the dashboard counts; without entity_counters they are scalar COUNT subqueries and
+# users gets conditional aggregation in the same statement
+STATS_COUNTED_TABLES = ['tasks', 'projects', 'workflows', 'tickets', 'vendors']
+
+# ==================== ENTITY COUNTERS ====================
+# entity_counters holds COUNT(*) per (entity, bucket), moved by counted_change in the same
+# transaction as the write and repaired periodically by reconcile_entity_counters.
+COUNTER_RECONCILE_INTERVAL = int(os.environ.get('COUNTER_RECONCILE_INTERVAL', '3600'))
+
+# table: [(entity, bucket expression over one row; NULL means the row is not counted)]
+# Expressions run both with and without bound params, so literal % is written as %%
+ENTITY_COUNTERS = {
+    'tasks': [('tasks', "COALESCE(status, '')")],
+    'projects': [('projects', "COALESCE(status, '')")],
+    'workflows': [('workflows', "COALESCE(status, '')")],
+    'tickets': [('tickets', "COALESCE(status, '')")],
+    'vendors': [('vendors', "COALESCE(registration_status, '')")],
+    'users': [
+        ('users', "CONCAT(COALESCE(user_type, ''), ':', COALESCE(status, ''))"),
+        ('employee_departments', "IF(user_type = 'employee', department, NULL)"),
+        ('employee_managers', "IF(user_type = 'employee' AND designation LIKE '%%manager%%', '', NULL)"),
+    ],
+}
+
+def _counter_buckets(table, row_id):
+    """[(entity, bucket), ...] the row currently counts toward, locking the row"""
+    definitions = ENTITY_COUNTERS.get(table)
+    if row_id is None or not definitions:
+        return []
+    columns = ', '.join(f"{expression} AS b{i}" for i, (_, expression) in enumerate(definitions))
+    row = execute_query(f"SELECT {columns} FROM {table} WHERE id = %s FOR UPDATE", (row_id,), fetch_one=True)
+    if not row:
+        return []
+    return [(entity, row[f"b{i}"]) for i, (entity, _) in enumerate(definitions) if row[f"b{i}"] is not None]
+
+class CountedChange:
+    def __init__(self, table, row_id):
+        self.table = table
+        self.row_id = row_id
+
+    def created(self):
+        """Track the row just inserted on this connection; returns its id"""
+        self.row_id = execute_query("SELECT LAST_INSERT_ID() AS id", fetch_one=True)['id']
+        return self.row_id
+
+@contextmanager
+def counted_change(table, row_id=None):
+    """Run a create/update/delete of one row in a transaction that also moves its counters.
+
+    Pass row_id for updates and deletes; for inserts call change.created() after the INSERT.
+    """
+    with db_transaction():
+        change = CountedChange(table, row_id)
+        if not schema_registry.has_table('entity_counters'):
+            yield change
+            return
+        before = _counter_buckets(table, row_id)
+        yield change
+        deltas = {}
+        for key in before:
+            deltas[key] = deltas.get(key, 0) - 1
+        for key in _counter_buckets(table, change.row_id):
+            deltas[key] = deltas.get(key, 0) + 1
+        # Sorted so concurrent writers lock counter rows in the same order
+        for (entity, bucket), delta in sorted(deltas.items()):
+            if delta:
+                execute_query("""
+                    INSERT INTO entity_counters (entity, bucket, count) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                """, (entity, str(bucket), delta))
+
+def _counter_bucket_query(table, expression):
+    # Binary collation so 'Open' and 'open' stay separate buckets, exactly as counted_change records them
+    return f"""
+        SELECT bucket, COUNT(*) AS count
+        FROM (SELECT CONVERT({expression} USING utf8mb4) COLLATE utf8mb4_bin AS bucket FROM {table}) counted
+        WHERE bucket IS NOT NULL
+        GROUP BY bucket
+    """
+
+def reconcile_entity_counters():
+    """Recount every entity and overwrite drifted buckets; returns the number repaired"""
+    repaired = 0
+    for table, definitions in ENTITY_COUNTERS.items():
+        if not schema_registry.has_table(table):
+            continue
+        for entity, expression in definitions:
+            with db_transaction():
+                # Lock the entity's counters first so in-flight writers queue behind the recount
+                stored = execute_query(
+                    "SELECT bucket, count FROM entity_counters WHERE entity = %s FOR UPDATE", (entity,), fetch_all=True
+                )
+                stored = {row['bucket']: row['count'] for row in stored}
+                actual = execute_query(_counter_bucket_query(table, expression), fetch_all=True)
+                actual = {str(row['bucket']): row['count'] for row in actual}
+                for bucket in set(stored) | set(actual):
+                    if stored.get(bucket) == actual.get(bucket):
+                        continue
+                    repaired += 1
+                    print(f"⚠️ Counter drift {entity}[{bucket!r}]: stored {stored.get(bucket)}, actual {actual.get(bucket, 0)}")
+                    if bucket in actual:
+                        execute_query("""
+                            INSERT INTO entity_counters (entity, bucket, count) VALUES (%s, %s, %s)
+                            ON DUPLICATE KEY UPDATE count = VALUES(count)
+                        """, (entity, bucket, actual[bucket]))
+                    else:
+                        execute_query("DELETE FROM entity_counters WHERE entity = %s AND bucket = %s", (entity, bucket))
+    if repaired:
+        stats_cache.clear()
+    return repaired
+
+def run_counter_reconciler():
+    """Background loop repairing counter drift from writes that bypass counted_change"""
+    while True:
+        time.sleep(COUNTER_RECONCILE_INTERVAL)
+        try:
+            reconcile_entity_counters()
+        except Exception as e:
+            print(f"❌ Counter reconciliation failed: {e}")
+
+def _stats_from_counters():
+    counters = {}
+    for row in execute_query("SELECT entity, bucket, count FROM entity_counters", fetch_all=True):
+        counters.setdefault(row['entity'], {})[row['bucket']] = row['count']
+    users = counters.get('users', {})
+    stats = {f"{table}_count": sum(counters.get(table, {}).values()) for table in STATS_COUNTED_TABLES}
+    stats.update({
+        'users_count': sum(users.values()),
+        'employees_count': sum(count for bucket, count in users.items() if bucket.startswith('employee:')),
+        'active_employees_count': users.get('employee:active', 0),
+        'departments_count': sum(1 for count in counters.get('employee_departments', {}).values() if count > 0),
+        'managers_count': counters.get('employee_managers', {}).get('', 0)
+    })
+    return {key: int(value or 0) for key, value in stats.items()}
+
+def _load_portal_stats():
+    if schema_registry.has_table('entity_counters'):
+        return _stats_from_counters()
+    counts = [
+        f"(SELECT COUNT(*) FROM {table}) AS {table}_count" if schema_registry.has_table(table) else f"0 AS {table}_count"
+        for table in STATS_COUNTED_TABLES
+    ]
+    row = execute_query(f"""
+        SELECT
+            {', '.join(counts)},
+            COUNT(*) AS users_count,
+            COALESCE(SUM(user_type = 'employee'), 0) AS employees_count,
+            COALESCE(SUM(user_type = 'employee' AND status = 'active'), 0) AS active_employees_count,
+            COUNT(DISTINCT CASE WHEN user_type = 'employee' THEN department END) AS departments_count,
+            COALESCE(SUM(user_type = 'employee' AND designation LIKE '%manager%'), 0) AS managers_count
+        FROM users
+    """, fetch_one=True) or {}
+    return {key: int(value or 0) for key, value in row.items()}
+
+def get_portal_stats():
+    """Cached counts shared by the dashboard, organization and health endpoints"""
+    return stats_cache.get_or_load('portal', _load_portal_stats)
+
+# ==================== SCHEMA MIGRATIONS ====================
+# Versioned DDL applied once at startup (DB_MIGRATE_ON_STARTUP) or with
+# `python flask_backend_mysql.py migrate`; applied versions are recorded in schema_version.
+DB_MIGRATE_ON_STARTUP = os.environ.get('DB_MIGRATE_ON_STARTUP', '1') == '1'
+SCHEMA_MIGRATION_LOCK = 'portal_schema_migrations'
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return int(cursor.fetchone()['cnt']) > 0
+
+def _foreign_keys(cursor, table, column, referenced_table=None):
+    query = """
+        SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+          AND REFERENCED_TABLE_NAME IS NOT NULL
+    """
+    params = [table, column]
+    if referenced_table:
+        query += " AND REFERENCED_TABLE_NAME = %s"
+        params.append(referenced_table)
+    cursor.execute(query, params)
+    return [row['CONSTRAINT_NAME'] for row in cursor.fetchall()]
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) AS cnt FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return int(cursor.fetchone()['cnt']) > 0
+
+def _index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT COUNT(*) AS cnt FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index_name))
+    return int(cursor.fetchone()['cnt']) > 0
+
+def _migration_update_logs(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_updates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            ticket_id INT NOT NULL,
+            employee_id INT NULL,
+            status VARCHAR(50) NULL,
+            update_message TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
+            FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_updates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            task_id INT NOT NULL,
+            employee_id INT NULL,
+            status VARCHAR(50) NULL,
+            update_message TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
+            FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+
+def _migration_tenders(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tenders (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tender_number VARCHAR(50) NOT NULL UNIQUE,
+            title VARCHAR(255) NOT NULL,
+            tender_name VARCHAR(255) NULL,
+            short_name VARCHAR(100) NULL,
+            description TEXT NULL,
+            tender_type ENUM('government', 'private') NOT NULL,
+            category VARCHAR(255) NULL,
+            organization_name VARCHAR(255) NULL,
+            budget_amount DECIMAL(15,2) NULL,
+            currency VARCHAR(3) NOT NULL DEFAULT 'INR',
+            published_date DATE NULL,
+            rfp_date DATE NULL,
+            submission_deadline DATE NULL,
+            rfq_date DATE NULL,
+            opening_date DATE NULL,
+            status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted',
+            query_text TEXT NULL,
+            contact_person VARCHAR(255) NULL,
+            contact_email VARCHAR(255) NULL,
+            contact_phone VARCHAR(50) NULL,
+            location VARCHAR(255) NULL,
+            eligibility_criteria TEXT NULL,
+            documents_required TEXT NULL,
+            important_documents TEXT NULL,
+            project_coordinator_id INT NULL,
+            project_team_ids TEXT NULL,
+            created_by INT NULL,
+            updated_by INT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_coordinator_id) REFERENCES users(id) ON DELETE SET NULL,
+            FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL,
+            FOREIGN KEY (updated_by) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+    # Older deployments created status as an ENUM
+    cursor.execute("ALTER TABLE tenders MODIFY COLUMN status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted'")
+
+    # created_tenders has no unique constraints
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS created_tenders (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tender_number VARCHAR(50) NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            tender_name VARCHAR(255) NULL,
+            short_name VARCHAR(100) NULL,
+            description TEXT NULL,
+            tender_type ENUM('government', 'private') NOT NULL,
+            category VARCHAR(255) NULL,
+            organization_name VARCHAR(255) NULL,
+            budget_amount DECIMAL(15,2) NULL,
+            currency VARCHAR(3) NOT NULL DEFAULT 'INR',
+            published_date DATE NULL,
+            rfp_date DATE NULL,
+            submission_deadline DATE NULL,
+            rfq_date DATE NULL,
+            opening_date DATE NULL,
+            status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted',
+            query_text TEXT NULL,
+            contact_person VARCHAR(255) NULL,
+            contact_email VARCHAR(255) NULL,
+            contact_phone VARCHAR(50) NULL,
+            location VARCHAR(255) NULL,
+            eligibility_criteria TEXT NULL,
+            documents_required TEXT NULL,
+            important_documents TEXT NULL,
+            project_coordinator_id INT NULL,
+            project_team_ids TEXT NULL,
+            created_by INT NULL,
+            updated_by INT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_coordinator_id) REFERENCES users(id) ON DELETE SET NULL,
+            FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL,
+            FOREIGN KEY (updated_by) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+    if not _column_exists(cursor, 'created_tenders', 'query_submission_date'):
+        cursor.execute("ALTER TABLE created_tenders ADD COLUMN query_submission_date DATE NULL AFTER opening_date")
+    if not _column_exists(cursor, 'created_tenders', 'appendix_ab_submission_date'):
+        cursor.execute("ALTER TABLE created_tenders ADD COLUMN appendix_ab_submission_date DATE NULL AFTER query_submission_date")
+    if not _column_exists(cursor, 'created_tenders', 'assigned_vendor_id'):
+        cursor.execute("ALTER TABLE created_tenders ADD COLUMN assigned_vendor_id INT NULL AFTER project_team_ids")
+    if not _foreign_keys(cursor, 'created_tenders', 'assigned_vendor_id', 'vendors'):
+        # Best effort, as before: rows pointing at deleted vendors must not block later migrations
+        try:
+            cursor.execute(
+                "ALTER TABLE created_tenders ADD CONSTRAINT fk_created_tenders_vendor FOREIGN KEY (assigned_vendor_id) REFERENCES vendors(id) ON DELETE SET NULL"
+            )
+        except Error as e:
+            print(f"⚠️ Skipping fk_created_tenders_vendor (orphaned assigned_vendor_id values?): {e}")
+
+    # Daily employee updates; no foreign key on tender_id (rows may point at tenders or created_tenders)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tender_updates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tender_id INT NOT NULL,
+            employee_id INT NULL,
+            update_message TEXT NULL,
+            status VARCHAR(50) NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
+        )
+    """)
+    for constraint_name in _foreign_keys(cursor, 'tender_updates', 'tender_id'):
+        cursor.execute(f"ALTER TABLE tender_updates DROP FOREIGN KEY `{constraint_name}`")
+
+def _migration_tender_extensions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tender_extensions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            tender_id INT NOT NULL,
+            date_field VARCHAR(50) NOT NULL,
+            old_date DATE NULL,
+            new_date DATE NULL,
+            reason TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (tender_id) REFERENCES created_tenders(id) ON DELETE CASCADE
+        )
+    """)
+
+# Composite indexes for the hot lookups (name, table, columns); see benchmarks/index_pack_benchmark.py
+INDEX_PACK = [
+    ('idx_attendance_employee_date', 'attendance', 'employee_id, date'),                   # clock in/out, daily views
+    ('idx_scheduled_emails_status_time', 'scheduled_emails', 'status, scheduled_time'),    # scheduler due scan
+    ('idx_scheduled_emails_company_sent', 'scheduled_emails', 'company_id, status, sent_at'),  # threading lookups
+    ('idx_tender_updates_tender_created', 'tender_updates', 'tender_id, created_at'),      # latest update per tender
+    ('idx_lead_assignments_lead_assigned', 'lead_assignments', 'lead_id, assigned_at'),    # latest assignment per lead
+    ('idx_vendor_registrations_email_created', 'vendor_registrations', 'email, created_at'),  # profile lookup
+    ('idx_users_type_name', 'users', 'user_type, name'),                                   # employee lists by name
+]
+
+def _create_indexes(cursor, indexes):
+    for index_name, table, columns in indexes:
+        if not _table_exists(cursor, table):
+            print(f"⚠️ Skipping {index_name}: table {table} does not exist")
+            continue
+        missing = [column for column in columns.split(', ') if not _column_exists(cursor, table, column)]
+        if missing:
+            print(f"⚠️ Skipping {index_name}: {table} has no column {', '.join(missing)}")
+            continue
+        if not _index_exists(cursor, table, index_name):
+            cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+
+def _migration_index_pack(cursor):
+    _create_indexes(cursor, INDEX_PACK)
+
+def _migration_listing_indexes(cursor):
+    # InnoDB appends the primary key to secondary indexes, so (created_at) covers (created_at, id)
+    _create_indexes(cursor, [
+        ('idx_lead_generation_reports_created', 'lead_generation_reports', 'created_at'),
+        ('idx_lead_generation_reports_uploaded', 'lead_generation_reports', 'uploaded_by, uploaded_at'),
+        ('idx_created_tenders_created', 'created_tenders', 'created_at'),
+        ('idx_nda_forms_status_created', 'nda_forms', 'status, created_at'),
+        ('idx_tasks_created', 'tasks', 'created_at'),
+    ])
+
+def _migration_lead_current_assignment(cursor):
+    # Pointer to the lead's latest assignment, kept up to date by record_lead_assignment
+    if not _column_exists(cursor, 'lead_generation_reports', 'current_assignment_id'):
+        cursor.execute("ALTER TABLE lead_generation_reports ADD COLUMN current_assignment_id INT NULL")
+    # Backfill with the rule get_admin_leads used to apply per request: latest assigned_at, highest id on ties
+    cursor.execute("""
+        UPDATE lead_generation_reports lgr
+        JOIN (
+            SELECT la1.lead_id, MAX(la1.id) AS assignment_id
+            FROM lead_assignments la1
+            JOIN (
+                SELECT lead_id, MAX(assigned_at) AS latest_assignment_time
+                FROM lead_assignments
+                GROUP BY lead_id
+            ) la2 ON la1.lead_id = la2.lead_id AND la1.assigned_at = la2.latest_assignment_time
+            GROUP BY la1.lead_id
+        ) latest ON latest.lead_id = lgr.id
+        SET lgr.current_assignment_id = latest.assignment_id
+    """)
+
+# Latest tender_updates row per tender, written by update_employee_tender alongside the log insert
+TENDER_LATEST_UPDATE_COLUMNS = [
+    ('latest_update_id', 'INT NULL'),
+    ('latest_update_message', 'TEXT NULL'),
+    ('latest_update_by', 'VARCHAR(255) NULL'),
+    ('latest_update_at', 'TIMESTAMP NULL'),
+]
+
+def _migration_tender_latest_update(cursor):
+    for column, definition in TENDER_LATEST_UPDATE_COLUMNS:
+        if not _column_exists(cursor, 'created_tenders', column):
+            cursor.execute(f"ALTER TABLE created_tenders ADD COLUMN {column} {definition}")
+    # One-time backfill; updated_at is pinned so tenders do not all look freshly edited
+    cursor.execute("""
+        UPDATE created_tenders t
+        JOIN (SELECT tender_id, MAX(id) AS latest_id FROM tender_updates GROUP BY tender_id) x ON x.tender_id = t.id
+        JOIN tender_updates y ON y.id = x.latest_id
+        LEFT JOIN users u ON y.employee_id = u.id
+        SET t.latest_update_id = y.id,
+            t.latest_update_message = y.update_message,
+            t.latest_update_by = COALESCE(u.name, 'Unknown'),
+            t.latest_update_at = y.created_at,
+            t.updated_at = t.updated_at
+    """)
+
+def _migration_entity_counters(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS entity_counters (
+            entity VARCHAR(50) NOT NULL,
+            bucket VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+            count INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (entity, bucket)
+        )
+    """)
+    cursor.execute("DELETE FROM entity_counters")
+    for table, definitions in ENTITY_COUNTERS.items():
+        if not _table_exists(cursor, table):
+            continue
+        for entity, expression in definitions:
+            cursor.execute(
+                f"INSERT INTO entity_counters (entity, bucket, count) "
+                f"SELECT %s, bucket, count FROM ({_counter_bucket_query(table, expression)}) initial",
+                (entity,)
+            )
+
+def _migration_attendance_date_index(cursor):
+    # Month reports filter every employee by a date range (see month_bounds)
+    _create_indexes(cursor, [('idx_attendance_date', 'attendance', 'date')])
+
+def _json_text(path):
+    return f"JSON_UNQUOTE(JSON_EXTRACT(form_data, '$.{path}'))"
+
+def _json_text_column(path, length):
+    # Truncated to the column size so long form values never fail the INSERT under strict mode
+    return f"VARCHAR({length}) AS (LEFT({_json_text(path)}, {length})) STORED"
+
+# Stored generated columns so list/lookup queries stop parsing form_data JSON per row
+NDA_FORM_GENERATED_COLUMNS = [
+    ('reference_number', _json_text_column('reference_number', 100), 'idx_nda_forms_reference_number'),
+    ('company_name', _json_text_column('company_name', 255), 'idx_nda_forms_company_name'),
+    ('email', _json_text_column('email', 255), 'idx_nda_forms_email'),
+    ('has_signature', f"TINYINT(1) AS (COALESCE({_json_text('signature_data')}, '') NOT IN ('', 'null')) STORED", None),
+    ('has_stamp', f"TINYINT(1) AS (COALESCE({_json_text('company_stamp_data')}, '') NOT IN ('', 'null')) STORED", None),
+]
+
+def _migration_nda_form_columns(cursor):
+    if not _table_exists(cursor, 'nda_forms'):
+        print("⚠️ Skipping nda_forms generated columns: table does not exist")
+        return
+    for column, definition, index_name in NDA_FORM_GENERATED_COLUMNS:
+        if not _column_exists(cursor, 'nda_forms', column):
+            cursor.execute(f"ALTER TABLE nda_forms ADD COLUMN {column} {definition}")
+        if index_name and not _index_exists(cursor, 'nda_forms', index_name):
+            cursor.execute(f"CREATE INDEX {index_name} ON nda_forms ({column})")
+
+def _migration_nda_form_column_lengths(cursor):
+    # Databases that ran migration 5 before the text columns were truncated get the new definition
+    if not _table_exists(cursor, 'nda_forms'):
+        return
+    for column, definition, _ in NDA_FORM_GENERATED_COLUMNS:
+        if not definition.startswith('VARCHAR'):
+            continue
+        cursor.execute("""
+            SELECT GENERATION_EXPRESSION AS expr FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'nda_forms' AND COLUMN_NAME = %s
+        """, (column,))
+        row = cursor.fetchone()
+        if row and not (row['expr'] or '').lower().startswith('left('):
+            cursor.execute(f"ALTER TABLE nda_forms MODIFY COLUMN {column} {definition}")
+
+def _migration_email_outbox(cursor):
+    # One row per outgoing email; scheduled_email_id is unique so a scheduled email is queued once
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            email_type VARCHAR(50) NOT NULL DEFAULT 'transactional',
+            recipients TEXT NOT NULL,
+            recipient_domain VARCHAR(255) NOT NULL DEFAULT '',
+            subject VARCHAR(500) NULL,
+            message LONGTEXT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 5,
+            next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claim_token CHAR(32) NULL,
+            claimed_by VARCHAR(100) NULL,
+            claimed_at DATETIME NULL,
+            last_error TEXT NULL,
+            scheduled_email_id INT NULL,
+            sent_at TIMESTAMP NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_email_outbox_scheduled_email (scheduled_email_id),
+            INDEX idx_email_outbox_status_next (status, next_attempt_at),
+            INDEX idx_email_outbox_claim_token (claim_token)
+        )
+    """)
+
+def _migration_email_leases(cursor):
+    # claimed_by/lease_expires_at let several processes claim work safely (claim_rows, LeaseHeartbeat)
+    for table in ('scheduled_emails', 'email_outbox'):
+        if not _table_exists(cursor, table):
+            print(f"⚠️ Skipping lease columns: table {table} does not exist")
+            continue
+        if not _column_exists(cursor, table, 'claimed_by'):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN claimed_by VARCHAR(100) NULL")
+        if not _column_exists(cursor, table, 'lease_expires_at'):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN lease_expires_at DATETIME NULL")
+    _create_indexes(cursor, [('idx_email_outbox_status_lease', 'email_outbox', 'status, lease_expires_at')])
+
+# (version, description, function(cursor)); append new migrations, never edit applied ones
+SCHEMA_MIGRATIONS = [
+    (1, 'ticket_updates and task_updates logs', _migration_update_logs),
+    (2, 'tenders, created_tenders and tender_updates', _migration_tenders),
+    (3, 'tender_extensions log', _migration_tender_extensions),
+    (4, 'composite index pack for hot lookups', _migration_index_pack),
+    (5, 'nda_forms generated reference/company/email/signature columns', _migration_nda_form_columns),
+    (6, 'attendance date index for monthly range scans', _migration_attendance_date_index),
+    (7, 'sort-key indexes for keyset-paginated listings', _migration_listing_indexes),
+    (8, 'lead_generation_reports.current_assignment_id pointer', _migration_lead_current_assignment),
+    (9, 'created_tenders latest update projection', _migration_tender_latest_update),
+    (10, 'entity_counters for dashboard counts', _migration_entity_counters),
+    (11, 'email_outbox queue for outgoing email', _migration_email_outbox),
+    (12, 'claim leases on scheduled_emails and email_outbox', _migration_email_leases),
+    (13, 'truncate nda_forms generated text columns to their size', _migration_nda_form_column_lengths),
+]
+
+def get_schema_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return int(cursor.fetchone()['version'])
+
+def run_migrations():
+    """Apply pending migrations in order; returns the schema version, or None on failure"""
+    connection = get_db_connection()
+    if not connection:
+        print("⚠️ Skipping schema migrations: database unavailable")
+        return None
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    locked = False
+    try:
+        # Only one worker migrates; the others wait here and then find nothing pending
+        cursor.execute("SELECT GET_LOCK(%s, 60) AS locked", (SCHEMA_MIGRATION_LOCK,))
+        locked = cursor.fetchone()['locked'] == 1
+        if not locked:
+            print("⚠️ Could not take the schema migration lock, skipping")
+            return None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        version = get_schema_version(cursor)
+        applied = 0
+        for migration_version, description, migrate in SCHEMA_MIGRATIONS:
+            if migration_version <= version:
+                continue
+            print(f"🛠️ Applying schema migration {migration_version}: {description}")
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (migration_version, description)
+            )
+            connection.commit()
+            version = migration_version
+            applied += 1
+        if applied:
+            schema_registry.invalidate()
+        return version
+    except Error as e:
+        print(f"❌ Schema migration failed: {e}")
+        connection.rollback()
+        return None
+    finally:
+        if locked:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_MIGRATION_LOCK,))
+        cursor.close()
+        connection.close()
+
+def month_bounds(year, month):
+    """Half-open [first day, first day of next month) bounds for a calendar month"""
+    first_day = date(int(year), int(month), 1)
+    next_month = date(first_day.year + (first_day.month == 12), first_day.month % 12 + 1, 1)
+    return first_day, next_month
+
+def date_range_sql(column):
+    """Index-friendly `column >= %s AND column < %s`; bind the (start, end) pair from month_bounds"""
+    return f"{column} >= %s AND {column} < %s"
+
+# Keyset pagination for admin listings: ?limit=N&cursor=<token>&include_total=1.
+# Without limit/cursor the listings keep returning the full array for existing callers.
+LIST_DEFAULT_LIMIT = int(os.environ.get('LIST_DEFAULT_LIMIT', '50'))
+LIST_MAX_LIMIT = int(os.environ.get('LIST_MAX_LIMIT', '500'))
+
+def encode_page_cursor(values):
+    """Opaque cursor token for the sort-key values of the last row on a page"""
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        elif isinstance(value, date):
+            value = {'d': value.isoformat()}
+        encoded.append(value)
+    payload = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_page_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        decoded = []
+        for value in values:
+            if isinstance(value, dict) and 'dt' in value:
+                value = datetime.fromisoformat(value['dt'])
+            elif isinstance(value, dict) and 'd' in value:
+                value = date.fromisoformat(value['d'])
+            decoded.append(value)
+        return decoded
+    except Exception:
+        raise ValueError('invalid cursor')
+
+def page_request_args():
+    """(limit, cursor values, include_total) when the caller asked for a page, else None"""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    limit = request.args.get('limit', LIST_DEFAULT_LIMIT, type=int) or LIST_DEFAULT_LIMIT
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+    return max(1, min(limit, LIST_MAX_LIMIT)), decode_page_cursor(cursor) if cursor else None, include_total
+
+def add_date_range_filter(column, conditions, params):
+    """Apply ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) as a half-open range on column"""
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if start:
+        conditions.append(f"{column} >= %s")
+        params.append(date.fromisoformat(start))
+    if end:
+        conditions.append(f"{column} < %s")
+        params.append(date.fromisoformat(end) + timedelta(days=1))
+
+def where_sql(conditions):
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+# Stand-in for NULL in nullable timestamp sort keys; a NULL key in the cursor would match no row
+KEYSET_NULL_TIMESTAMP = datetime(1970, 1, 1)
+
+def timestamp_sort_key(column, key):
+    """Order entry for a nullable TIMESTAMP column: NULL sorts, and is paged past, as the epoch"""
+    return (f"COALESCE({column}, TIMESTAMP '1970-01-01 00:00:00')", key, KEYSET_NULL_TIMESTAMP)
+
+def keyset_order_sql(order, descending=True):
+    direction = 'DESC' if descending else 'ASC'
+    return ', '.join(f"{entry[0]} {direction}" for entry in order)
+
+def keyset_cursor(row, order):
+    """Cursor token after `row`, with NULL keys replaced by the order entry's stand-in value"""
+    values = []
+    for entry in order:
+        value = row[entry[1]]
+        if value is None and len(entry) > 2:
+            value = entry[2]
+        values.append(value)
+    return encode_page_cursor(values)
+
+def _keyset_predicate(columns, values, descending):
+    """(a < x) OR (a = x AND b < y) ... for a multi-column sort key"""
+    op = '<' if descending else '>'
+    clauses, params = [], []
+    for i, column in enumerate(columns):
+        parts = [f"{previous} = %s" for previous in columns[:i]] + [f"{column} {op} %s"]
+        clauses.append('(' + ' AND '.join(parts) + ')')
+        params.extend(values[:i + 1])
+    return '(' + ' OR '.join(clauses) + ')', params
+
+def keyset_page(select_sql, from_sql, conditions, params, order, limit, cursor=None,
+                include_total=False, descending=True, transform=None, compact=False):
+    """One page of SELECT select_sql FROM from_sql WHERE conditions, ordered by `order`.
+
+    order is [(sql column, result key), ...] and must end in a unique column so the sort is
+    stable. Sort columns must be NOT NULL (wrap nullable timestamps with timestamp_sort_key).
+    Returns {'items', 'has_more', 'next_cursor'} plus 'total' when include_total.
+    """
+    conditions_page = list(conditions)
+    params_page = list(params)
+    if cursor is not None:
+        if len(cursor) != len(order):
+            raise ValueError('cursor does not match this listing')
+        predicate, cursor_params = _keyset_predicate([entry[0] for entry in order], cursor, descending)
+        conditions_page.append(predicate)
+        params_page.extend(cursor_params)
+    order_sql = keyset_order_sql(order, descending)
+    rows = execute_query(
+        f"SELECT {select_sql} FROM {from_sql}{where_sql(conditions_page)} ORDER BY {order_sql} LIMIT %s",
+        (*params_page, limit + 1), fetch_all=True, compact=compact
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    page = {
+        'items': [transform(row) for row in rows] if transform else rows,
+        'has_more': has_more,
+        'next_cursor': keyset_cursor(rows[-1], order) if has_more else None
+    }
+    if include_total:
+        total = execute_query(f"SELECT COUNT(*) AS total FROM {from_sql}{where_sql(conditions)}", tuple(params), fetch_one=True)
+        page['total'] = total['total'] if total else 0
+    return page
+
 def _generate_avatar(name):
     """Generate avatar initials from name"""
     if not name:
@@ -308,11 +2422,10 @@ def save_task(task_data):
             task_data.get('due_date'),
             datetime.now()
         )
-        task_id = execute_query(query, params)
-        if task_id:
-            task_data['id'] = task_id
-            return task_data
-        return None
+        with counted_change('tasks') as change:
+            execute_query(query, params)
+            task_data['id'] = change.created()
+        return task_data
     except Exception as e:
         print(f"Error saving task: {e}")
         return None
@@ -342,11 +2455,10 @@ def save_project(project_data):
             project_data.get('end_date'),
             datetime.now()
         )
-        project_id = execute_query(query, params)
-        if project_id:
-            project_data['id'] = project_id
-            return project_data
-        return None
+        with counted_change('projects') as change:
+            execute_query(query, params)
+            project_data['id'] = change.created()
+        return project_data
     except Exception as e:
         print(f"Error saving project: {e}")
         return None
@@ -376,11 +2488,10 @@ def save_workflow(workflow_data):
             workflow_data.get('assigned_to'),
             datetime.now()
         )
-        workflow_id = execute_query(query, params)
-        if workflow_id:
-            workflow_data['id'] = workflow_id
-            return workflow_data
-        return None
+        with counted_change('workflows') as change:
+            execute_query(query, params)
+            workflow_data['id'] = change.created()
+        return workflow_data
     except Exception as e:
         print(f"Error saving workflow: {e}")
         return None
@@ -411,11 +2522,10 @@ def save_ticket(ticket_data):
             ticket_data.get('created_by'),
             datetime.now()
         )
-        ticket_id = execute_query(query, params)
-        if ticket_id:
-            ticket_data['id'] = ticket_id
-            return ticket_data
-        return None
+        with counted_change('tickets') as change:
+            execute_query(query, params)
+            ticket_data['id'] = change.created()
+        return ticket_data
     except Exception as e:
         print(f"Error saving ticket: {e}")
         return None
@@ -423,8 +2533,7 @@ def save_ticket(ticket_data):
 def get_vendors_data():
     """Get all vendors from MySQL"""
     try:
-        table_check = execute_query("SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'vendors') as exists", fetch_one=True)
-        if not table_check or not table_check['exists']:
+        if not schema_registry.has_table('vendors'):
             print("Vendors table does not exist!")
             return []
         
@@ -444,8 +2553,7 @@ def get_vendors_data():
 def get_nda_requests_data():
     """Get all NDA requests from MySQL"""
     try:
-        table_check = execute_query("SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'nda_requests') as exists", fetch_one=True)
-        if not table_check or not table_check['exists']:
+        if not schema_registry.has_table('nda_requests'):
             print("NDA requests table does not exist!")
             return []
         
@@ -499,7 +2607,7 @@ def employee_login_by_id():
         LEFT JOIN users m ON u.manager = m.id
         WHERE u.employee_id = %s AND u.user_type = 'employee'
         """
-        user = execute_query(query, (employee_id,), fetch_one=True)
+        user = execute_query(query, (employee_id,), fetch_one=True, prepared=True)
         
         if not user:
             return jsonify({'success': False, 'message': 'Invalid employee ID'}), 401
@@ -834,7 +2942,8 @@ def register_employee():
                 SET password_hash = %s, updated_at = NOW()
                 WHERE id = %s
                 """
-                execute_query(update_query, (password_hash, existing_user['id']))
+                with counted_change('users', existing_user['id']):
+                    execute_query(update_query, (password_hash, existing_user['id']))
                 
                 return jsonify({'success': True, 'message': 'Employee account created successfully'})
             else:
@@ -846,7 +2955,9 @@ def register_employee():
         INSERT INTO users (email, password_hash, name, employee_id, designation, department, manager, user_type)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
-        user_id = execute_query(query, (email, password_hash, name, employee_id, designation, department, manager, 'employee'))
+        with counted_change('users') as change:
+            execute_query(query, (email, password_hash, name, employee_id, designation, department, manager, 'employee'))
+            user_id = change.created()
         
         if user_id:
             return jsonify({
@@ -887,15 +2998,17 @@ def register_vendor():
         INSERT INTO vendors (email, company_name, contact_person, phone, address, nda_status)
         VALUES (%s, %s, %s, %s, %s, %s)
         """
-        vendor_id = execute_query(query, (email, company_name, contact_person, phone, address, 'pending'))
+        login_query = """
+        INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address, is_active)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        with counted_change('vendors') as change:
+            execute_query(query, (email, company_name, contact_person, phone, address, 'pending'))
+            vendor_id = change.created()
+            if vendor_id:
+                execute_query(login_query, (vendor_id, email, password_hash, company_name, contact_person, phone, address, True))
         
         if vendor_id:
-            login_query = """
-            INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            execute_query(login_query, (vendor_id, email, password_hash, company_name, contact_person, phone, address, True))
-            
             return jsonify({
                 'success': True,
                 'message': 'Vendor account created successfully',
@@ -978,15 +3091,16 @@ def test_send_nda():
         
         print(f"âœ… Database connection working - {result['count']} vendors found")
         
+        smtp = get_smtp_settings()
         print(f"SMTP Configuration:")
-        print(f"  Server: {SMTP_SERVER}")
-        print(f"  Port: {SMTP_PORT}")
-        print(f"  Username: {SMTP_USERNAME}")
-        print(f"  Password: {'*' * len(SMTP_PASSWORD) if SMTP_PASSWORD else 'NOT SET'}")
+        print(f"  Server: {smtp['smtp_server']}")
+        print(f"  Port: {smtp['smtp_port']}")
+        print(f"  Username: {smtp['smtp_username']}")
+        print(f"  Password: {'*' * len(smtp['smtp_password']) if smtp['smtp_password'] else 'NOT SET'}")
         
         try:
             msg = MIMEMultipart()
-            msg['From'] = SMTP_USERNAME
+            msg['From'] = smtp['smtp_username']
             msg['To'] = 'test@example.com'
             msg['Subject'] = 'Test NDA Email'
             msg.attach(MIMEText('Test email body', 'plain'))
@@ -1018,8 +3132,11 @@ def health_check():
             return jsonify({
                 'status': 'error',
                 'message': 'Database connection failed',
-                'database': 'disconnected'
-            }), 500
+                'database': 'disconnected',
+                'db_pool': db_pool.snapshot(),
+                'db_breaker': db_breaker.snapshot()
+            }), 503
+        connection.close()
         
         result = execute_query("SELECT 1 as test", fetch_one=True)
         if not result:
@@ -1029,41 +3146,92 @@ def health_check():
                 'database': 'connected_but_query_failed'
             }), 500
         
-        vendors_count = execute_query("SELECT COUNT(*) FROM vendors", fetch_one=True)
-        users_count = execute_query("SELECT COUNT(*) FROM users", fetch_one=True)
+        stats = get_portal_stats()
         
         return jsonify({
             'status': 'healthy',
             'message': 'All systems operational',
             'database': 'connected',
-            'vendors_count': vendors_count['count'] if vendors_count else 0,
-            'users_count': users_count['count'] if users_count else 0
+            'vendors_count': stats.get('vendors_count', 0),
+            'users_count': stats.get('users_count', 0),
+            'db_pool': db_pool.snapshot(),
+            'db_breaker': db_breaker.snapshot(),
+            'stats_cache': stats_cache.snapshot()
         })
         
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': f'Health check failed: {str(e)}',
-            'database': 'error'
+            'database': 'error',
+            'db_breaker': db_breaker.snapshot()
         }), 500
 
+@app.errorhandler(DatabaseUnavailableError)
+def handle_database_unavailable(error):
+    """Uncaught DB outages surface as 503 instead of empty data"""
+    return jsonify({
+        'success': False,
+        'error': 'Database temporarily unavailable',
+        'db_breaker': db_breaker.snapshot()
+    }), 503
+
+@app.route('/api/admin/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    """Connection pool metrics (checkouts, waits, exhaustion, recycling)"""
+    return jsonify({
+        'success': True,
+        'pool': db_pool.snapshot(),
+        'replicas': [dict(pool.snapshot(), host=pool.config.get('host')) for pool in replica_pools],
+        'statement_cache': get_statement_cache_stats(),
+        'smtp_pool': smtp_pool.snapshot(),
+        'email_outbox': email_outbox.snapshot()
+    })
+
+@app.route('/api/admin/db/schema/refresh', methods=['POST'])
+def refresh_schema_registry():
+    """Reload the cached table/column list after out-of-band schema changes"""
+    if not schema_registry.refresh():
+        return jsonify({'success': False, 'error': 'Failed to refresh schema registry'}), 503
+    return jsonify({'success': True, 'schema': schema_registry.snapshot()})
+
+@app.route('/api/admin/db/counters/reconcile', methods=['POST'])
+def reconcile_counters():
+    """Recount dashboard counters now instead of waiting for the background job"""
+    try:
+        repaired = reconcile_entity_counters()
+    except Exception as e:
+        print(f"❌ Counter reconciliation failed: {e}")
+        return jsonify({'success': False, 'error': 'Failed to reconcile counters'}), 500
+    return jsonify({'success': True, 'repaired': repaired})
+
+@app.route('/api/admin/db/slow-queries', methods=['GET'])
+def get_slow_query_stats():
+    """Top statement fingerprints by total DB time, plus the slow-query log settings"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 200))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer'}), 400
+    return jsonify({
+        'success': True,
+        'threshold_ms': DB_SLOW_QUERY_MS,
+        'log_file': DB_SLOW_QUERY_LOG,
+        'fingerprints': get_top_query_fingerprints(limit)
+    })
+
 # Dashboard routes
 @app.route('/api/dashboard/stats', methods=['GET'])
 def get_dashboard_stats():
     """Get dashboard statistics with proper error handling"""
     try:
-        tasks_count = execute_query("SELECT COUNT(*) as count FROM tasks", fetch_one=True)
-        projects_count = execute_query("SELECT COUNT(*) as count FROM projects", fetch_one=True)
-        workflows_count = execute_query("SELECT COUNT(*) as count FROM workflows", fetch_one=True)
-        tickets_count = execute_query("SELECT COUNT(*) as count FROM tickets", fetch_one=True)
-        users_count = execute_query("SELECT COUNT(*) as count FROM users", fetch_one=True)
+        stats = get_portal_stats()
         
         return jsonify({
-            'total_tasks': tasks_count['count'] if tasks_count else 0,
-            'total_projects': projects_count['count'] if projects_count else 0,
-            'total_workflows': workflows_count['count'] if workflows_count else 0,
-            'total_tickets': tickets_count['count'] if tickets_count else 0,
-            'active_users': users_count['count'] if users_count else 0
+            'total_tasks': stats.get('tasks_count', 0),
+            'total_projects': stats.get('projects_count', 0),
+            'total_workflows': stats.get('workflows_count', 0),
+            'total_tickets': stats.get('tickets_count', 0),
+            'active_users': stats.get('users_count', 0)
         })
         
     except Exception as e:
@@ -1145,7 +3313,7 @@ def clock_in():
         current_time_only = current_time.time()
         
         check_query = "SELECT id, clock_in_time, clock_out_time FROM attendance WHERE employee_id = %s AND date = %s"
-        existing = execute_query(check_query, (employee_id, current_date), fetch_one=True)
+        existing = execute_query(check_query, (employee_id, current_date), fetch_one=True, prepared=True)
         
         # Allow clock-in if no existing record OR if already clocked out
         if existing and existing['clock_in_time'] and not existing['clock_out_time']:
@@ -1225,7 +3393,7 @@ def clock_out():
         current_time_only = current_time.time()
         
         check_query = "SELECT id, clock_in_time, clock_out_time, status FROM attendance WHERE employee_id = %s AND date = %s"
-        attendance = execute_query(check_query, (employee_id, current_date), fetch_one=True)
+        attendance = execute_query(check_query, (employee_id, current_date), fetch_one=True, prepared=True)
         
         if not attendance or not attendance['clock_in_time']:
             return jsonify({'error': 'Please clock in first'}), 400
@@ -1359,31 +3527,29 @@ def get_attendance_history():
         if not employee_id:
             return jsonify({'error': 'Employee ID is required'}), 400
         
+        from datetime import date, datetime
+        
+        if not (month and year):
+            current_date = date.today()
+            year, month = current_date.year, current_date.month
+        try:
+            bounds = month_bounds(year, month)
+        except ValueError:
+            return jsonify({'error': 'Invalid month or year'}), 400
+        
         user_query = "SELECT id FROM users WHERE employee_id = %s AND user_type = 'employee'"
         user = execute_query(user_query, (employee_id,), fetch_one=True)
         
         if not user:
             return jsonify({'error': 'Employee not found'}), 404
         
-        from datetime import date, datetime
-        
-        if month and year:
-            query = """
-            SELECT date, clock_in_time, clock_out_time, status, total_hours, late_minutes
-            FROM attendance 
-            WHERE employee_id = %s AND YEAR(date) = %s AND MONTH(date) = %s
-            ORDER BY date DESC
-            """
-            attendance_records = execute_query(query, (user['id'], year, month), fetch_all=True)
-        else:
-            current_date = date.today()
-            query = """
-            SELECT date, clock_in_time, clock_out_time, status, total_hours, late_minutes
-            FROM attendance 
-            WHERE employee_id = %s AND YEAR(date) = %s AND MONTH(date) = %s
-            ORDER BY date DESC
-            """
-            attendance_records = execute_query(query, (user['id'], current_date.year, current_date.month), fetch_all=True)
+        query = f"""
+        SELECT date, clock_in_time, clock_out_time, status, total_hours, late_minutes
+        FROM attendance 
+        WHERE employee_id = %s AND {date_range_sql('date')}
+        ORDER BY date DESC
+        """
+        attendance_records = execute_query(query, (user['id'], *bounds), fetch_all=True)
         
         formatted_records = []
         for record in attendance_records:
@@ -1425,7 +3591,7 @@ def get_all_attendance():
         WHERE a.date = %s AND u.user_type = 'employee'
         ORDER BY u.name
         """
-        attendance_records = execute_query(query, (current_date,), fetch_all=True)
+        attendance_records = execute_query(query, (current_date,), fetch_all=True, compact=True)
         
         # Helper function to format time objects (handles both time and timedelta)
         def format_time(time_obj):
@@ -1440,24 +3606,22 @@ def get_all_attendance():
             else:
                 return str(time_obj)
         
-        formatted_records = []
-        for record in attendance_records:
-            formatted_records.append({
-                'id': record['id'],
-                'employee_id': record['employee_id'],
-                'employee_name': record['employee_name'],
-                'employee_code': record['employee_id'],
-                'date': record['date'].strftime('%Y-%m-%d'),
-                'clock_in_time': format_time(record['clock_in_time']),
-                'clock_out_time': format_time(record['clock_out_time']),
-                'status': record['status'],
-                'total_hours': float(record['total_hours']) if record['total_hours'] else 0,
-                'late_minutes': record['late_minutes'] or 0
-            })
+        to_json = RowProjection({
+            'id': 'id',
+            'employee_id': 'employee_id',
+            'employee_name': 'employee_name',
+            'employee_code': 'employee_id',
+            'date': ('date', lambda value: value.strftime('%Y-%m-%d')),
+            'clock_in_time': ('clock_in_time', format_time),
+            'clock_out_time': ('clock_out_time', format_time),
+            'status': 'status',
+            'total_hours': ('total_hours', lambda value: float(value) if value else 0),
+            'late_minutes': ('late_minutes', lambda value: value or 0)
+        })
         
         return jsonify({
             'success': True,
-            'attendance_records': formatted_records
+            'attendance_records': to_json.all(attendance_records)
         })
         
     except Exception as e:
@@ -1557,14 +3721,15 @@ def download_monthly_attendance_report():
         days_in_month = monthrange(year, month)[1]
         
         # Query to get all attendance records for the month
-        query = """
+        query = f"""
         SELECT a.*, u.name as employee_name, u.employee_id
         FROM attendance a
         JOIN users u ON a.employee_id = u.id
-        WHERE YEAR(a.date) = %s AND MONTH(a.date) = %s AND u.user_type = 'employee'
+        WHERE {date_range_sql('a.date')} AND u.user_type = 'employee'
         ORDER BY u.name, a.date
         """
-        attendance_records = execute_query(query, (year, month), fetch_all=True)
+        # Rows are streamed from the cursor straight into the CSV response
+        attendance_records = stream_query(query, month_bounds(year, month))
         
         # Helper function to format time objects (handles both time and timedelta)
         def format_time(time_obj):
@@ -1579,45 +3744,33 @@ def download_monthly_attendance_report():
             else:
                 return str(time_obj)
         
-        # Create CSV content
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header with additional columns for monthly report
-        writer.writerow([
+        # Header with additional columns for monthly report
+        header = [
             'Employee Name', 'Employee Code', 'Date', 'Clock In', 
             'Clock Out', 'Status', 'Total Hours', 'Late Minutes', 'Week Day'
-        ])
-        
-        # Write data rows
-        for record in attendance_records:
-            date_obj = record['date']
-            week_day = date_obj.strftime('%A')  # Full weekday name
-            writer.writerow([
-                record['employee_name'],
-                record['employee_id'],
-                record['date'].strftime('%Y-%m-%d'),
-                format_time(record['clock_in_time']) or 'N/A',
-                format_time(record['clock_out_time']) or 'N/A',
-                record['status'],
-                float(record['total_hours']) if record['total_hours'] else 0,
-                record['late_minutes'] or 0,
-                week_day
-            ])
-        
-        # Prepare response
-        csv_content = output.getvalue()
-        output.close()
+        ]
         
-        from flask import make_response
+        def csv_rows():
+            for record in attendance_records:
+                date_obj = record['date']
+                week_day = date_obj.strftime('%A')  # Full weekday name
+                yield [
+                    record['employee_name'],
+                    record['employee_id'],
+                    record['date'].strftime('%Y-%m-%d'),
+                    format_time(record['clock_in_time']) or 'N/A',
+                    format_time(record['clock_out_time']) or 'N/A',
+                    record['status'],
+                    float(record['total_hours']) if record['total_hours'] else 0,
+                    record['late_minutes'] or 0,
+                    week_day
+                ]
         
         month_name = date(year, month, 1).strftime('%B')
-        response = make_response(csv_content)
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=monthly_attendance_report_{month_name}_{year}.csv'
-        
-        return response
+        return stream_csv(header, csv_rows(), f'monthly_attendance_report_{month_name}_{year}.csv')
         
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         print(f"Download monthly attendance error: {e}")
         return jsonify({'error': 'Failed to download monthly attendance report'}), 500
@@ -1646,17 +3799,16 @@ def download_monthly_attendance_matrix():
             fetch_all=True
         ) or []
 
-        # Get all attendance in month
-        rows = execute_query(
-            """
+        # Get all attendance in month (streamed straight into the status map)
+        rows = stream_query(
+            f"""
             SELECT a.employee_id, a.date, a.status
             FROM attendance a
             JOIN users u ON a.employee_id = u.id
-            WHERE YEAR(a.date) = %s AND MONTH(a.date) = %s AND u.user_type = 'employee'
+            WHERE {date_range_sql('a.date')} AND u.user_type = 'employee'
             """,
-            (year, month),
-            fetch_all=True
-        ) or []
+            month_bounds(year, month)
+        )
 
         # Build map: (employee_id, day) -> status
         status_map = {}
@@ -1740,37 +3892,30 @@ def download_monthly_attendance_matrix():
                 download_name=f"attendance_matrix_{month_name}_{year}.xlsx"
             )
         else:
-            # Prepare CSV with full words
-            output = StringIO()
-            writer = csv.writer(output)
+            # Prepare CSV with full words, streamed row by row
             header = ['Employee Name', 'Employee Code'] + [str(d) for d in range(1, days_in_month + 1)] + ['Present', 'Late', 'Half Day', 'Absent']
-            writer.writerow(header)
 
-            for emp in employees:
-                counts = {'Present': 0, 'Late': 0, 'Half Day': 0, 'Absent': 0}
-                day_values = []
-                for d in range(1, days_in_month + 1):
-                    st = status_full(status_map.get((emp['id'], d), 'Absent'))
-                    counts[st] = counts.get(st, 0) + 1
-                    day_values.append(st)
-                writer.writerow([
-                    emp['name'],
-                    emp['employee_id'],
-                    *day_values,
-                    counts.get('Present', 0),
-                    counts.get('Late', 0),
-                    counts.get('Half Day', 0),
-                    counts.get('Absent', 0)
-                ])
-
-            csv_content = output.getvalue()
-            output.close()
-
-            from flask import make_response
-            response = make_response(csv_content)
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = f'attachment; filename=attendance_matrix_{month_name}_{year}.csv'
-            return response
+            def csv_rows():
+                for emp in employees:
+                    counts = {'Present': 0, 'Late': 0, 'Half Day': 0, 'Absent': 0}
+                    day_values = []
+                    for d in range(1, days_in_month + 1):
+                        st = status_full(status_map.get((emp['id'], d), 'Absent'))
+                        counts[st] = counts.get(st, 0) + 1
+                        day_values.append(st)
+                    yield [
+                        emp['name'],
+                        emp['employee_id'],
+                        *day_values,
+                        counts.get('Present', 0),
+                        counts.get('Late', 0),
+                        counts.get('Half Day', 0),
+                        counts.get('Absent', 0)
+                    ]
+
+            return stream_csv(header, csv_rows(), f'attendance_matrix_{month_name}_{year}.csv')
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         print(f"Download monthly attendance matrix error: {e}")
         return jsonify({'error': 'Failed to download monthly attendance matrix'}), 500
@@ -1798,14 +3943,10 @@ def get_attendance_summary():
             date_filter_sql = "a.date BETWEEN %s AND %s"
             date_filter_args = (start_date, end_date)
         elif range_type == 'month':
-            start_date = ref_date.replace(day=1)
-            if start_date.month == 12:
-                next_month = start_date.replace(year=start_date.year + 1, month=1, day=1)
-            else:
-                next_month = start_date.replace(month=start_date.month + 1, day=1)
+            start_date, next_month = month_bounds(ref_date.year, ref_date.month)
             end_date = next_month - timedelta(days=1)
-            date_filter_sql = "YEAR(a.date) = %s AND MONTH(a.date) = %s"
-            date_filter_args = (start_date.year, start_date.month)
+            date_filter_sql = date_range_sql('a.date')
+            date_filter_args = (start_date, next_month)
         else:
             # default daily
             start_date = ref_date
@@ -1998,6 +4139,7 @@ def register_vendor_detailed():
         if not test_connection:
             print("âŒ Database connection failed")
             return jsonify({'error': 'Database connection failed. Please try again later.'}), 500
+        test_connection.close()
         
         # Check if vendor already exists, create if not
         check_query = "SELECT id FROM vendors WHERE email = %s"
@@ -2014,9 +4156,11 @@ def register_vendor_detailed():
                                business_type, registration_status, portal_access, created_at)
             VALUES (%s, %s, %s, %s, %s, %s, 'pending', 0, NOW())
             """
-            vendor_id = execute_query(vendor_insert_query, (
-                company_name, contact_person, email, phone, address, business_type
-            ))
+            with counted_change('vendors') as change:
+                execute_query(vendor_insert_query, (
+                    company_name, contact_person, email, phone, address, business_type
+                ))
+                vendor_id = change.created()
             print(f"Created new vendor with ID: {vendor_id}")
         
         # Check if registration already exists by email
@@ -2089,18 +4233,10 @@ Address: Plot # 2, ITC, Fourth Floor, Sector 67, Mohali -160062, Punjab, India""
             
             msg.attach(MIMEText(body, 'plain'))
             
-            if smtp['smtp_port'] == 465:
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            server.sendmail(smtp['smtp_username'], email, msg.as_string())
-            server.quit()
-            print(f"✅ Confirmation email sent to {email}")
+            enqueue_email(msg, email, 'registration_confirmation')
+            print(f"✅ Confirmation email queued for {email}")
         except Exception as email_error:
-            print(f"⚠️ Failed to send confirmation email: {email_error}")
+            print(f"⚠️ Failed to queue confirmation email: {email_error}")
             # Don't fail the registration if email fails
         
         # Broadcast the new registration to connected clients
@@ -2169,118 +4305,123 @@ def get_vendor_registrations():
 def approve_vendor_registration(registration_id):
     """Approve a vendor registration"""
     try:
-        query = "SELECT * FROM vendor_registrations WHERE id = %s"
-        registration = execute_query(query, (registration_id,), fetch_one=True)
-        
-        print(f"=== APPROVE DEBUG ===")
-        print(f"Registration ID: {registration_id}")
-        print(f"Registration found: {registration is not None}")
-        if registration:
-            print(f"Current status: '{registration['status']}' (type: {type(registration['status'])})")
-            print(f"Status comparison: '{registration['status']}' != 'pending' = {registration['status'] != 'pending'}")
-        
-        if not registration:
-            return jsonify({'success': False, 'message': 'Registration not found'}), 404
-        
-        if registration['status'] not in ['pending', None]:
-            print(f"Registration status is not pending: '{registration['status']}'")
-            return jsonify({'success': False, 'message': f'Registration is not pending (current status: {registration["status"]})'}), 400
-        
-        # Update registration status
-        update_query = "UPDATE vendor_registrations SET status = 'approved', updated_at = NOW() WHERE id = %s"
-        execute_query(update_query, (registration_id,))
-        
-        # Find vendor by email and update status
-        vendor_query = "SELECT id, email FROM vendors WHERE email = %s"
-        vendor = execute_query(vendor_query, (registration['email'],), fetch_one=True)
-        
-        if vendor:
-            print(f"✅ Found vendor ID: {vendor['id']} for email: {registration['email']}")
-            # Update vendor status AND company information to match registration
-            vendor_update_query = """
-            UPDATE vendors 
-            SET registration_status = 'approved', 
-                portal_access = 1,
-                company_name = %s,
-                contact_person = %s,
-                phone = %s,
-                address = %s,
-                updated_at = NOW()
-            WHERE id = %s
-            """
-            execute_query(vendor_update_query, (
-                registration['company_name'],
-                registration['contact_person'],
-                registration['phone'],
-                registration['address'],
-                vendor['id']
-            ))
-            print(f"✅ Updated vendor information for vendor_id: {vendor['id']}")
+        # All registration/vendor/login writes commit together or not at all
+        with db_transaction():
+            query = "SELECT * FROM vendor_registrations WHERE id = %s FOR UPDATE"
+            registration = execute_query(query, (registration_id,), fetch_one=True)
+        
+            print(f"=== APPROVE DEBUG ===")
+            print(f"Registration ID: {registration_id}")
+            print(f"Registration found: {registration is not None}")
+            if registration:
+                print(f"Current status: '{registration['status']}' (type: {type(registration['status'])})")
+                print(f"Status comparison: '{registration['status']}' != 'pending' = {registration['status'] != 'pending'}")
+        
+            if not registration:
+                return jsonify({'success': False, 'message': 'Registration not found'}), 404
+        
+            if registration['status'] not in ['pending', None]:
+                print(f"Registration status is not pending: '{registration['status']}'")
+                return jsonify({'success': False, 'message': f'Registration is not pending (current status: {registration["status"]})'}), 400
+        
+            # Update registration status
+            update_query = "UPDATE vendor_registrations SET status = 'approved', updated_at = NOW() WHERE id = %s"
+            execute_query(update_query, (registration_id,))
+        
+            # Find vendor by email and update status
+            vendor_query = "SELECT id, email FROM vendors WHERE email = %s"
+            vendor = execute_query(vendor_query, (registration['email'],), fetch_one=True)
+        
+            if vendor:
+                print(f"✅ Found vendor ID: {vendor['id']} for email: {registration['email']}")
+                # Update vendor status AND company information to match registration
+                vendor_update_query = """
+                UPDATE vendors 
+                SET registration_status = 'approved', 
+                    portal_access = 1,
+                    company_name = %s,
+                    contact_person = %s,
+                    phone = %s,
+                    address = %s,
+                    updated_at = NOW()
+                WHERE id = %s
+                """
+                with counted_change('vendors', vendor['id']):
+                    execute_query(vendor_update_query, (
+                        registration['company_name'],
+                        registration['contact_person'],
+                        registration['phone'],
+                        registration['address'],
+                        vendor['id']
+                    ))
+                print(f"✅ Updated vendor information for vendor_id: {vendor['id']}")
             
-            # Use vendor's actual email from the vendors table, not from registration
-            vendor_email = vendor['email']
-            print(f"✅ Using vendor email: {vendor_email} for login creation")
+                # Use vendor's actual email from the vendors table, not from registration
+                vendor_email = vendor['email']
+                print(f"✅ Using vendor email: {vendor_email} for login creation")
             
-            # Generate password for vendor login
-            vendor_password = generate_vendor_password()
-            password_hash = bcrypt.hashpw(vendor_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                # Generate password for vendor login
+                vendor_password = generate_vendor_password()
+                password_hash = bcrypt.hashpw(vendor_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
             
-            # DELETE any existing vendor_login records for this email to avoid confusion
-            delete_query = "DELETE FROM vendor_logins WHERE email = %s"
-            execute_query(delete_query, (vendor_email,))
-            print(f"✅ Deleted old vendor_login records for email: {vendor_email}")
+                # DELETE any existing vendor_login records for this email to avoid confusion
+                delete_query = "DELETE FROM vendor_logins WHERE email = %s"
+                execute_query(delete_query, (vendor_email,))
+                print(f"✅ Deleted old vendor_login records for email: {vendor_email}")
             
-            # Create vendor login
-            login_query = """
-            INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            execute_query(login_query, (
-                vendor['id'],
-                vendor_email,  # Use vendor's email from vendors table
-                password_hash,
-                registration['company_name'],
-                registration['contact_person'],
-                registration['phone'],
-                registration['address']
-            ))
-            print(f"✅ Created vendor_login for vendor_id: {vendor['id']} with email: {vendor_email}")
-        else:
-            # Create new vendor if not found
-            vendor_insert_query = """
-                INSERT INTO vendors (company_name, contact_person, email, phone, address, 
-                                   business_type, registration_status, portal_access, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, 'approved', 1, NOW())
+                # Create vendor login
+                login_query = """
+                INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """
-            vendor_id = execute_query(vendor_insert_query, (
-                registration['company_name'], registration['contact_person'], registration['email'],
-                registration['phone'], registration['address'], registration['business_type']
-            ))
+                execute_query(login_query, (
+                    vendor['id'],
+                    vendor_email,  # Use vendor's email from vendors table
+                    password_hash,
+                    registration['company_name'],
+                    registration['contact_person'],
+                    registration['phone'],
+                    registration['address']
+                ))
+                print(f"✅ Created vendor_login for vendor_id: {vendor['id']} with email: {vendor_email}")
+            else:
+                # Create new vendor if not found
+                vendor_insert_query = """
+                    INSERT INTO vendors (company_name, contact_person, email, phone, address, 
+                                       business_type, registration_status, portal_access, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'approved', 1, NOW())
+                    """
+                with counted_change('vendors') as change:
+                    execute_query(vendor_insert_query, (
+                        registration['company_name'], registration['contact_person'], registration['email'],
+                        registration['phone'], registration['address'], registration['business_type']
+                    ))
+                    vendor_id = change.created()
             
-            # Generate password for vendor login
-            vendor_password = generate_vendor_password()
-            password_hash = bcrypt.hashpw(vendor_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                # Generate password for vendor login
+                vendor_password = generate_vendor_password()
+                password_hash = bcrypt.hashpw(vendor_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
             
-            # DELETE any existing vendor_login records for this email
-            delete_query = "DELETE FROM vendor_logins WHERE email = %s"
-            execute_query(delete_query, (registration['email'],))
-            print(f"✅ Deleted old vendor_login records for email: {registration['email']}")
+                # DELETE any existing vendor_login records for this email
+                delete_query = "DELETE FROM vendor_logins WHERE email = %s"
+                execute_query(delete_query, (registration['email'],))
+                print(f"✅ Deleted old vendor_login records for email: {registration['email']}")
             
-            # Create vendor login
-            login_query = """
-            INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            execute_query(login_query, (
-                vendor_id, 
-                registration['email'], 
-                password_hash,
-                registration['company_name'],
-                registration['contact_person'],
-                registration['phone'],
-                registration['address']
-            ))
-            print(f"✅ Created new vendor with ID: {vendor_id}")
+                # Create vendor login
+                login_query = """
+                INSERT INTO vendor_logins (vendor_id, email, password_hash, company_name, contact_person, phone, address)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+                execute_query(login_query, (
+                    vendor_id, 
+                    registration['email'], 
+                    password_hash,
+                    registration['company_name'],
+                    registration['contact_person'],
+                    registration['phone'],
+                    registration['address']
+                ))
+                print(f"✅ Created new vendor with ID: {vendor_id}")
         
         # Send credentials email to vendor using correct email
         vendor_email_to_use = vendor['email'] if vendor else registration['email']
@@ -2297,7 +4438,7 @@ def approve_vendor_registration(registration_id):
             'company_name': registration['company_name']
         })
         
-        email_status = "Credentials sent via email" if email_sent else "Warning: Email failed to send"
+        email_status = "Credentials email queued" if email_sent else "Warning: Credentials email could not be queued"
         
         return jsonify({
             'success': True,
@@ -2472,7 +4613,7 @@ def get_vendor_profile():
                company_registration_number, company_incorporation_country, company_incorporation_state
         FROM vendors WHERE id = %s
         """
-        vendor_data = execute_query(vendor_query, (vendor_id,), fetch_one=True)
+        vendor_data = execute_query(vendor_query, (vendor_id,), fetch_one=True, prepared=True)
         print(f"Vendor data found: {vendor_data is not None}")
         
         if not vendor_data:
@@ -2834,8 +4975,10 @@ def create_employee():
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'active', 'employee', NOW())
         """
         
-        execute_query(query, (email, password_hash, name, employee_id, position, department,
-                             manager, phone, address, hire_date, salary, emergency_contact))
+        with counted_change('users') as change:
+            execute_query(query, (email, password_hash, name, employee_id, position, department,
+                                 manager, phone, address, hire_date, salary, emergency_contact))
+            change.created()
         
         return jsonify({'success': True, 'message': 'Employee created successfully'})
         
@@ -2917,8 +5060,9 @@ def update_employee(employee_id):
         WHERE id = %s AND user_type = 'employee'
         """
         
-        execute_query(query, (name, email, employee_id_new, position, department, manager,
-                             phone, address, hire_date, salary, emergency_contact, status, employee_id))
+        with counted_change('users', employee_id):
+            execute_query(query, (name, email, employee_id_new, position, department, manager,
+                                 phone, address, hire_date, salary, emergency_contact, status, employee_id))
         
         return jsonify({'success': True, 'message': 'Employee updated successfully'})
         
@@ -2936,7 +5080,8 @@ def delete_employee(employee_id):
             return jsonify({'success': False, 'message': 'Employee not found'}), 404
         
         query = "DELETE FROM users WHERE id = %s AND user_type = 'employee'"
-        execute_query(query, (employee_id,))
+        with counted_change('users', employee_id):
+            execute_query(query, (employee_id,))
         
         return jsonify({'success': True, 'message': 'Employee deleted successfully'})
         
@@ -2960,23 +5105,20 @@ def get_all_departments():
         ) emp_count ON d.name = emp_count.department
         ORDER BY d.name
         """
-        departments = execute_query(query, fetch_all=True)
-        
-        dept_list = []
-        for dept in departments:
-            dept_dict = {
-                'id': dept['id'],
-                'name': dept['name'],
-                'employeeCount': dept['employee_count'],
-                'description': dept['description'] or f"{dept['name']} Department",
-                'head': dept['head_id'],
-                'budget': dept['budget'] or '',
-                'location': dept['location'] or '',
-                'establishedDate': dept['established_date'] or ''
-            }
-            dept_list.append(dept_dict)
+        departments = execute_query(query, fetch_all=True, compact=True)
+        
+        to_json = RowProjection({
+            'id': 'id',
+            'name': 'name',
+            'employeeCount': 'employee_count',
+            'description': lambda dept: dept['description'] or f"{dept['name']} Department",
+            'head': 'head_id',
+            'budget': ('budget', lambda value: value or ''),
+            'location': ('location', lambda value: value or ''),
+            'establishedDate': ('established_date', lambda value: value or '')
+        })
         
-        return jsonify(dept_list)
+        return jsonify(to_json.all(departments))
         
     except Exception as e:
         print(f"Get departments error: {e}")
@@ -2986,23 +5128,13 @@ def get_all_departments():
 def get_organization_stats():
     """Get organization statistics"""
     try:
-        query = "SELECT COUNT(*) as total FROM users WHERE user_type = 'employee'"
-        total_employees = execute_query(query, fetch_one=True)['total']
-        
-        query = "SELECT COUNT(*) as active FROM users WHERE user_type = 'employee' AND status = 'active'"
-        active_employees = execute_query(query, fetch_one=True)['active']
-        
-        query = "SELECT COUNT(DISTINCT department) as dept_count FROM users WHERE user_type = 'employee' AND department IS NOT NULL"
-        departments = execute_query(query, fetch_one=True)['dept_count']
-        
-        query = "SELECT COUNT(*) as managers FROM users WHERE user_type = 'employee' AND designation LIKE '%manager%'"
-        managers = execute_query(query, fetch_one=True)['managers']
+        stats = get_portal_stats()
         
         return jsonify({
-            'totalEmployees': total_employees,
-            'activeEmployees': active_employees,
-            'departments': departments,
-            'managers': managers
+            'totalEmployees': stats.get('employees_count', 0),
+            'activeEmployees': stats.get('active_employees_count', 0),
+            'departments': stats.get('departments_count', 0),
+            'managers': stats.get('managers_count', 0)
         })
         
     except Exception as e:
@@ -3012,10 +5144,10 @@ def get_organization_stats():
 # Task Management API Endpoints
 @app.route('/api/admin/tasks', methods=['GET'])
 def get_tasks():
-    """Get all tasks"""
+    """Get all tasks (filters: status, priority, assignee/assignee_type, from/to; keyset pages with limit/cursor)"""
     try:
-        query = """
-        SELECT t.*, 
+        select_sql = """
+            t.*, 
                CASE 
                    WHEN t.assigned_to_type = 'employee' THEN u.name
                    WHEN t.assigned_to_type = 'vendor' THEN v.company_name
@@ -3026,13 +5158,32 @@ def get_tasks():
                    WHEN t.assigned_to_type = 'vendor' THEN v.email
                    ELSE NULL
                END as assigned_to_email
-        FROM tasks t
+        """
+        from_sql = """
+        tasks t
         LEFT JOIN users u ON t.assigned_to_type = 'employee' AND t.assigned_to_id = u.id
         LEFT JOIN vendors v ON t.assigned_to_type = 'vendor' AND t.assigned_to_id = v.id
-        ORDER BY t.created_at DESC
         """
-        tasks = execute_query(query, fetch_all=True)
+        conditions, params = [], []
+        for arg, column in (('status', 't.status'), ('priority', 't.priority'),
+                            ('assignee', 't.assigned_to_id'), ('assignee_type', 't.assigned_to_type')):
+            if request.args.get(arg):
+                conditions.append(f"{column} = %s")
+                params.append(request.args[arg])
+        add_date_range_filter('t.created_at', conditions, params)
+
+        page = page_request_args()
+        if page:
+            return jsonify(keyset_page(select_sql, from_sql, conditions, params,
+                                       [timestamp_sort_key('t.created_at', 'created_at'), ('t.id', 'id')], *page))
+
+        tasks = execute_query(
+            f"SELECT {select_sql} FROM {from_sql}{where_sql(conditions)} ORDER BY t.created_at DESC, t.id DESC",
+            params, fetch_all=True
+        )
         return jsonify(tasks)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
     except Exception as e:
         print(f"Get tasks error: {e}")
         return jsonify({'error': 'Failed to get tasks'}), 500
@@ -3071,7 +5222,9 @@ def create_task():
         
         assigned_to = assigned_to_id if assigned_to_type == 'employee' else None
         
-        execute_query(query, (title, description, db_priority, status, assigned_to_type, assigned_to_id, assigned_to, due_date, salary_code, created_by))
+        with counted_change('tasks') as change:
+            execute_query(query, (title, description, db_priority, status, assigned_to_type, assigned_to_id, assigned_to, due_date, salary_code, created_by))
+            change.created()
         
         return jsonify({'success': True, 'message': 'Task created successfully'})
         
@@ -3112,7 +5265,8 @@ def update_task(task_id):
         WHERE id = %s
         """
         
-        execute_query(query, (title, description, db_priority, status, assigned_to_type, assigned_to_id, due_date, salary_code, task_id))
+        with counted_change('tasks', task_id):
+            execute_query(query, (title, description, db_priority, status, assigned_to_type, assigned_to_id, due_date, salary_code, task_id))
         
         return jsonify({'success': True, 'message': 'Task updated successfully'})
         
@@ -3125,7 +5279,8 @@ def delete_task(task_id):
     """Delete a task"""
     try:
         query = "DELETE FROM tasks WHERE id = %s"
-        execute_query(query, (task_id,))
+        with counted_change('tasks', task_id):
+            execute_query(query, (task_id,))
         
         return jsonify({'success': True, 'message': 'Task deleted successfully'})
         
@@ -3197,7 +5352,9 @@ def create_project():
         
         project_manager = assigned_to_id if assigned_to_type == 'employee' else None
         
-        execute_query(query, (name, description, status, db_priority, assigned_to_type, assigned_to_id, project_manager, start_date, end_date, budget, salary_code, created_by))
+        with counted_change('projects') as change:
+            execute_query(query, (name, description, status, db_priority, assigned_to_type, assigned_to_id, project_manager, start_date, end_date, budget, salary_code, created_by))
+            change.created()
         
         return jsonify({'success': True, 'message': 'Project created successfully'})
         
@@ -3266,7 +5423,8 @@ def update_project(project_id):
         WHERE id = %s
         """
         
-        execute_query(query, (name, description, status, db_priority, assigned_to_type, assigned_to_id, start_date, end_date, budget, salary_code, project_id))
+        with counted_change('projects', project_id):
+            execute_query(query, (name, description, status, db_priority, assigned_to_type, assigned_to_id, start_date, end_date, budget, salary_code, project_id))
         
         return jsonify({'success': True, 'message': 'Project updated successfully'})
         
@@ -3279,7 +5437,8 @@ def delete_project(project_id):
     """Delete a project"""
     try:
         query = "DELETE FROM projects WHERE id = %s"
-        execute_query(query, (project_id,))
+        with counted_change('projects', project_id):
+            execute_query(query, (project_id,))
         
         return jsonify({'success': True, 'message': 'Project deleted successfully'})
         
@@ -3369,7 +5528,9 @@ def create_ticket():
         
         print(f"Ticket creation values: assigned_to_type={assigned_to_type}, assigned_to_id={assigned_to_id}, assigned_to={assigned_to}, created_by={created_by}")
         
-        execute_query(query, (title, description, category, db_priority, db_status, assigned_to_type, assigned_to_id, assigned_to, salary_code, created_by))
+        with counted_change('tickets') as change:
+            execute_query(query, (title, description, category, db_priority, db_status, assigned_to_type, assigned_to_id, assigned_to, salary_code, created_by))
+            change.created()
         
         return jsonify({'success': True, 'message': 'Ticket created successfully'})
         
@@ -3419,7 +5580,8 @@ def update_ticket(ticket_id):
         WHERE id = %s
         """
         
-        execute_query(query, (title, description, category, db_priority, db_status, assigned_to_type, assigned_to_id, salary_code, ticket_id))
+        with counted_change('tickets', ticket_id):
+            execute_query(query, (title, description, category, db_priority, db_status, assigned_to_type, assigned_to_id, salary_code, ticket_id))
         
         return jsonify({'success': True, 'message': 'Ticket updated successfully'})
         
@@ -3432,7 +5594,8 @@ def delete_ticket(ticket_id):
     """Delete a ticket"""
     try:
         query = "DELETE FROM tickets WHERE id = %s"
-        execute_query(query, (ticket_id,))
+        with counted_change('tickets', ticket_id):
+            execute_query(query, (ticket_id,))
         
         return jsonify({'success': True, 'message': 'Ticket deleted successfully'})
         
@@ -3487,13 +5650,14 @@ def submit_vendor_nda():
         WHERE reference_number = %s
         """
         
-        print(f"📝 Updating vendor record for reference: {reference_number}")
-        execute_query(query, (signature, stamp_data, company_name, contact_person, phone, address, reference_number))
-        print(f"✅ Vendor record updated successfully")
-        
-        # Insert a record into nda_forms to appear in admin list
-        try:
-            # Find vendor id
+        # Vendor update and nda_forms insert commit together, so a failed insert
+        # never leaves a vendor marked completed without its NDA record
+        with db_transaction():
+            print(f"📝 Updating vendor record for reference: {reference_number}")
+            execute_query(query, (signature, stamp_data, company_name, contact_person, phone, address, reference_number))
+            print(f"✅ Vendor record updated successfully")
+            
+            # Insert a record into nda_forms to appear in admin list
             vrow = execute_query("SELECT id FROM vendors WHERE reference_number = %s", (reference_number,), fetch_one=True)
             vendor_id = vrow.get('id') if vrow else None
             if vendor_id:
@@ -3518,13 +5682,11 @@ def submit_vendor_nda():
                 )
             else:
                 print(f"⚠️ Vendor not found for reference {reference_number}; skipping nda_forms insert")
-        except Exception as insert_err:
-            print(f"⚠️ Failed inserting into nda_forms: {insert_err}")
 
         # Send confirmation email to vendor
         try:
             smtp = get_smtp_settings()
-            print(f"📧 Sending confirmation email to {email}")
+            print(f"📧 Queueing confirmation email to {email}")
             
             msg = MIMEMultipart()
             msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
@@ -3554,19 +5716,10 @@ Address: Plot # 2, ITC, Fourth Floor, Sector 67, Mohali -160062, Punjab, India""
             
             msg.attach(MIMEText(body, 'plain'))
             
-            if smtp['smtp_port'] == 465:
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            text = msg.as_string()
-            server.sendmail(smtp['smtp_username'], email, text)
-            server.quit()
-            print(f"✅ Confirmation email sent to {email}")
+            enqueue_email(msg, email, 'nda_confirmation')
+            print(f"✅ Confirmation email queued for {email}")
         except Exception as email_error:
-            print(f"⚠️ Failed to send confirmation email: {email_error}")
+            print(f"⚠️ Failed to queue confirmation email: {email_error}")
             # Don't fail the NDA submission if email fails
         
         # Broadcast to admin views so NDA list updates in real-time
@@ -3588,14 +5741,13 @@ Address: Plot # 2, ITC, Fourth Floor, Sector 67, Mohali -160062, Punjab, India""
 # Admin routes
 @app.route('/api/admin/nda-forms', methods=['GET'])
 def get_admin_nda_forms():
-    """Get all NDA forms for admin view"""
+    """Get NDA forms for admin view (filters: status (default signed), from/to; keyset pages with limit/cursor)"""
     try:
-        query = """
-        SELECT 
+        select_sql = """
             nf.id,
-            JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.company_name')) as company_name,
+            nf.company_name,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.contact_person')) as contact_person,
-            JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.email')) as email,
+            nf.email,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.phone')) as phone,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.address')) as address,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.business_type')) as business_type,
@@ -3605,42 +5757,39 @@ def get_admin_nda_forms():
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.signature_data')) as signature_data,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.company_stamp_data')) as company_stamp_data,
             JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.signature_type')) as signature_type,
-            JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.reference_number')) as reference_number,
+            nf.reference_number,
             nf.status as nda_status,
             nf.signed_at as signed_date,
             nf.created_at,
             nf.updated_at,
             v.portal_access,
             v.has_full_access,
-            CASE 
-                WHEN JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.signature_data')) IS NOT NULL 
-                     AND JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.signature_data')) != '' 
-                     AND JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.signature_data')) != 'null'
-                THEN 1
-                ELSE 0
-            END as has_signature,
-            CASE 
-                WHEN JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.company_stamp_data')) IS NOT NULL 
-                     AND JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.company_stamp_data')) != '' 
-                     AND JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.company_stamp_data')) != 'null'
-                THEN 1
-                ELSE 0
-            END as has_company_stamp,
+            nf.has_signature,
+            nf.has_stamp as has_company_stamp,
             CASE 
                 WHEN v.portal_access = 1 THEN 'Granted'
                 ELSE 'Pending'
             END as portal_access_status
-        FROM nda_forms nf
-        JOIN vendors v ON nf.vendor_id = v.id
-        WHERE nf.status = 'signed'
-        ORDER BY nf.created_at DESC
         """
-        nda_forms = execute_query(query, fetch_all=True)
-        
-        if nda_forms is None:
-            return jsonify([])
-        return jsonify(nda_forms)
+        from_sql = "nda_forms nf JOIN vendors v ON nf.vendor_id = v.id"
+        conditions, params = ["nf.status = %s"], [request.args.get('status') or 'signed']
+        add_date_range_filter('nf.created_at', conditions, params)
+
+        page = page_request_args()
+        if page:
+            return jsonify(keyset_page(select_sql, from_sql, conditions, params,
+                                       [timestamp_sort_key('nf.created_at', 'created_at'), ('nf.id', 'id')], *page))
+
+        # Stream rows straight into the JSON response instead of building the full list
+        return stream_json_array(stream_query(
+            f"SELECT {select_sql} FROM {from_sql}{where_sql(conditions)} ORDER BY nf.created_at DESC, nf.id DESC",
+            params
+        ))
         
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         return jsonify([])
 
@@ -3660,7 +5809,7 @@ def delete_nda_form(form_id):
             SELECT has_access FROM employee_access
             WHERE employee_id = %s AND access_type = 'send_nda'
             """
-            access = execute_query(access_query, (employee_id,), fetch_one=True)
+            access = execute_query(access_query, (employee_id,), fetch_one=True, prepared=True)
             
             if not access or not bool(access.get('has_access', False)):
                 return jsonify({'error': 'No NDA access permission'}), 403
@@ -3706,7 +5855,8 @@ def approve_vendor_portal_access(vendor_id):
         WHERE id = %s
         """
         
-        result = execute_query(update_query, (vendor_id,))
+        with counted_change('vendors', vendor_id):
+            result = execute_query(update_query, (vendor_id,))
         print(f"✅ Vendor portal access updated")
         
         # Get vendor details for email
@@ -3751,7 +5901,7 @@ def approve_vendor_portal_access(vendor_id):
             print(f"✅ Temporary credentials created, expires: {expires_at}")
             print(f"✅ Temporary password: {temp_password}")
             
-            print(f"✅ Sending approval email to {vendor['email']}")
+            print(f"✅ Queueing approval email to {vendor['email']}")
             
             # Send approval email
             try:
@@ -3791,18 +5941,10 @@ Email: Harpreet.singh@yellowstonexps.com"""
                 
                 msg.attach(MIMEText(body, 'plain'))
                 
-                if smtp['smtp_port'] == 465:
-                    server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                else:
-                    server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                    server.starttls()
-                
-                server.login(smtp['smtp_username'], smtp['smtp_password'])
-                server.sendmail(smtp['smtp_username'], vendor['email'], msg.as_string())
-                server.quit()
-                print(f"✅ Approval email sent to {vendor['email']}")
+                enqueue_email(msg, vendor['email'], 'portal_approval')
+                print(f"✅ Approval email queued for {vendor['email']}")
             except Exception as email_error:
-                print(f"⚠️ Failed to send approval email: {email_error}")
+                print(f"⚠️ Failed to queue approval email: {email_error}")
         
         return jsonify({'success': True, 'message': 'Portal access approved successfully'})
         
@@ -3820,31 +5962,34 @@ def get_admin_templates():
         if not connection:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor()
-        cursor.execute("""
-            SELECT id, name, description, template_type, category, priority, 
-                   form_fields, status, created_at, created_by_name
-            FROM form_templates 
-            ORDER BY created_at DESC
-        """)
-        
-        templates = []
-        for row in cursor.fetchall():
-            templates.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'template_type': row[3],
-                'category': row[4],
-                'priority': row[5],
-                'form_fields': row[6],
-                'status': row[7],
-                'created_at': row[8].isoformat() if row[8] else None,
-                'created_by_name': row[9]
-            })
-        
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT id, name, description, template_type, category, priority, 
+                       form_fields, status, created_at, created_by_name
+                FROM form_templates 
+                ORDER BY created_at DESC
+            """)
+            
+            templates = []
+            for row in cursor.fetchall():
+                templates.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'template_type': row[3],
+                    'category': row[4],
+                    'priority': row[5],
+                    'form_fields': row[6],
+                    'status': row[7],
+                    'created_at': row[8].isoformat() if row[8] else None,
+                    'created_by_name': row[9]
+                })
+            
+            cursor.close()
+        finally:
+            # Always hand the connection back to the pool, even if the query fails
+            connection.close()
         
         return jsonify({
             'success': True,
@@ -3873,30 +6018,32 @@ def create_template():
         if not connection:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor()
-        
-        # Insert new template
-        insert_query = """
-            INSERT INTO form_templates 
-            (name, description, template_type, category, priority, form_fields, status, created_at, created_by_name)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), %s)
-        """
-        
-        cursor.execute(insert_query, (
-            data.get('name'),
-            data.get('description', ''),
-            data.get('template_type'),
-            data.get('category', 'general'),
-            data.get('priority', 'medium'),
-            json.dumps(data.get('form_fields', {})),
-            data.get('status', 'draft'),
-            data.get('created_by_name', 'Admin')
-        ))
-        
-        template_id = cursor.lastrowid
-        connection.commit()
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            
+            # Insert new template
+            insert_query = """
+                INSERT INTO form_templates 
+                (name, description, template_type, category, priority, form_fields, status, created_at, created_by_name)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), %s)
+            """
+            
+            cursor.execute(insert_query, (
+                data.get('name'),
+                data.get('description', ''),
+                data.get('template_type'),
+                data.get('category', 'general'),
+                data.get('priority', 'medium'),
+                json.dumps(data.get('form_fields', {})),
+                data.get('status', 'draft'),
+                data.get('created_by_name', 'Admin')
+            ))
+            
+            template_id = cursor.lastrowid
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
         
         return jsonify({
             'success': True,
@@ -3919,20 +6066,21 @@ def delete_template(template_id):
         if not connection:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor()
-        
-        # Check if template exists
-        cursor.execute("SELECT id FROM form_templates WHERE id = %s", (template_id,))
-        if not cursor.fetchone():
+        try:
+            cursor = connection.cursor(buffered=True)
+            
+            # Check if template exists
+            cursor.execute("SELECT id FROM form_templates WHERE id = %s", (template_id,))
+            if not cursor.fetchone():
+                cursor.close()
+                return jsonify({'success': False, 'error': 'Template not found'}), 404
+            
+            # Delete template
+            cursor.execute("DELETE FROM form_templates WHERE id = %s", (template_id,))
+            connection.commit()
             cursor.close()
+        finally:
             connection.close()
-            return jsonify({'success': False, 'error': 'Template not found'}), 404
-        
-        # Delete template
-        cursor.execute("DELETE FROM form_templates WHERE id = %s", (template_id,))
-        connection.commit()
-        cursor.close()
-        connection.close()
         
         return jsonify({
             'success': True,
@@ -3976,7 +6124,7 @@ def download_nda_pdf(reference_number):
         query = """
         SELECT nf.id, nf.form_data, nf.signed_at, nf.vendor_id
         FROM nda_forms nf
-        WHERE JSON_UNQUOTE(JSON_EXTRACT(nf.form_data, '$.reference_number')) = %s
+        WHERE nf.reference_number = %s
         LIMIT 1
         """
         nda_form = execute_query(query, (reference_number,), fetch_one=True)
@@ -4167,7 +6315,7 @@ def download_nda_pdf(reference_number):
 
 @app.route('/api/admin/send-completed-nda-email', methods=['POST'])
 def send_completed_nda_email():
-    """Send completion email with attached NDA PDF."""
+    """Queue the completion email with the NDA PDF attached."""
     try:
         data = request.get_json() or {}
         form_id = data.get('formId')
@@ -4190,7 +6338,7 @@ def send_completed_nda_email():
                 nf = execute_query(
                     """
                     SELECT form_data FROM nda_forms
-                    WHERE JSON_UNQUOTE(JSON_EXTRACT(form_data, '$.reference_number')) = %s
+                    WHERE reference_number = %s
                     ORDER BY id DESC LIMIT 1
                     """,
                     (vendor['reference_number'],), fetch_one=True
@@ -4381,26 +6529,12 @@ YellowStone Xperiences Pvt Ltd
             recipients = [vendor['email']]
             if smtp.get('smtp_username'):
                 recipients.append(smtp['smtp_username'])
-            if smtp['smtp_port'] == 465:
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            try:
-                server.set_debuglevel(1)
-            except Exception:
-                pass
-            result = server.sendmail(smtp['smtp_username'], recipients, msg.as_string())
-            server.quit()
-            if result:
-                # result is a dict of {recipient: error}
-                return jsonify({'success': False, 'message': f'Unsent recipients: {result}'}), 500
+            outbox_id = enqueue_email(msg, recipients, 'completed_nda')
         except Exception as mail_err:
-            print(f"Completed NDA email send error: {mail_err}")
-            return jsonify({'success': False, 'message': f'Email send failed: {mail_err}'}), 500
+            print(f"Completed NDA email queue error: {mail_err}")
+            return jsonify({'success': False, 'message': f'Email could not be queued: {mail_err}'}), 500
 
-        return jsonify({'success': True, 'message': 'Completion email with PDF sent successfully'})
+        return jsonify({'success': True, 'message': 'Completion email with PDF queued for delivery', 'outbox_id': outbox_id})
 
     except Exception as e:
         print(f"Send completed NDA email error: {e}")
@@ -4443,66 +6577,54 @@ def send_bulk_nda():
             print("âŒ No vendors selected")
             return jsonify({'success': False, 'message': 'No vendors selected'}), 400
         
-        # Process emails in background thread for immediate response
-        email_thread = threading.Thread(target=send_bulk_nda_background_worker, args=(vendors,))
-        email_thread.daemon = True
-        email_thread.start()
+        # One pooled connection for the whole batch; the outbox workers do the sending
+        with db_session():
+            queued = _queue_bulk_nda(vendors)
         
-        # Return immediately - UI responds instantly
         return jsonify({
             'success': True, 
-            'message': f'Processing {len(vendors)} NDAs', 
-            'vendor_count': len(vendors)
+            'message': f'Queued {queued} of {len(vendors)} NDAs', 
+            'vendor_count': len(vendors),
+            'queued_count': queued
         })
         
     except Exception as e:
+        print(f"❌ Bulk NDA failed: {e}")
         return jsonify({'success': False, 'message': 'Failed to process bulk NDA'}), 500
 
-def send_bulk_nda_background_worker(vendors):
-    """Background worker to send emails"""
+def _queue_bulk_nda(vendors):
+    """Record each vendor's NDA and queue its email in the same transaction; returns the number queued"""
+    queued = 0
     try:
-        print(f"🔵 Bulk NDA worker started with {len(vendors)} vendors")
-        # Fetch current SMTP settings
+        print(f"🔵 Bulk NDA started with {len(vendors)} vendors")
         smtp = get_smtp_settings()
-        print(f"🔵 SMTP Config: Server={smtp['smtp_server']}, Port={smtp['smtp_port']}, From={smtp['smtp_username']}")
-        
-        # Create single SMTP connection for all emails
-        if smtp['smtp_port'] == 465:
-            print("Using SSL connection for port 465...")
-            server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-        else:
-            print(f"Using STARTTLS for port {smtp['smtp_port']}...")
-            server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            server.starttls()
-        
-        print("Logging in...")
-        server.login(smtp['smtp_username'], smtp['smtp_password'])
-        print(f"✅ Logged in as {smtp['smtp_username']}")
         
         for i, vendor in enumerate(vendors, 1):
             try:
                 print(f"📧 Processing vendor {i}/{len(vendors)}: {vendor['email']}")
                 reference_number = generate_reference_number()
                 
-                # Update or create vendor record
-                check_query = "SELECT id FROM vendors WHERE email = %s"
-                existing_vendor = execute_query(check_query, (vendor['email'],), fetch_one=True)
-                
-                if existing_vendor:
-                    update_query = """
-                    UPDATE vendors SET company_name = %s, reference_number = %s, nda_status = 'sent', updated_at = NOW()
-                    WHERE email = %s
-                    """
-                    execute_query(update_query, (vendor['company_name'], reference_number, vendor['email']))
-                else:
-                    insert_query = """
-                    INSERT INTO vendors (email, company_name, nda_status, reference_number, created_at)
-                    VALUES (%s, %s, 'sent', %s, NOW())
-                    """
-                    execute_query(insert_query, (vendor['email'], vendor['company_name'], reference_number))
-                
-                # Send email
-                try:
+                # Vendor record and its NDA email commit as one unit
+                with db_transaction():
+                    check_query = "SELECT id FROM vendors WHERE email = %s FOR UPDATE"
+                    existing_vendor = execute_query(check_query, (vendor['email'],), fetch_one=True)
+                    
+                    if existing_vendor:
+                        update_query = """
+                        UPDATE vendors SET company_name = %s, reference_number = %s, nda_status = 'sent', updated_at = NOW()
+                        WHERE email = %s
+                        """
+                        with counted_change('vendors', existing_vendor['id']):
+                            execute_query(update_query, (vendor['company_name'], reference_number, vendor['email']))
+                    else:
+                        insert_query = """
+                        INSERT INTO vendors (email, company_name, nda_status, reference_number, created_at)
+                        VALUES (%s, %s, 'sent', %s, NOW())
+                        """
+                        with counted_change('vendors') as change:
+                            execute_query(insert_query, (vendor['email'], vendor['company_name'], reference_number))
+                            change.created()
+                    
                     msg = MIMEMultipart()
                     msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
                     msg['To'] = vendor['email']
@@ -4543,25 +6665,20 @@ YellowStone Xperiences Pvt Ltd
                     
                     msg.attach(MIMEText(body, 'plain'))
                     
-                    text = msg.as_string()
-                    print(f"  Sending email to {vendor['email']}...")
-                    server.sendmail(smtp['smtp_username'], vendor['email'], text)
-                    print(f"  ✅ Email sent to {vendor['email']}")
-                    
-                except Exception as email_error:
-                    print(f"  ❌ Email failed for {vendor['email']}: {email_error}")
+                    enqueue_email(msg, vendor['email'], 'nda_request')
+                queued += 1
+                print(f"  ✅ NDA email queued for {vendor['email']}")
                     
             except Exception as vendor_error:
                 print(f"  ❌ Vendor processing failed for {vendor.get('email', 'unknown')}: {vendor_error}")
         
-        # Close SMTP connection
-        server.quit()
-        print(f"✅ Bulk NDA sending completed for {len(vendors)} vendors")
+        print(f"✅ Bulk NDA queued {queued} of {len(vendors)} emails")
         
     except Exception as e:
-        print(f"❌ Bulk NDA worker failed: {e}")
+        print(f"❌ Bulk NDA failed: {e}")
         import traceback
         traceback.print_exc()
+    return queued
 
 @app.route('/api/admin/notifications', methods=['GET'])
 def get_admin_notifications():
@@ -4706,37 +6823,6 @@ def google_form_webhook():
         print(f"âŒ Google Form webhook error: {e}")
         return jsonify({'success': False, 'message': 'Failed to process form submission'}), 500
 
-def get_smtp_settings():
-    """Fetch current SMTP settings from database"""
-    try:
-        query = """
-        SELECT setting_key, setting_value
-        FROM system_settings
-        WHERE setting_category = 'email' AND setting_key IN ('smtp_server', 'smtp_port', 'smtp_username', 'smtp_password', 'from_name')
-        """
-        settings = execute_query(query)
-        smtp_config = {}
-        for setting in settings:
-            smtp_config[setting['setting_key']] = setting['setting_value'].strip() if setting['setting_value'] else setting['setting_value']
-        
-        # Return with defaults if settings not found
-        return {
-            'smtp_server': smtp_config.get('smtp_server', SMTP_SERVER),
-            'smtp_port': int(smtp_config.get('smtp_port', SMTP_PORT)),
-            'smtp_username': smtp_config.get('smtp_username', SMTP_USERNAME),
-            'smtp_password': smtp_config.get('smtp_password', SMTP_PASSWORD),
-            'from_name': smtp_config.get('from_name', 'YellowStone XPs')
-        }
-    except Exception as e:
-        print(f"Error fetching SMTP settings: {e}")
-        return {
-            'smtp_server': SMTP_SERVER,
-            'smtp_port': SMTP_PORT,
-            'smtp_username': SMTP_USERNAME,
-            'smtp_password': SMTP_PASSWORD,
-            'from_name': 'YellowStone XPs'
-        }
-
 def add_anti_spam_headers(msg, smtp_config):
     """Add anti-spam headers to email message to prevent emails from going to spam"""
     try:
@@ -4784,7 +6870,8 @@ def send_nda():
             UPDATE vendors SET company_name = %s, reference_number = %s, updated_at = %s
             WHERE email = %s
             """
-            result = execute_query(query, (company_name, reference_number, datetime.now(), email))
+            with counted_change('vendors', existing_vendor['id']):
+                result = execute_query(query, (company_name, reference_number, datetime.now(), email))
             print(f"âœ… Vendor update query executed successfully")
         else:
             print(f"Creating new vendor")
@@ -4792,7 +6879,9 @@ def send_nda():
             INSERT INTO vendors (email, company_name, nda_status, reference_number, created_at)
             VALUES (%s, %s, %s, %s, %s)
             """
-            result = execute_query(query, (email, company_name, 'sent', reference_number, datetime.now()))
+            with counted_change('vendors') as change:
+                result = execute_query(query, (email, company_name, 'sent', reference_number, datetime.now()))
+                change.created()
             print(f"âœ… Vendor insert query executed successfully")
         
         print(f"âœ… Vendor record saved successfully")
@@ -4845,33 +6934,15 @@ Address: Plot # 2, ITC, Fourth Floor, Sector 67, Mohali -160062, Punjab, India
             
             msg.attach(MIMEText(body, 'plain'))
             
-            print(f"Attempting to send email to {email}")
-            print(f"SMTP Config: Server={smtp['smtp_server']}, Port={smtp['smtp_port']}, From={smtp['smtp_username']}")
-            
-            # Use port 587 or 465 based on configuration
-            if smtp['smtp_port'] == 465:
-                print("Using SSL connection for port 465...")
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                print(f"Using STARTTLS for port {smtp['smtp_port']}...")
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            
-            print("Logging in...")
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            print("Sending email...")
+            enqueue_email(msg, email, 'nda_request')
             
-            text = msg.as_string()
-            server.sendmail(smtp['smtp_username'], email, text)
-            server.quit()
-            
-            print(f"âœ… NDA email sent successfully to {email} with reference {reference_number}")
+            print(f"âœ… NDA email queued for {email} with reference {reference_number}")
             
         except Exception as email_error:
-            print(f"âŒ Email sending failed: {email_error}")
-            return jsonify({'success': True, 'message': 'NDA recorded but email delivery failed', 'reference_number': reference_number, 'email_error': str(email_error)})
+            print(f"âŒ Email queueing failed: {email_error}")
+            return jsonify({'success': True, 'message': 'NDA recorded but the email could not be queued', 'reference_number': reference_number, 'email_error': str(email_error)})
         
-        return jsonify({'success': True, 'message': 'NDA sent successfully', 'reference_number': reference_number})
+        return jsonify({'success': True, 'message': 'NDA recorded and email queued', 'reference_number': reference_number})
     except Exception as e:
         print(f"âŒ Send NDA error: {e}")
         return jsonify({'success': False, 'error': f'Failed to send NDA: {str(e)}'}), 500
@@ -4973,7 +7044,7 @@ def handle_leave_room(data):
     emit('left_room', {'room': room})
 
 def send_vendor_credentials_email(vendor_email, vendor_password, company_name):
-    """Send vendor login credentials via email"""
+    """Queue the vendor login credentials email; returns True once it is queued"""
     try:
         smtp = get_smtp_settings()
         msg = MIMEMultipart()
@@ -5014,26 +7085,19 @@ Address: Plot # 2, ITC, Fourth Floor, Sector 67, Mohali -160062, Punjab, India
         
         msg.attach(MIMEText(body, 'plain'))
         
-        if smtp['smtp_port'] == 465:
-            server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-        else:
-            server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            server.starttls()
-        
-        server.login(smtp['smtp_username'], smtp['smtp_password'])
-        text = msg.as_string()
-        server.sendmail(smtp['smtp_username'], vendor_email, text)
-        server.quit()
+        enqueue_email(msg, vendor_email, 'vendor_credentials')
         
-        print(f"âœ… Credentials email sent to {vendor_email}")
+        print(f"âœ… Credentials email queued for {vendor_email}")
         return True
         
     except Exception as e:
-        print(f"âŒ Failed to send credentials email: {e}")
+        print(f"âŒ Failed to queue credentials email: {e}")
         return False
 
 def broadcast_database_change(table_name, action, data=None, room='admin'):
     """Broadcast database changes to connected clients"""
+    # Every reported write makes the cached dashboard/organization counts stale
+    stats_cache.clear()
     try:
         message = {
             'table': table_name,
@@ -5176,19 +7240,6 @@ def get_ticket_updates():
         if not ticket_id:
             return jsonify([])
 
-        execute_query("""
-            CREATE TABLE IF NOT EXISTS ticket_updates (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                ticket_id INT NOT NULL,
-                employee_id INT NULL,
-                status VARCHAR(50) NULL,
-                update_message TEXT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
-                FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-            )
-        """)
-
         query = """
             SELECT tu.id, tu.status, tu.update_message, tu.created_at,
                    u.name AS employee_name
@@ -5223,20 +7274,6 @@ def get_ticket_updates():
 def get_ticket_updates_for_ticket(ticket_id):
     """Get updates log for a specific ticket"""
     try:
-        # Ensure table exists, then fetch updates
-        execute_query("""
-            CREATE TABLE IF NOT EXISTS ticket_updates (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                ticket_id INT NOT NULL,
-                employee_id INT NULL,
-                status VARCHAR(50) NULL,
-                update_message TEXT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
-                FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-            )
-        """)
-
         query = """
             SELECT tu.id, tu.status, tu.update_message, tu.created_at,
                    u.name AS employee_name
@@ -5352,17 +7389,20 @@ def fix_employee_data():
         if not employee_id:
             return jsonify({'error': 'Employee ID required'}), 400
         
-        # Update existing tickets to be assigned to this employee
-        tickets_query = "UPDATE tickets SET assigned_to_id = %s WHERE assigned_to_id = 17"
-        execute_query(tickets_query, (employee_id,))
-        
-        # Update existing projects to be assigned to this employee
-        projects_query = "UPDATE projects SET assigned_to_id = %s WHERE assigned_to_id = 17"
-        execute_query(projects_query, (employee_id,))
-        
-        # Update existing tasks to be assigned to this employee
-        tasks_query = "UPDATE tasks SET assigned_to_id = %s WHERE assigned_to_id = 17"
-        execute_query(tasks_query, (employee_id,))
+        # Only assigned_to_id moves, which no entity counter buckets on, so these multi-row
+        # updates need no counted_change; they still commit together
+        with db_transaction():
+            # Update existing tickets to be assigned to this employee
+            tickets_query = "UPDATE tickets SET assigned_to_id = %s WHERE assigned_to_id = 17"
+            execute_query(tickets_query, (employee_id,))
+            
+            # Update existing projects to be assigned to this employee
+            projects_query = "UPDATE projects SET assigned_to_id = %s WHERE assigned_to_id = 17"
+            execute_query(projects_query, (employee_id,))
+            
+            # Update existing tasks to be assigned to this employee
+            tasks_query = "UPDATE tasks SET assigned_to_id = %s WHERE assigned_to_id = 17"
+            execute_query(tasks_query, (employee_id,))
         
         return jsonify({
             'success': True,
@@ -5410,11 +7450,6 @@ def create_employee_ticket():
             return jsonify({'success': False, 'error': 'Employee not found'}), 404
         
         # Insert ticket into database
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        
-        cursor = connection.cursor()
         ticket_query = """
         INSERT INTO tickets (title, description, priority, status, category, assigned_to, created_by)
         VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -5423,20 +7458,17 @@ def create_employee_ticket():
         # Get employee name for created_by field
         employee_name = employee['name']
         
-        cursor.execute(ticket_query, (
-            title,
-            description,
-            priority,
-            'open',
-            category,
-            category,  # assigned_to will temporarily contain the category
-            employee_name  # created_by will contain the employee's name
-        ))
-        
-        ticket_id = cursor.lastrowid
-        connection.commit()
-        cursor.close()
-        connection.close()
+        with counted_change('tickets') as change:
+            execute_query(ticket_query, (
+                title,
+                description,
+                priority,
+                'open',
+                category,
+                category,  # assigned_to will temporarily contain the category
+                employee_name  # created_by will contain the employee's name
+            ))
+            ticket_id = change.created()
         
         if ticket_id:
             print(f"Ticket created successfully: ID {ticket_id} by employee {employee_id}")
@@ -5489,7 +7521,8 @@ def update_employee_project(project_id):
         WHERE id = %s
         """
         
-        execute_query(update_query, (db_status, project_id))
+        with counted_change('projects', project_id):
+            execute_query(update_query, (db_status, project_id))
         
         # Broadcast the change
         broadcast_database_change('projects', 'update', {
@@ -5525,23 +7558,6 @@ def update_employee_task(task_id):
         
         db_status = status_map.get(status, status)  # Use original if not in map
         
-        # Ensure task_updates table exists
-        try:
-            execute_query("""
-                CREATE TABLE IF NOT EXISTS task_updates (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    task_id INT NOT NULL,
-                    employee_id INT NULL,
-                    status VARCHAR(50) NULL,
-                    update_message TEXT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
-                    FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-                )
-            """)
-        except Exception:
-            pass
-
         # Update task status and comments
         update_query = """
         UPDATE tasks 
@@ -5549,7 +7565,8 @@ def update_employee_task(task_id):
         WHERE id = %s
         """
         
-        execute_query(update_query, (db_status, task_id))
+        with counted_change('tasks', task_id):
+            execute_query(update_query, (db_status, task_id))
         
         # Insert progress log
         try:
@@ -5599,24 +7616,6 @@ def update_employee_ticket(ticket_id):
         db_status = status_map.get(status, status)  # Use original if not in map
         print(f"📝 Mapped status '{status}' to '{db_status}'")
         
-        # Ensure ticket_updates table exists for logging
-        try:
-            execute_query("""
-                CREATE TABLE IF NOT EXISTS ticket_updates (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    ticket_id INT NOT NULL,
-                    employee_id INT NULL,
-                    status VARCHAR(50) NULL,
-                    update_message TEXT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
-                    FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-                )
-            """)
-        except Exception as _tbl_err:
-            # If table creation fails, proceed without blocking the status update
-            pass
-
         # Update ticket status and comments
         update_query = """
         UPDATE tickets 
@@ -5624,7 +7623,8 @@ def update_employee_ticket(ticket_id):
         WHERE id = %s
         """
         
-        execute_query(update_query, (db_status, ticket_id))
+        with counted_change('tickets', ticket_id):
+            execute_query(update_query, (db_status, ticket_id))
         
         # Insert progress log
         try:
@@ -5659,19 +7659,6 @@ def update_employee_ticket(ticket_id):
 def get_task_updates_for_task(task_id):
     """Get updates log for a specific task"""
     try:
-        execute_query("""
-            CREATE TABLE IF NOT EXISTS task_updates (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                task_id INT NOT NULL,
-                employee_id INT NULL,
-                status VARCHAR(50) NULL,
-                update_message TEXT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
-                FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-            )
-        """)
-
         query = """
             SELECT tu.id, tu.status, tu.update_message, tu.created_at,
                    u.name AS employee_name
@@ -5842,14 +7829,20 @@ def upload_lead_report():
         
         # print(f"All required columns present")
         
-        # Process each row
+        # Build all rows first, then write them with a few multi-row INSERTs
         processed_count = 0
         errors = []
+        lead_rows = []
+        lead_columns = [
+            'company_name', 'project_name', 'key_account_manager', 'project_coordinator',
+            'client_end_manager', 'client_email', 'location', 'start_date', 'expected_project_start_date',
+            'last_interacted_date', 'lead_status', 'lead_source', 'remarks', 'uploaded_by', 'uploaded_at'
+        ]
         
         for index, row in df.iterrows():
             try:
                 # Prepare data for insertion
-                lead_data = {
+                lead_rows.append({
                     'company_name': str(row['Company Name']).strip() if pd.notna(row['Company Name']) else '',
                     'project_name': str(row['Project Name']).strip() if pd.notna(row['Project Name']) else '',
                     'key_account_manager': str(row['Key Account Manager']).strip() if pd.notna(row['Key Account Manager']) else '',
@@ -5865,28 +7858,17 @@ def upload_lead_report():
                     'remarks': str(row['Remarks']).strip() if pd.notna(row['Remarks']) else '',
                     'uploaded_by': user_id,
                     'uploaded_at': batch_uploaded_at
-                }
-                
-                # Insert into database
-                insert_query = """
-                INSERT INTO lead_generation_reports 
-                (company_name, project_name, key_account_manager, project_coordinator, 
-                 client_end_manager, client_email, location, start_date, expected_project_start_date,
-                 last_interacted_date, lead_status, lead_source, remarks, uploaded_by, uploaded_at)
-                VALUES (%(company_name)s, %(project_name)s, %(key_account_manager)s, %(project_coordinator)s,
-                        %(client_end_manager)s, %(client_email)s, %(location)s, %(start_date)s, %(expected_project_start_date)s,
-                        %(last_interacted_date)s, %(lead_status)s, %(lead_source)s, %(remarks)s, %(uploaded_by)s, %(uploaded_at)s)
-                """
-                
-                print(f"Inserting row {index + 1}: {lead_data['company_name']}")
-                execute_query(insert_query, lead_data)
-                processed_count += 1
-                print(f"Row {index + 1} inserted successfully")
-                
+                })
             except Exception as e:
-                print(f"Error inserting row {index + 1}: {str(e)}")
+                print(f"Error preparing row {index + 1}: {str(e)}")
                 errors.append(f"Row {index + 1}: {str(e)}")
         
+        inserted = execute_many('lead_generation_reports', lead_columns, lead_rows)
+        if inserted is None:
+            errors.append(f"Failed to insert {len(lead_rows)} rows; the upload was rolled back")
+        else:
+            processed_count = inserted
+        
         print(f"Upload completed. Processed: {processed_count}/{len(df)} rows")
         
         # Count total leads from this file by the batch timestamp to show in reports list
@@ -5925,59 +7907,83 @@ def get_uploaded_reports():
         # Get query parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        # Same bounds as ?limit=; per_page=0 would leave a has_more page with no last row
+        per_page = max(1, min(per_page, LIST_MAX_LIMIT))
         search = request.args.get('search', '', type=str)
         
         # print(f"Loading uploaded reports for user {current_user_id}, search: '{search}', page: {page}")
         
         # Build query to get uploaded reports with lead counts
-        # Query groups by uploaded_at and filename to create report entries
-        base_query = """
-        SELECT 
-            DATE(lr.uploaded_at) as uploaded_date,
-            lr.uploaded_at,
-            u.name as uploaded_by_name,
-            COUNT(*) as total_leads,
-            MIN(lr.uploaded_at) as min_uploaded_at,
-            COUNT(*) OVER() as total_count
-        FROM lead_generation_reports lr
+        # Query groups by uploaded_at and uploader to create report entries
+        from_sql = """
+        lead_generation_reports lr
         LEFT JOIN users u ON lr.uploaded_by = u.id
-        WHERE 1=1
         """
-        
-        params = []
+        conditions, params = [], []
         
         # Add search filter
         if search:
-            search_filter = """
-            AND (ur.report_name LIKE %s OR ur.original_filename LIKE %s OR ur.description LIKE %s)
-            """
-            base_query += search_filter
+            conditions.append("""
+            (ur.report_name LIKE %s OR ur.original_filename LIKE %s OR ur.description LIKE %s)
+            """)
             search_param = f"%{search}%"
             params.extend([search_param, search_param, search_param])
         
         # Filter to current employee if provided
         if current_user_id:
-            base_query += " AND lr.uploaded_by = %s"
+            conditions.append("lr.uploaded_by = %s")
             params.append(current_user_id)
-
-        # Add grouping and ordering
-        base_query += """
-        GROUP BY lr.uploaded_at, u.name
-        ORDER BY lr.uploaded_at DESC LIMIT %s OFFSET %s
+        # An upload batch is (uploaded_at, uploaded_by); grouping, ordering, cursor and count share that key
+        batch_key = [timestamp_sort_key('lr.uploaded_at', 'uploaded_at')[0], 'COALESCE(lr.uploaded_by, 0)']
+        # Total number of upload batches, counted separately so pages never pay for it
+        count_query = f"SELECT COUNT(DISTINCT {', '.join(batch_key)}) as total FROM {from_sql}{where_sql(conditions)}"
+        count_params = list(params)
+
+        # ?cursor= continues after the last upload batch seen (keyset); ?page= is kept for old callers
+        cursor = request.args.get('cursor')
+        page_conditions, page_params = list(conditions), list(params)
+        if cursor:
+            cursor_values = decode_page_cursor(cursor)
+            if len(cursor_values) != len(batch_key):
+                raise ValueError('cursor does not match this listing')
+            predicate, cursor_params = _keyset_predicate(batch_key, cursor_values, descending=True)
+            page_conditions.append(predicate)
+            page_params.extend(cursor_params)
+        group_query = f"""
+        SELECT 
+            DATE(lr.uploaded_at) as uploaded_date,
+            lr.uploaded_at,
+            lr.uploaded_by,
+            u.name as uploaded_by_name,
+            COUNT(*) as total_leads,
+            MIN(lr.uploaded_at) as min_uploaded_at,
+            {batch_key[0]} as uploaded_at_key,
+            {batch_key[1]} as uploaded_by_key
+        FROM {from_sql}{where_sql(page_conditions)}
+        GROUP BY lr.uploaded_at, lr.uploaded_by, u.name
+        ORDER BY {' DESC, '.join(batch_key)} DESC LIMIT %s
         """
-        offset = (page - 1) * per_page
-        params.extend([per_page, offset])
-        
-        # print(f"Query: {base_query}")
-        # print(f"Params: {params}")
+        if cursor:
+            page_params.append(per_page + 1)
+        else:
+            group_query += " OFFSET %s"
+            page_params.extend([per_page + 1, (page - 1) * per_page])
         
         # Execute query
         try:
-            reports = execute_query(base_query, params, fetch_all=True)
-            # print(f"Query executed successfully, got {len(reports) if reports else 0} results")
-            
-            # Extract total count from first row if available
-            total = reports[0]['total_count'] if reports and len(reports) > 0 else 0
+            reports = execute_query(group_query, page_params, fetch_all=True)
+            has_more = len(reports) > per_page
+            reports = reports[:per_page]
+            next_cursor = (encode_page_cursor([reports[-1]['uploaded_at_key'], reports[-1]['uploaded_by_key']])
+                           if has_more else None)
+            # The keys only feed the cursor; uploaded_at/uploaded_by are reported as stored
+            for report in reports:
+                report.pop('uploaded_at_key', None)
+                report.pop('uploaded_by_key', None)
+            total = None
+            if request.args.get('include_total', '1').lower() in ('1', 'true', 'yes'):
+                total_row = execute_query(count_query, count_params, fetch_one=True)
+                total = total_row['total'] if total_row else 0
             
         except Exception as e:
             # print(f"Error executing query: {e}")
@@ -5990,13 +7996,17 @@ def get_uploaded_reports():
                 'page': page,
                 'per_page': per_page,
                 'total': total,
-                'pages': (total + per_page - 1) // per_page
+                'pages': (total + per_page - 1) // per_page if total is not None else None,
+                'has_more': has_more,
+                'next_cursor': next_cursor
             }
         }
         
         # print(f"Returning response with {len(reports or [])} reports")
         return jsonify(response_data)
         
+    except ValueError as e:
+        return jsonify({'error': f'Invalid cursor: {e}'}), 400
     except Exception as e:
         # print(f"Get uploaded reports error: {e}")
         return jsonify({'error': 'Failed to fetch uploaded reports'}), 500
@@ -6088,59 +8098,75 @@ def get_lead_reports():
         # Get query parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        # Same bounds as ?limit=; per_page=0 would leave a has_more page with no last row
+        per_page = max(1, min(per_page, LIST_MAX_LIMIT))
         search = request.args.get('search', '', type=str)
         
         # print(f"Loading reports for user {current_user_id}, search: '{search}', page: {page}")
         
         # Build query - show all reports if current user has no reports, otherwise show user's reports
-        base_query = """
-        SELECT lr.*, u.name as uploaded_by_name,
-               COUNT(*) OVER() as total_count
-        FROM lead_generation_reports lr
+        from_sql = """
+        lead_generation_reports lr
         LEFT JOIN users u ON lr.uploaded_by = u.id
-        WHERE 1=1
         """
-        
-        params = []
+        conditions, params = [], []
         
         # Add search filter
         if search:
-            search_filter = """
-            AND (lr.company_name LIKE %s OR lr.project_name LIKE %s OR 
-                 lr.key_account_manager LIKE %s OR lr.client_email LIKE %s)
-            """
-            base_query += search_filter
+            conditions.append("""
+            (lr.company_name LIKE %s OR lr.project_name LIKE %s OR 
+             lr.key_account_manager LIKE %s OR lr.client_email LIKE %s)
+            """)
             search_param = f"%{search}%"
             params.extend([search_param, search_param, search_param, search_param])
+        if request.args.get('status'):
+            conditions.append("lr.lead_status = %s")
+            params.append(request.args['status'])
+        add_date_range_filter('lr.uploaded_at', conditions, params)
+        order = [timestamp_sort_key('lr.uploaded_at', 'uploaded_at'), ('lr.id', 'id')]
+        include_total = request.args.get('include_total', '1').lower() in ('1', 'true', 'yes')
         
-        # Add ordering and pagination
-        base_query += " ORDER BY lr.uploaded_at DESC LIMIT %s OFFSET %s"
-        offset = (page - 1) * per_page
-        params.extend([per_page, offset])
-        
-        # print(f"Single query: {base_query}")
-        # print(f"Params: {params}")
-        
-        # Execute single query
         try:
-            reports = execute_query(base_query, params, fetch_all=True)
-            # print(f"Query executed successfully, got {len(reports) if reports else 0} results")
-            
-            # Extract total count from first row if available
-            total = reports[0]['total_count'] if reports and len(reports) > 0 else 0
+            cursor = request.args.get('cursor')
+            if cursor:
+                # Keyset page: constant cost however deep the caller has scrolled
+                result = keyset_page('lr.*, u.name as uploaded_by_name', from_sql, conditions, params, order,
+                                     per_page, decode_page_cursor(cursor), include_total)
+            else:
+                # Legacy ?page= (OFFSET) for existing callers; the total is a separate optional COUNT
+                reports = execute_query(
+                    f"SELECT lr.*, u.name as uploaded_by_name FROM {from_sql}{where_sql(conditions)} "
+                    f"ORDER BY {keyset_order_sql(order)} LIMIT %s OFFSET %s",
+                    (*params, per_page + 1, (page - 1) * per_page), fetch_all=True
+                )
+                result = {
+                    'items': reports[:per_page],
+                    'has_more': len(reports) > per_page,
+                    'next_cursor': keyset_cursor(reports[per_page - 1], order)
+                                   if len(reports) > per_page else None
+                }
+                if include_total:
+                    total_row = execute_query(f"SELECT COUNT(*) as total FROM {from_sql}{where_sql(conditions)}",
+                                              params, fetch_one=True)
+                    result['total'] = total_row['total'] if total_row else 0
+            total = result.get('total')
             
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
         except Exception as e:
             # print(f"Error executing query: {e}")
             return jsonify({'error': f'Database error: {str(e)}'}), 500
         
         response_data = {
             'success': True,
-            'reports': reports or [],
+            'reports': result['items'],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
                 'total': total,
-                'pages': (total + per_page - 1) // per_page
+                'pages': (total + per_page - 1) // per_page if total is not None else None,
+                'has_more': result['has_more'],
+                'next_cursor': result['next_cursor']
             }
         }
         
@@ -6376,6 +8402,15 @@ def get_lead_progress_updates(lead_id):
 
 # ==================== LEAD MANAGEMENT ENDPOINTS ====================
 
+# Lead listing columns, passed through to the frontend unchanged
+LEAD_JSON_PROJECTION = RowProjection({column: column for column in (
+    'id', 'company_name', 'project_name', 'key_account_manager', 'project_coordinator',
+    'client_end_manager', 'client_email', 'location', 'start_date', 'expected_project_start_date',
+    'last_interacted_date', 'lead_status', 'lead_source', 'remarks', 'uploaded_by', 'uploaded_at',
+    'created_at', 'updated_at', 'assigned_to', 'assignment_status', 'assignment_due_date',
+    'assignment_notes', 'assigned_employee_name', 'assigned_employee_designation'
+)})
+
 @app.route('/api/admin/leads', methods=['GET'])
 def get_admin_leads():
     """Get all leads for admin dashboard"""
@@ -6385,9 +8420,8 @@ def get_admin_leads():
         if not admin_id:
             admin_id = 1  # Use default admin ID
         
-        # Get all leads with LATEST assignment information (by assigned_at) 
-        query = """
-        SELECT
+        # All leads with their current assignment (pointer maintained by record_lead_assignment)
+        select_sql = """
             lgr.*,
             la.id as assignment_id,
             la.employee_id as assigned_to,
@@ -6397,62 +8431,40 @@ def get_admin_leads():
             u.name as assigned_employee_name,
             u.designation as assigned_employee_designation,
             assigner.name as assigned_by_name
-        FROM lead_generation_reports lgr
-        LEFT JOIN (
-            SELECT la1.*
-            FROM lead_assignments la1
-            INNER JOIN (
-                SELECT lead_id, MAX(assigned_at) as latest_assignment_time
-                FROM lead_assignments
-                GROUP BY lead_id
-            ) la2 ON la1.lead_id = la2.lead_id AND la1.assigned_at = la2.latest_assignment_time
-        ) la ON lgr.id = la.lead_id
+        """
+        from_sql = """
+        lead_generation_reports lgr
+        LEFT JOIN lead_assignments la ON la.id = lgr.current_assignment_id
         LEFT JOIN users u ON la.employee_id = u.id
         LEFT JOIN users assigner ON la.assigned_by = assigner.id
-        ORDER BY lgr.created_at DESC
         """
+        conditions, params = [], []
+        if request.args.get('status'):
+            conditions.append("lgr.lead_status = %s")
+            params.append(request.args['status'])
+        if request.args.get('assignee'):
+            conditions.append("la.employee_id = %s")
+            params.append(request.args['assignee'])
+        add_date_range_filter('lgr.created_at', conditions, params)
+        order = [timestamp_sort_key('lgr.created_at', 'created_at'), ('lgr.id', 'id')]
+
+        page = page_request_args()
+        if page:
+            return jsonify(keyset_page(select_sql, from_sql, conditions, params, order, *page,
+                                       transform=LEAD_JSON_PROJECTION, compact=True))
+
+        leads = stream_query(
+            f"SELECT {select_sql} FROM {from_sql}{where_sql(conditions)} ORDER BY lgr.created_at DESC, lgr.id DESC",
+            params, compact=True
+        )
         
-        leads = execute_query(query)
-        
-        # Debug: Check what assignments exist for lead 199
-        debug_query = "SELECT * FROM lead_assignments WHERE lead_id = 199 ORDER BY id DESC"
-        debug_assignments = execute_query(debug_query)
-        # print(f"ðŸ” Debug: All assignments for lead 199: {debug_assignments}")
-        
-        # print(f"ðŸ” Debug: Raw leads from DB: {leads}")
-        
-        # Convert to list format for frontend (query already handles latest assignment)
-        result_leads = []
-        for lead in leads:
-            result_leads.append({
-                'id': lead['id'],
-                'company_name': lead['company_name'],
-                'project_name': lead['project_name'],
-                'key_account_manager': lead['key_account_manager'],
-                'project_coordinator': lead['project_coordinator'],
-                'client_end_manager': lead['client_end_manager'],
-                'client_email': lead['client_email'],
-                'location': lead['location'],
-                'start_date': lead['start_date'],
-                'expected_project_start_date': lead['expected_project_start_date'],
-                'last_interacted_date': lead['last_interacted_date'],
-                'lead_status': lead['lead_status'],
-                'lead_source': lead['lead_source'],
-                'remarks': lead['remarks'],
-                'uploaded_by': lead['uploaded_by'],
-                'uploaded_at': lead['uploaded_at'],
-                'created_at': lead['created_at'],
-                'updated_at': lead['updated_at'],
-                'assigned_to': lead['assigned_to'],
-                'assignment_status': lead['assignment_status'],
-                'assignment_due_date': lead['assignment_due_date'],
-                'assignment_notes': lead['assignment_notes'],
-                'assigned_employee_name': lead['assigned_employee_name'],
-                'assigned_employee_designation': lead['assigned_employee_designation']
-            })
-        
-        return jsonify(result_leads)
+        # Convert to frontend format row by row while streaming
+        return stream_json_array(leads, transform=LEAD_JSON_PROJECTION)
         
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         print(f"âŒ Error getting leads: {e}")
         return jsonify({'error': 'Failed to get leads'}), 500
@@ -6515,6 +8527,33 @@ def create_lead():
         print(f"âŒ Error creating lead: {e}")
         return jsonify({'error': 'Failed to create lead'}), 500
 
+def record_lead_assignment(lead_id, employee_id, assigned_by_id, due_date, notes):
+    """Upsert the assignment and point the lead at it in one transaction; returns the assignment id"""
+    with db_transaction():
+        # Lock the lead so concurrent assigns cannot leave the pointer on the older assignment
+        execute_query("SELECT id FROM lead_generation_reports WHERE id = %s FOR UPDATE", (lead_id,), fetch_one=True)
+        # id = LAST_INSERT_ID(id) makes LAST_INSERT_ID() return the existing row on re-assignment
+        execute_query("""
+        INSERT INTO lead_assignments (lead_id, employee_id, assigned_by, due_date, notes)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        id = LAST_INSERT_ID(id),
+        assigned_by = VALUES(assigned_by),
+        due_date = VALUES(due_date),
+        notes = VALUES(notes),
+        status = 'assigned',
+        assigned_at = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP
+        """, (lead_id, employee_id, assigned_by_id, due_date, notes))
+        assignment_id = execute_query("SELECT LAST_INSERT_ID() AS id", fetch_one=True)['id']
+        # Master lead status reflects the assignment
+        execute_query("""
+        UPDATE lead_generation_reports
+        SET current_assignment_id = %s, lead_status = 'assigned', updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """, (assignment_id, lead_id))
+    return assignment_id
+
 @app.route('/api/admin/leads/<int:lead_id>/assign', methods=['POST'])
 def assign_lead(lead_id):
         # print(f"🔍 Debug: assign_lead function called for lead_id: {lead_id}")
@@ -6571,32 +8610,13 @@ def assign_lead(lead_id):
             except Exception:
                 due_date = None
         
-        # Insert assignment
-        assignment_query = """
-        INSERT INTO lead_assignments (lead_id, employee_id, assigned_by, due_date, notes)
-        VALUES (%s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        assigned_by = VALUES(assigned_by),
-        due_date = VALUES(due_date),
-        notes = VALUES(notes),
-        status = 'assigned',
-        updated_at = CURRENT_TIMESTAMP
-        """
-        
-        execute_query(assignment_query, (lead_id, actual_employee_id, assigned_by_id, due_date, notes))
-
-        # Ensure master lead status reflects assignment
-        try:
-            execute_query(
-                "UPDATE lead_generation_reports SET lead_status = 'assigned', updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-                (lead_id,)
-            )
-        except Exception as se:
-            print(f"Warning: failed to sync lead status on assignment: {se}")
+        # Insert assignment, move the lead's current-assignment pointer and status together
+        assignment_id = record_lead_assignment(lead_id, actual_employee_id, assigned_by_id, due_date, notes)
 
         # Broadcast change so admin/employee UIs refresh
         try:
             broadcast_database_change('lead_assignments', 'insert', {
+                'assignment_id': assignment_id,
                 'lead_id': lead_id,
                 'employee_id': actual_employee_id,
                 'assigned_by': assigned_by_id,
@@ -6670,28 +8690,11 @@ def assign_lead_open(lead_id):
             except Exception:
                 due_date = None
 
-        assignment_query = """
-        INSERT INTO lead_assignments (lead_id, employee_id, assigned_by, due_date, notes)
-        VALUES (%s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        assigned_by = VALUES(assigned_by),
-        due_date = VALUES(due_date),
-        notes = VALUES(notes),
-        status = 'assigned',
-        updated_at = CURRENT_TIMESTAMP
-        """
-        execute_query(assignment_query, (lead_id, actual_employee_id, assigned_by_id, due_date, notes))
-
-        try:
-            execute_query(
-                "UPDATE lead_generation_reports SET lead_status = 'assigned', updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-                (lead_id,)
-            )
-        except Exception as se:
-            print(f"Warning: failed to sync lead status on assignment (open): {se}")
-
+        assignment_id = record_lead_assignment(lead_id, actual_employee_id, assigned_by_id, due_date, notes)
+
         try:
             broadcast_database_change('lead_assignments', 'insert', {
+                'assignment_id': assignment_id,
                 'lead_id': lead_id,
                 'employee_id': actual_employee_id,
                 'assigned_by': assigned_by_id,
@@ -6764,9 +8767,8 @@ def get_admin_employees():
         if not admin_id:
             admin_id = 1  # Use default admin ID
         
-        # Get all employees with department info
-        query = """
-        SELECT 
+        # Employees with department info (filters: status, department, from/to on hire date)
+        select_sql = """
             u.id, u.employee_id, u.name, u.email, 
             COALESCE(u.designation, '') as position,
             COALESCE(u.department, '') as department,
@@ -6775,14 +8777,29 @@ def get_admin_employees():
             u.created_at as hireDate,
             COALESCE(SUBSTRING(u.name, 1, 1), '') as avatar,
             u.status
-        FROM users u
-        WHERE u.user_type = 'employee'
-        ORDER BY u.name
         """
+        conditions, params = ["u.user_type = 'employee'"], []
+        if request.args.get('status'):
+            conditions.append("u.status = %s")
+            params.append(request.args['status'])
+        if request.args.get('department'):
+            conditions.append("u.department = %s")
+            params.append(request.args['department'])
+        add_date_range_filter('u.created_at', conditions, params)
+
+        page = page_request_args()
+        if page:
+            return jsonify(keyset_page(select_sql, 'users u', conditions, params,
+                                       [('u.name', 'name'), ('u.id', 'id')], *page, descending=False))
         
-        employees = execute_query(query)
+        employees = execute_query(
+            f"SELECT {select_sql} FROM users u{where_sql(conditions)} ORDER BY u.name, u.id",
+            params, fetch_all=True
+        )
         return jsonify(employees)
         
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
     except Exception as e:
         print(f"âŒ Error getting employees: {e}")
         return jsonify({'error': 'Failed to get employees'}), 500
@@ -7034,6 +9051,7 @@ def schedule_email():
         """
         
         execute_query(query, (company_id, subject, email_body, scheduled_time, created_by_id, email_type))
+        scheduled_email_timer.notify([scheduled_time])
         
         return jsonify({'success': True, 'message': 'Email scheduled successfully'})
         
@@ -7042,6 +9060,40 @@ def schedule_email():
         return jsonify({'error': 'Failed to schedule email'}), 500
 
 
+@app.route('/api/admin/email-outbox', methods=['GET'])
+def get_email_outbox():
+    """Outbox status counts plus the most recent rows (filter: status)"""
+    try:
+        status = request.args.get('status')
+        limit = min(int(request.args.get('limit', 50)), 500)
+        counts = execute_query("SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status", fetch_all=True)
+        conditions, params = [], []
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        rows = execute_query(f"""
+            SELECT id, email_type, recipients, subject, status, attempts, max_attempts, next_attempt_at,
+                   claimed_by, last_error, scheduled_email_id, sent_at, created_at
+            FROM email_outbox
+            {where_sql(conditions)}
+            ORDER BY id DESC
+            LIMIT %s
+        """, params + [limit], fetch_all=True)
+        return jsonify({
+            'success': True,
+            'counts': {row['status']: row['count'] for row in counts},
+            'emails': rows,
+            'workers': email_outbox.snapshot(),
+            'leases': lease_heartbeat.snapshot(),
+            'scheduler': scheduled_email_timer.snapshot()
+        })
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    except Exception as e:
+        print(f"❌ Error getting email outbox: {e}")
+        return jsonify({'error': 'Failed to get email outbox'}), 500
+
+
 @app.route('/api/admin/scheduled-emails/<int:email_id>', methods=['DELETE'])
 def cancel_scheduled_email(email_id):
     """Cancel a scheduled email"""
@@ -7144,8 +9196,8 @@ def schedule_bulk_emails():
         # This ensures the database stores times in UTC
         initial_time = initial_time.replace(tzinfo=None)  # Remove timezone info for MySQL storage
         
-        scheduled_count = 0
         batch_number = 1
+        email_rows = []
         
         # Process companies in batches
         for i in range(0, len(companies), batch_size):
@@ -7173,16 +9225,21 @@ def schedule_bulk_emails():
                 subject = template['subject']
                 email_body = template['body']
                 
-                query = """
-                INSERT INTO scheduled_emails (company_id, subject, email_body, scheduled_time, created_by, email_type, attachment_path)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                
-                execute_query(query, (company['id'], subject, email_body, batch_scheduled_time, created_by_id, email_type, attachment_path))
-                scheduled_count += 1
+                email_rows.append((company['id'], subject, email_body, batch_scheduled_time, created_by_id, email_type, attachment_path))
             
             batch_number += 1
         
+        # Write every scheduled email with chunked multi-row INSERTs
+        scheduled_count = execute_many(
+            'scheduled_emails',
+            ['company_id', 'subject', 'email_body', 'scheduled_time', 'created_by', 'email_type', 'attachment_path'],
+            email_rows
+        )
+        if scheduled_count is None:
+            return jsonify({'error': 'Failed to schedule bulk emails'}), 500
+        # One deadline per batch is enough to wake the scheduler on time
+        scheduled_email_timer.notify(sorted({row[3] for row in email_rows}))
+        
         total_batches = (len(companies) + batch_size - 1) // batch_size
         total_duration = (total_batches - 1) * batch_interval if total_batches > 1 else 0
         
@@ -7203,7 +9260,7 @@ def schedule_bulk_emails():
 
 @app.route('/api/admin/scheduled-emails/<int:email_id>/send-now', methods=['POST'])
 def send_email_now(email_id):
-    """Send a scheduled email immediately"""
+    """Queue a scheduled email for delivery now instead of at its scheduled time"""
     try:
         # Relaxed auth: accept admin_id from session, query or JSON; default to 1 for dev
         admin_id = session.get('user_id') or request.args.get('admin_id')
@@ -7216,7 +9273,7 @@ def send_email_now(email_id):
         # Get the scheduled email details
         email_query = """
         SELECT se.id, se.company_id, se.subject, se.email_body, se.scheduled_time,
-               c.company_name, c.email, c.contact_person
+               se.email_type, se.attachment_path, c.company_name, c.email, c.contact_person
         FROM scheduled_emails se
         JOIN companies c ON se.company_id = c.id
         WHERE se.id = %s AND se.status = 'pending'
@@ -7227,82 +9284,16 @@ def send_email_now(email_id):
         if not email_data:
             return jsonify({'error': 'Email not found or already sent'}), 404
         
-        print(f"📧 Sending email to {email_data['company_name']} ({email_data['email']})")
+        outbox_id = queue_scheduled_email(email_data)
+        if outbox_id is None:
+            return jsonify({'success': True, 'message': 'Email is already queued for delivery'})
         
-        # Send actual email using SMTP
-        try:
-            # Fetch current SMTP settings
-            smtp = get_smtp_settings()
-            
-            msg = MIMEMultipart()
-            msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
-            msg['To'] = email_data['email']
-            msg['Subject'] = email_data['subject']
-            
-            # Add anti-spam headers
-            add_anti_spam_headers(msg, smtp)
-            
-            # Add email body
-            msg.attach(MIMEText(email_data['email_body'], 'plain'))
-            
-            # Connect to SMTP server and send email
-            print(f"SMTP Config: Server={smtp['smtp_server']}, Port={smtp['smtp_port']}, From={smtp['smtp_username']}")
-            
-            if smtp['smtp_port'] == 465:
-                print("Using SSL connection for port 465...")
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                print(f"Using STARTTLS for port {smtp['smtp_port']}...")
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            
-            # Enable verbose SMTP session logging
-            try:
-                server.set_debuglevel(1)
-            except Exception:
-                pass
-
-            print("Logging in...")
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            print("Sending email...")
-            text = msg.as_string()
-            # BCC sender to verify delivery
-            refused = server.sendmail(smtp['smtp_username'], [email_data['email'], smtp['smtp_username']], text)
-            print(f"SMTP sendmail refused map: {refused}")
-            server.quit()
-            
-            print(f"✅ Email sent successfully to {email_data['email']}")
-            
-            # Mark as sent in database
-            update_query = """
-            UPDATE scheduled_emails 
-            SET status = 'sent', sent_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """
-            
-            execute_query(update_query, (email_id,))
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Email sent successfully to {email_data["company_name"]} ({email_data["email"]})'
-            })
-            
-        except Exception as email_error:
-            print(f"❌ SMTP Error: {email_error}")
-            
-            # Mark as failed in database
-            update_query = """
-            UPDATE scheduled_emails 
-            SET status = 'failed', error_message = %s
-            WHERE id = %s
-            """
-            
-            execute_query(update_query, (str(email_error), email_id,))
-            
-            return jsonify({
-                'success': False, 
-                'message': f'Failed to send email: {str(email_error)}'
-            }), 500
+        print(f"📧 Queued email to {email_data['company_name']} ({email_data['email']})")
+        return jsonify({
+            'success': True, 
+            'message': f'Email queued for {email_data["company_name"]} ({email_data["email"]})',
+            'outbox_id': outbox_id
+        })
         
     except Exception as e:
         print(f"❌ Error sending email now: {e}")
@@ -7311,7 +9302,7 @@ def send_email_now(email_id):
 
 @app.route('/api/admin/scheduled-emails/send-all-pending', methods=['POST'])
 def send_all_pending_emails():
-    """Send all pending emails immediately"""
+    """Queue every pending scheduled email for delivery now"""
     try:
         # Relaxed auth: accept admin_id from session, query or JSON; default to 1 for dev
         admin_id = session.get('user_id') or request.args.get('admin_id')
@@ -7321,116 +9312,45 @@ def send_all_pending_emails():
         if not admin_id:
             admin_id = 1
         
-        # Get all pending emails
+        # Pending emails that are not in the outbox yet
         pending_query = """
-        SELECT se.id, se.company_id, se.subject, se.email_body,
-               c.company_name, c.email, c.contact_person
+        SELECT se.id, se.company_id, se.subject, se.email_body, se.scheduled_time,
+               se.email_type, se.attachment_path, c.company_name, c.email, c.contact_person
         FROM scheduled_emails se
         JOIN companies c ON se.company_id = c.id
-        WHERE se.status = 'pending'
+        LEFT JOIN email_outbox o ON o.scheduled_email_id = se.id
+        WHERE se.status = 'pending' AND o.id IS NULL
+        ORDER BY se.scheduled_time ASC
         """
         
-        pending_emails = execute_query(pending_query)
+        pending_emails = execute_query(pending_query, fetch_all=True)
         
         if not pending_emails:
             return jsonify({'success': True, 'message': 'No pending emails to send'})
         
-        print(f"📧 Sending {len(pending_emails)} pending emails...")
-        
-        sent_count = 0
-        failed_count = 0
+        queued_count = 0
         failed_emails = []
-        
-        # Connect to SMTP server once for all emails
-        try:
-            # Fetch current SMTP settings
-            smtp = get_smtp_settings()
-            
-            print(f"SMTP Config: Server={smtp['smtp_server']}, Port={smtp['smtp_port']}")
-            
-            if smtp['smtp_port'] == 465:
-                print("Using SSL connection for port 465...")
-                server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-            else:
-                print(f"Using STARTTLS for port {smtp['smtp_port']}...")
-                server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                server.starttls()
-            
-            # Enable verbose SMTP session logging
-            try:
-                server.set_debuglevel(1)
-            except Exception:
-                pass
-
-            print("Logging in...")
-            server.login(smtp['smtp_username'], smtp['smtp_password'])
-            print("Connected successfully")
-            
+        with db_session():
             for email_data in pending_emails:
                 try:
-                    msg = MIMEMultipart()
-                    msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
-                    msg['To'] = email_data['email']
-                    msg['Subject'] = email_data['subject']
-                    
-                    # Add anti-spam headers
-                    add_anti_spam_headers(msg, smtp)
-                    
-                    # Add email body
-                    msg.attach(MIMEText(email_data['email_body'], 'plain'))
-                    
-                    # Send email
-                    text = msg.as_string()
-                    refused = server.sendmail(smtp['smtp_username'], [email_data['email'], smtp['smtp_username']], text)
-                    print(f"SMTP sendmail refused map: {refused}")
-                    
-                    # Mark as sent in database
-                    update_query = """
-                    UPDATE scheduled_emails 
-                    SET status = 'sent', sent_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    """
-                    
-                    execute_query(update_query, (email_data['id'],))
-                    
-                    sent_count += 1
-                    print(f"✅ Email sent to {email_data['company_name']} ({email_data['email']})")
-                    
-                except Exception as email_error:
-                    print(f"❌ Failed to send email to {email_data['email']}: {email_error}")
-                    
-                    # Mark as failed in database
-                    update_query = """
-                    UPDATE scheduled_emails 
-                    SET status = 'failed', error_message = %s
-                    WHERE id = %s
-                    """
-                    
-                    execute_query(update_query, (str(email_error), email_data['id'],))
-                    
-                    failed_count += 1
+                    if queue_scheduled_email(email_data) is not None:
+                        queued_count += 1
+                except Exception as queue_error:
+                    print(f"❌ Failed to queue email to {email_data['email']}: {queue_error}")
                     failed_emails.append({
                         'company': email_data['company_name'],
                         'email': email_data['email'],
-                        'error': str(email_error)
+                        'error': str(queue_error)
                     })
-            
-            server.quit()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Sent {sent_count} emails successfully, {failed_count} failed',
-                'sent_count': sent_count,
-                'failed_count': failed_count,
-                'failed_emails': failed_emails
-            })
-            
-        except Exception as smtp_error:
-            print(f"❌ SMTP Connection Error: {smtp_error}")
-            return jsonify({
-                'success': False, 
-                'message': f'Failed to connect to email server: {str(smtp_error)}'
-            }), 500
+        
+        print(f"📧 Queued {queued_count} pending emails")
+        return jsonify({
+            'success': True, 
+            'message': f'Queued {queued_count} emails for delivery, {len(failed_emails)} failed',
+            'queued_count': queued_count,
+            'failed_count': len(failed_emails),
+            'failed_emails': failed_emails
+        })
         
     except Exception as e:
         print(f"❌ Error sending all pending emails: {e}")
@@ -7609,159 +9529,235 @@ IT/ITES | Digital Services | Software Development"""
     
     return templates.get(email_type, templates['intro'])
 
-# Background task to automatically send scheduled emails
+def queue_scheduled_email(email_data):
+    """Render a scheduled_emails row (threading headers, attachment) and put it on the outbox.
+
+    Returns the outbox id, or None if the email was already queued. The row stays 'pending'
+    until an outbox worker delivers it.
+    """
+    # Generate unique Message-ID for this email
+    message_id = generate_message_id()
+    
+    # Get previous email Message-ID for threading
+    previous_message_id = get_previous_email_message_id(email_data['company_id'], email_data.get('email_type', 'intro'))
+    
+    # Get all Message-IDs in the thread for References header
+    thread_references = get_email_thread_references(email_data['company_id'])
+    references_str = ' '.join(thread_references) if thread_references else None
+    
+    smtp = get_smtp_settings()
+    
+    msg = MIMEMultipart()
+    msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
+    msg['To'] = email_data['email']
+    msg['Subject'] = email_data['subject']
+    msg['Message-ID'] = message_id
+    
+    # Add anti-spam headers
+    add_anti_spam_headers(msg, smtp)
+    
+    # Add threading headers for follow-up emails
+    if previous_message_id:
+        msg['In-Reply-To'] = previous_message_id
+    if references_str:
+        msg['References'] = references_str
+    
+    # Add email body
+    msg.attach(MIMEText(email_data['email_body'], 'plain'))
+    
+    # Attach file if attachment_path exists
+    attachment_path = email_data.get('attachment_path')
+    if attachment_path and os.path.exists(attachment_path):
+        try:
+            with open(attachment_path, 'rb') as f:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(f.read())
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', 'attachment; filename= %s' % os.path.basename(attachment_path))
+            msg.attach(part)
+        except Exception as attach_error:
+            print(f"⚠️ Could not attach file: {attach_error}")
+    
+    # BCC sender to verify delivery
+    with db_transaction():
+        outbox_id = enqueue_email(msg, [email_data['email'], smtp['smtp_username']], email_data.get('email_type') or 'intro', email_data['id'])
+        if outbox_id is not None:
+            # Threading headers are recorded now; they only count once the row is marked sent
+            execute_query("""
+            UPDATE scheduled_emails 
+            SET message_id = %s, in_reply_to = %s, references_header = %s
+            WHERE id = %s
+            """, (message_id, previous_message_id, references_str, email_data['id']))
+    return outbox_id
+
+# Due emails claimed per scheduler pass; a full batch means more are due, so the next pass starts at once
+EMAIL_SCHEDULER_BATCH = int(os.environ.get('EMAIL_SCHEDULER_BATCH', '50'))
+EMAIL_SCHEDULER_LOOKAHEAD = int(os.environ.get('EMAIL_SCHEDULER_LOOKAHEAD', '100'))  # upcoming send times kept in memory
+# Fallback poll for rows inserted elsewhere (other processes, direct SQL) or released by an expired
+# lease: starts at the minimum and doubles on every idle pass up to the maximum
+EMAIL_SCHEDULER_MIN_POLL = float(os.environ.get('EMAIL_SCHEDULER_MIN_POLL', '15'))
+EMAIL_SCHEDULER_MAX_POLL = float(os.environ.get('EMAIL_SCHEDULER_MAX_POLL', '120'))
+
+class ScheduledEmailTimer:
+    """Min-heap of upcoming scheduled_time values, as time.monotonic() deadlines.
+
+    reload() refills it from the database after every scheduler pass; notify() adds the send
+    times of emails scheduled in this process, so the scheduler sleeps exactly until the next
+    one is due instead of polling.
+    """
+
+    def __init__(self, lookahead):
+        self.lookahead = lookahead
+        self._heap = []
+        # Deadlines notified while a reload() is reading the table; merged into the new heap
+        self._notified_during_reload = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._db_offset = timedelta(0)
+        self._wakeups = {'due': 0, 'signal': 0, 'poll': 0}
+
+    def _deadline(self, scheduled_time):
+        # scheduled_time is naive database time; NOW() has one-second resolution, so aim a second late
+        delay = (scheduled_time - (datetime.now() + self._db_offset)).total_seconds()
+        return time.monotonic() + max(0.0, delay) + 1
+
+    def reload(self):
+        """Replace the heap with the next upcoming (not yet due) pending send times"""
+        with self._lock:
+            self._notified_during_reload = []
+        try:
+            db_now = execute_query("SELECT NOW() AS db_now", fetch_one=True)
+            rows = execute_query("""
+                SELECT se.scheduled_time FROM scheduled_emails se
+                WHERE se.status = 'pending' AND se.scheduled_time > NOW()
+                  AND NOT EXISTS (SELECT 1 FROM email_outbox o WHERE o.scheduled_email_id = se.id)
+                ORDER BY se.scheduled_time ASC
+                LIMIT %s
+            """, (self.lookahead,), fetch_all=True)
+        except Exception:
+            # The current heap already holds every notified deadline
+            with self._lock:
+                self._notified_during_reload = None
+            raise
+        with self._lock:
+            notified, self._notified_during_reload = self._notified_during_reload, None
+            if db_now is None:
+                return
+            self._db_offset = db_now['db_now'] - datetime.now()
+            # Emails scheduled after the SELECT started may be missing from rows; keep their notify()
+            self._heap = [self._deadline(row['scheduled_time']) for row in rows] + notified
+            heapq.heapify(self._heap)
+
+    def notify(self, scheduled_times):
+        """Called after scheduled_emails inserts; wakes the scheduler if one of these is due sooner"""
+        with self._lock:
+            for value in scheduled_times:
+                try:
+                    when = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', ''))
+                    deadline = self._deadline(when.replace(tzinfo=None))
+                except (TypeError, ValueError):
+                    # Unparseable time: run a pass now and let reload() read it back from the table
+                    deadline = time.monotonic()
+                heapq.heappush(self._heap, deadline)
+                if self._notified_during_reload is not None:
+                    self._notified_during_reload.append(deadline)
+        self._wake.set()
+
+    def wait(self, fallback):
+        """Sleep until the earliest deadline or `fallback` seconds; returns 'due' or 'poll'"""
+        give_up = time.monotonic() + fallback
+        while True:
+            with self._lock:
+                self._wake.clear()
+                now = time.monotonic()
+                if self._heap and self._heap[0] <= now:
+                    while self._heap and self._heap[0] <= now:
+                        heapq.heappop(self._heap)
+                    self._wakeups['due'] += 1
+                    return 'due'
+                next_due = self._heap[0] if self._heap else give_up
+            if now >= give_up:
+                with self._lock:
+                    self._wakeups['poll'] += 1
+                return 'poll'
+            if self._wake.wait(min(next_due, give_up) - now):
+                with self._lock:
+                    self._wakeups['signal'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'upcoming': len(self._heap),
+                'next_due_in_seconds': round(max(0.0, self._heap[0] - time.monotonic()), 1) if self._heap else None,
+                'wakeups': dict(self._wakeups)
+            }
+
+scheduled_email_timer = ScheduledEmailTimer(EMAIL_SCHEDULER_LOOKAHEAD)
+
+def claim_due_scheduled_emails(limit):
+    """Claim due scheduled emails that are not on the outbox yet; other schedulers skip these rows"""
+    # Let MySQL evaluate current time to avoid app/server timezone drift
+    return claim_rows('scheduled_emails', """
+        SELECT se.id, se.company_id, se.subject, se.email_body, se.scheduled_time,
+               se.email_type, se.attachment_path, c.company_name, c.email, c.contact_person
+        FROM scheduled_emails se
+        JOIN companies c ON se.company_id = c.id
+        WHERE se.status = 'pending' AND se.scheduled_time <= NOW()
+          AND (se.lease_expires_at IS NULL OR se.lease_expires_at < NOW())
+          AND NOT EXISTS (SELECT 1 FROM email_outbox o WHERE o.scheduled_email_id = se.id)
+        ORDER BY se.scheduled_time ASC
+        LIMIT %s
+        FOR UPDATE OF se SKIP LOCKED
+    """, (limit,))
+
+def run_email_scheduler_once():
+    """Claim one batch of due scheduled emails and queue them on the outbox; returns the batch size"""
+    emails = claim_due_scheduled_emails(EMAIL_SCHEDULER_BATCH)
+    lease_heartbeat.hold('scheduled_emails', [email_data['id'] for email_data in emails])
+    for email_data in emails:
+        try:
+            queue_scheduled_email(email_data)
+        except Exception as email_error:
+            print(f"❌ Could not queue scheduled email {email_data['id']}: {email_error}")
+            execute_query("""
+            UPDATE scheduled_emails 
+            SET status = 'failed', error_message = %s
+            WHERE id = %s AND status = 'pending' AND claimed_by = %s
+            """, (str(email_error), email_data['id'], email_worker_id()))
+        finally:
+            # The outbox row (or the failed status) now keeps other schedulers off this email
+            lease_heartbeat.release('scheduled_emails', [email_data['id']])
+    return len(emails)
+
+# Background task that hands due scheduled emails to the outbox
 def check_and_send_scheduled_emails():
-    """Background task that checks for pending emails and sends them when their time arrives"""
+    """Background task that queues pending emails on the outbox when their time arrives.
+
+    Sleeps on scheduled_email_timer until the next send time (or a notify()); the adaptive
+    fallback poll only matters for rows this process was not told about. Safe to run in every
+    web worker and in dedicated email-workers processes at once.
+    """
+    poll = EMAIL_SCHEDULER_MIN_POLL
     while True:
         try:
-            # print("🕐 Checking for scheduled emails to send...")
-            
-            # Find emails that should be sent (scheduled_time <= NOW() and status = 'pending')
-            # Let MySQL evaluate current time to avoid app/server timezone drift
-            query = """
-            SELECT se.id, se.company_id, se.subject, se.email_body, se.scheduled_time,
-                   se.email_type, se.attachment_path, c.company_name, c.email, c.contact_person
-            FROM scheduled_emails se
-            JOIN companies c ON se.company_id = c.id
-            WHERE se.status = 'pending' AND se.scheduled_time <= NOW()
-            ORDER BY se.scheduled_time ASC
-            """
-            
-            emails_to_send = execute_query(query)
-            
-            if emails_to_send:
-                # print(f"📧 Found {len(emails_to_send)} emails ready to send")
-                
-                for email_data in emails_to_send:
-                    try:
-                        # print(f"📤 Sending email to {email_data['company_name']} ({email_data['email']})")
-                        
-                        # Generate unique Message-ID for this email
-                        message_id = generate_message_id()
-                        
-                        # Get previous email Message-ID for threading
-                        previous_message_id = get_previous_email_message_id(email_data['company_id'], email_data.get('email_type', 'intro'))
-                        
-                        # Get all Message-IDs in the thread for References header
-                        thread_references = get_email_thread_references(email_data['company_id'])
-                        
-                        # Get SMTP settings
-                        smtp = get_smtp_settings()
-                        
-                        # Send actual email using SMTP
-                        msg = MIMEMultipart()
-                        msg['From'] = f'YellowStone XPs <{smtp["smtp_username"]}>'
-                        msg['To'] = email_data['email']
-                        msg['Subject'] = email_data['subject']
-                        msg['Message-ID'] = message_id
-                        
-                        # Add anti-spam headers
-                        add_anti_spam_headers(msg, smtp)
-                        
-                        # Add threading headers for follow-up emails
-                        if previous_message_id:
-                            msg['In-Reply-To'] = previous_message_id
-                        
-                        if thread_references:
-                            # Add all previous Message-IDs to References header
-                            references_str = ' '.join(thread_references)
-                            msg['References'] = references_str
-                        
-                        # Add email body
-                        msg.attach(MIMEText(email_data['email_body'], 'plain'))
-                        
-                        # Attach file if attachment_path exists
-                        if email_data.get('attachment_path'):
-                            try:
-                                import os
-                                if os.path.exists(email_data['attachment_path']):
-                                    with open(email_data['attachment_path'], 'rb') as f:
-                                        attachment_data = f.read()
-                                        from email.mime.base import MIMEBase
-                                        from email import encoders
-                                        
-                                        part = MIMEBase('application', 'octet-stream')
-                                        part.set_payload(attachment_data)
-                                        encoders.encode_base64(part)
-                                        part.add_header(
-                                            'Content-Disposition',
-                                            'attachment; filename= %s' % os.path.basename(email_data['attachment_path'])
-                                        )
-                                        msg.attach(part)
-                            except Exception as attach_error:
-                                # print(f"⚠️ Could not attach file: {attach_error}")
-                                pass
-                        
-                        # Fetch current SMTP settings
-                        smtp = get_smtp_settings()
-                        
-                        # Connect to SMTP server and send email (handle SSL vs STARTTLS)
-                        if smtp['smtp_port'] == 465:
-                            server = smtplib.SMTP_SSL(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                        else:
-                            server = smtplib.SMTP(smtp['smtp_server'], smtp['smtp_port'], timeout=30)
-                            server.starttls()
-                        try:
-                            server.set_debuglevel(1)
-                        except Exception:
-                            pass
-                        server.login(smtp['smtp_username'], smtp['smtp_password'])
-                        text = msg.as_string()
-                        refused = server.sendmail(smtp['smtp_username'], [email_data['email'], smtp['smtp_username']], text)
-                        # Optional: log any refusal map for diagnostics
-                        print(f"SMTP sendmail refused map (scheduler): {refused}")
-                        server.quit()
-                        
-                        # print(f"✅ Email sent successfully to {email_data['email']}")
-                        
-                        # Mark as sent in database with Message-ID and threading info
-                        update_query = """
-                        UPDATE scheduled_emails 
-                        SET status = 'sent', sent_at = CURRENT_TIMESTAMP, 
-                            message_id = %s, in_reply_to = %s, references_header = %s
-                        WHERE id = %s
-                        """
-                        
-                        references_str = ' '.join(thread_references) if thread_references else None
-                        execute_query(update_query, (message_id, previous_message_id, references_str, email_data['id'],))
-                        
-                        # Emit WebSocket notification for real-time update (commented out to avoid WSGI errors in background thread)
-                        # socketio.emit('email_sent', {
-                        #     'email_id': email_data['id'],
-                        #     'company_name': email_data['company_name'],
-                        #     'status': 'sent',
-                        #     'sent_at': datetime.now().isoformat()
-                        # }, room='admin')
-                        
-                    except Exception as email_error:
-                        # print(f"❌ SMTP Error sending to {email_data['email']}: {email_error}")
-                        
-                        # Mark as failed in database
-                        update_query = """
-                        UPDATE scheduled_emails 
-                        SET status = 'failed', error_message = %s
-                        WHERE id = %s
-                        """
-                        
-                        execute_query(update_query, (str(email_error), email_data['id'],))
-                        
-                        # Emit WebSocket notification for failed email (commented out to avoid WSGI errors in background thread)
-                        # socketio.emit('email_failed', {
-                        #     'email_id': email_data['id'],
-                        #     'company_name': email_data['company_name'],
-                        #     'status': 'failed',
-                        #     'error_message': str(email_error)
-                        # }, room='admin')
-            else:
-                # print("📭 No emails ready to send")
-                pass
-                
+            if schema_registry.has_column('scheduled_emails', 'lease_expires_at'):
+                claimed = batch = run_email_scheduler_once()
+                while batch >= EMAIL_SCHEDULER_BATCH:
+                    batch = run_email_scheduler_once()
+                    claimed += batch
+                scheduled_email_timer.reload()
+                poll = EMAIL_SCHEDULER_MIN_POLL if claimed else min(poll * 2, EMAIL_SCHEDULER_MAX_POLL)
         except Exception as e:
-            # print(f"❌ Error in email scheduler: {e}")
-            pass
+            print(f"❌ Error in email scheduler: {e}")
+            poll = EMAIL_SCHEDULER_MIN_POLL
         
-        # Wait before checking again
-        time.sleep(15)
+        scheduled_email_timer.wait(poll)
+
+def start_email_workers():
+    """Start the lease heartbeat, the outbox worker pool and the scheduler in this process"""
+    lease_heartbeat.start()
+    email_outbox.start()
+    threading.Thread(target=check_and_send_scheduled_emails, name='email-scheduler', daemon=True).start()
 
 # Employee Access Management API Endpoints
 @app.route('/api/admin/employee-access', methods=['GET'])
@@ -7790,7 +9786,7 @@ def get_employee_access():
             FROM employee_access
             WHERE employee_id = %s
             """
-            access_permissions = execute_query(access_query, (employee['id'],), fetch_all=True)
+            access_permissions = execute_query(access_query, (employee['id'],), fetch_all=True, prepared=True)
             
             # Initialize access object
             employee['access'] = {
@@ -7857,6 +9853,7 @@ def update_bulk_employee_access():
         data = request.get_json()
         updates = data.get('updates', [])
         
+        access_rows = []
         for update in updates:
             employee_id = update.get('employee_id')
             access_type = update.get('access_type')
@@ -7865,12 +9862,12 @@ def update_bulk_employee_access():
             if not employee_id or not access_type:
                 continue
             
-            query = """
-            INSERT INTO employee_access (employee_id, access_type, has_access)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE has_access = VALUES(has_access)
-            """
-            execute_query(query, (employee_id, access_type, has_access))
+            access_rows.append((employee_id, access_type, has_access))
+        
+        # One multi-row upsert instead of a statement per permission
+        if execute_many('employee_access', ['employee_id', 'access_type', 'has_access'], access_rows,
+                        update_columns=['has_access']) is None:
+            return jsonify({'error': 'Failed to update employee access'}), 500
         
         return jsonify({'success': True, 'message': 'Access permissions updated successfully'})
         
@@ -7906,7 +9903,7 @@ def get_employee_access_permissions():
         FROM employee_access
         WHERE employee_id = %s
         """
-        permissions = execute_query(query, (employee_id,), fetch_all=True)
+        permissions = execute_query(query, (employee_id,), fetch_all=True, prepared=True)
         
         # Build access object
         access = {
@@ -7980,17 +9977,8 @@ def update_settings():
                 """
                 execute_query(query, (key, str(value), category))
         
-        # If email settings are updated, update the global SMTP variables
-        if 'email' in settings:
-            global SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
-            if 'smtp_server' in settings['email']:
-                SMTP_SERVER = settings['email']['smtp_server']
-            if 'smtp_port' in settings['email']:
-                SMTP_PORT = int(settings['email']['smtp_port'])
-            if 'smtp_username' in settings['email']:
-                SMTP_USERNAME = settings['email']['smtp_username']
-            if 'smtp_password' in settings['email']:
-                SMTP_PASSWORD = settings['email']['smtp_password']
+        # Email senders read settings through the snapshot; make the next read reload
+        settings_snapshot.bump()
         
         return jsonify({'success': True, 'message': 'Settings updated successfully'})
         
@@ -8018,17 +10006,7 @@ def update_setting(key):
         """
         execute_query(query, (key, str(value), category))
         
-        # Update global SMTP variables if email settings are changed
-        if category == 'email':
-            global SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
-            if key == 'smtp_server':
-                SMTP_SERVER = value
-            elif key == 'smtp_port':
-                SMTP_PORT = int(value)
-            elif key == 'smtp_username':
-                SMTP_USERNAME = value
-            elif key == 'smtp_password':
-                SMTP_PASSWORD = value
+        settings_snapshot.bump()
         
         return jsonify({'success': True, 'message': 'Setting updated successfully'})
         
@@ -8059,25 +10037,18 @@ def test_email():
             print(f"⚠️ No email address provided in test-email request. Data received: {data}")
             return jsonify({'error': 'Please enter a test email address in the "Enter test email address" field'}), 400
         
-        print("🔵 Fetching SMTP settings from database...")
-        # Get current SMTP settings
-        smtp_query = """
-        SELECT setting_key, setting_value
-        FROM system_settings
-        WHERE setting_category = 'email' AND setting_key IN ('smtp_server', 'smtp_port', 'smtp_username', 'smtp_password', 'from_name')
-        """
-        smtp_settings = execute_query(smtp_query)
-        print(f"🔵 SMTP settings fetched: {len(smtp_settings) if smtp_settings else 0} records")
+        print("🔵 Fetching SMTP settings...")
+        # Saved SMTP settings (the snapshot reloads after Save Changes bumps it)
+        smtp_config = {
+            key: value for key, value in settings_snapshot.get().get('email', {}).items()
+            if key in ('smtp_server', 'smtp_port', 'smtp_username', 'smtp_password', 'from_name')
+        }
+        print(f"🔵 SMTP settings fetched: {len(smtp_config)} records")
         
         # Check if SMTP settings exist
-        if not smtp_settings or len(smtp_settings) == 0:
+        if not smtp_config:
             print("⚠️ No SMTP settings found in database")
             return jsonify({'error': '⚠️ SMTP settings not saved. Please click "Save Changes" first before testing.'}), 400
-        
-        # Build SMTP config
-        smtp_config = {}
-        for setting in smtp_settings:
-            smtp_config[setting['setting_key']] = setting['setting_value'].strip() if setting['setting_value'] else setting['setting_value']
         print(f"🔵 Built SMTP config: {list(smtp_config.keys())}")
         
         # Check if required settings exist
@@ -8134,20 +10105,13 @@ YellowStone XPs Team"""
         # Connect to SMTP server
         print(f"Attempting to connect to {smtp_server}:{smtp_port}")
         
-        # Use SSL for port 465, STARTTLS for other ports
-        if smtp_port == 465:
-            # SSL connection
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=30)
-        else:
-            # STARTTLS connection
-            server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
-            if smtp_port in [587, 25, 2525]:  # Only use STARTTLS for these ports
-                server.starttls()
-        
-        server.login(smtp_config.get('smtp_username', SMTP_USERNAME), 
-                    smtp_config.get('smtp_password', SMTP_PASSWORD))
-        server.sendmail(smtp_config.get('smtp_username', SMTP_USERNAME), test_email_address, msg.as_string())
-        server.quit()
+        # Same pooled path as every other sender (SSL on 465, STARTTLS when the server offers it)
+        send_smtp_message({
+            'smtp_server': smtp_server,
+            'smtp_port': smtp_port,
+            'smtp_username': smtp_config.get('smtp_username', SMTP_USERNAME),
+            'smtp_password': smtp_config.get('smtp_password', SMTP_PASSWORD)
+        }, test_email_address, msg.as_string())
         
         return jsonify({'success': True, 'message': f'Test email sent successfully using port {smtp_port}'})
         
@@ -8252,249 +10216,56 @@ def employee_forgot_password():
 
 @app.route('/api/admin/tenders', methods=['GET'])
 def get_tenders():
-    """Get all tenders"""
+    """Get all tenders (filters: type, status, assignee, from/to; keyset pages with limit/cursor)"""
     try:
         tender_type = request.args.get('type', 'all')  # 'all', 'government', 'private'
 
-        # Ensure tenders table exists with correct schema
-        try:
-            # First try to create the table
-            execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS tenders (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tender_number VARCHAR(50) NOT NULL UNIQUE,
-                    title VARCHAR(255) NOT NULL,
-                    tender_name VARCHAR(255) NULL,
-                    short_name VARCHAR(100) NULL,
-                    description TEXT NULL,
-                    tender_type ENUM('government', 'private') NOT NULL,
-                    category VARCHAR(255) NULL,
-                    organization_name VARCHAR(255) NULL,
-                    budget_amount DECIMAL(15,2) NULL,
-                    currency VARCHAR(3) NOT NULL DEFAULT 'INR',
-                    published_date DATE NULL,
-                    rfp_date DATE NULL,
-                    submission_deadline DATE NULL,
-                    rfq_date DATE NULL,
-                    opening_date DATE NULL,
-                    status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted',
-                    query_text TEXT NULL,
-                    contact_person VARCHAR(255) NULL,
-                    contact_email VARCHAR(255) NULL,
-                    contact_phone VARCHAR(50) NULL,
-                    location VARCHAR(255) NULL,
-                    eligibility_criteria TEXT NULL,
-                    documents_required TEXT NULL,
-                    important_documents TEXT NULL,
-                    project_coordinator_id INT NULL,
-                    project_team_ids TEXT NULL,
-                    created_by INT NULL,
-                    updated_by INT NULL,
-                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    FOREIGN KEY (project_coordinator_id) REFERENCES users(id) ON DELETE SET NULL,
-                    FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL,
-                    FOREIGN KEY (updated_by) REFERENCES users(id) ON DELETE SET NULL
-                )
-                """
-            )
-            # If table exists with old schema, alter the status column
-            try:
-                execute_query("ALTER TABLE tenders MODIFY COLUMN status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted'")
-            except Exception:
-                pass  # Column might already be correct or doesn't exist yet
-        except Exception as e:
-            print(f"Note: Tenders table may already exist or error creating it: {e}")
-        
-        # Create created_tenders table (no unique constraints)
-        try:
-            execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS created_tenders (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tender_number VARCHAR(50) NOT NULL,
-                    title VARCHAR(255) NOT NULL,
-                    tender_name VARCHAR(255) NULL,
-                    short_name VARCHAR(100) NULL,
-                    description TEXT NULL,
-                    tender_type ENUM('government', 'private') NOT NULL,
-                    category VARCHAR(255) NULL,
-                    organization_name VARCHAR(255) NULL,
-                    budget_amount DECIMAL(15,2) NULL,
-                    currency VARCHAR(3) NOT NULL DEFAULT 'INR',
-                    published_date DATE NULL,
-                    rfp_date DATE NULL,
-                    submission_deadline DATE NULL,
-                    rfq_date DATE NULL,
-                    opening_date DATE NULL,
-                    status VARCHAR(50) NOT NULL DEFAULT 'tender_submitted',
-                    query_text TEXT NULL,
-                    contact_person VARCHAR(255) NULL,
-                    contact_email VARCHAR(255) NULL,
-                    contact_phone VARCHAR(50) NULL,
-                    location VARCHAR(255) NULL,
-                    eligibility_criteria TEXT NULL,
-                    documents_required TEXT NULL,
-                    important_documents TEXT NULL,
-                    project_coordinator_id INT NULL,
-                    project_team_ids TEXT NULL,
-                    created_by INT NULL,
-                    updated_by INT NULL,
-                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    FOREIGN KEY (project_coordinator_id) REFERENCES users(id) ON DELETE SET NULL,
-                    FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL,
-                    FOREIGN KEY (updated_by) REFERENCES users(id) ON DELETE SET NULL
-                )
-                """
-            )
-            # Ensure extra optional date columns exist
-            try:
-                exists_col = execute_query("""
-                    SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME='created_tenders' AND COLUMN_NAME='query_submission_date'
-                """, fetch_one=True) or {'cnt': 0}
-                if int(exists_col.get('cnt', 0)) == 0:
-                    execute_query("ALTER TABLE created_tenders ADD COLUMN query_submission_date DATE NULL AFTER opening_date")
-            except Exception:
-                pass
-            try:
-                exists_col2 = execute_query("""
-                    SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME='created_tenders' AND COLUMN_NAME='appendix_ab_submission_date'
-                """, fetch_one=True) or {'cnt': 0}
-                if int(exists_col2.get('cnt', 0)) == 0:
-                    execute_query("ALTER TABLE created_tenders ADD COLUMN appendix_ab_submission_date DATE NULL AFTER query_submission_date")
-            except Exception:
-                pass
-            # Ensure assigned_vendor_id exists for vendor assignment (idempotent)
-            try:
-                col_check = execute_query(
-                    """
-                    SELECT COUNT(*) AS cnt
-                    FROM information_schema.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE()
-                      AND TABLE_NAME = 'created_tenders'
-                      AND COLUMN_NAME = 'assigned_vendor_id'
-                    """,
-                    fetch_one=True
-                ) or { 'cnt': 0 }
-                if int(col_check.get('cnt', 0)) == 0:
-                    execute_query(
-                        "ALTER TABLE created_tenders ADD COLUMN assigned_vendor_id INT NULL AFTER project_team_ids"
-                    )
-
-                fk_check = execute_query(
-                    """
-                    SELECT COUNT(*) AS cnt
-                    FROM information_schema.KEY_COLUMN_USAGE
-                    WHERE TABLE_SCHEMA = DATABASE()
-                      AND TABLE_NAME = 'created_tenders'
-                      AND COLUMN_NAME = 'assigned_vendor_id'
-                      AND REFERENCED_TABLE_NAME = 'vendors'
-                    """,
-                    fetch_one=True
-                ) or { 'cnt': 0 }
-                if int(fk_check.get('cnt', 0)) == 0:
-                    try:
-                        execute_query(
-                            "ALTER TABLE created_tenders ADD CONSTRAINT fk_created_tenders_vendor FOREIGN KEY (assigned_vendor_id) REFERENCES vendors(id) ON DELETE SET NULL"
-                        )
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-        except Exception as e:
-            print(f"Note: created_tenders table may already exist or error creating it: {e}")
-
-        # Ensure tender_updates exists for logging daily updates by employees
-        # No foreign key on tender_id to avoid constraint issues (we'll validate in code)
-        try:
-            execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS tender_updates (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tender_id INT NOT NULL,
-                    employee_id INT NULL,
-                    update_message TEXT NULL,
-                    status VARCHAR(50) NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-                )
-                """
-            )
-            # Remove foreign key on tender_id if it exists (causes issues with table switching)
-            try:
-                # Get constraint names first
-                constraints = execute_query("""
-                    SELECT CONSTRAINT_NAME 
-                    FROM information_schema.KEY_COLUMN_USAGE 
-                    WHERE TABLE_NAME = 'tender_updates' 
-                    AND TABLE_SCHEMA = DATABASE()
-                    AND COLUMN_NAME = 'tender_id'
-                    AND REFERENCED_TABLE_NAME IS NOT NULL
-                """, fetch_all=True)
-                # Drop each constraint that references tender_id
-                if constraints:
-                    for constraint in constraints:
-                        constraint_name = constraint.get('CONSTRAINT_NAME')
-                        if constraint_name:
-                            try:
-                                execute_query(f"ALTER TABLE tender_updates DROP FOREIGN KEY {constraint_name}")
-                            except Exception:
-                                pass
-            except Exception:
-                pass  # Table might not exist or no constraints
-        except Exception:
-            pass
-
-        query = """
-        SELECT 
+        select_sql = """
             t.*, 
             u.name as created_by_name,
             u2.name as updated_by_name,
             ucoor.name as project_coordinator_name,
             v.company_name as assigned_vendor_name,
             DATEDIFF(t.submission_deadline, CURDATE()) as days_left,
-            tu.update_message AS today_update_message,
-            tu.employee_name AS today_update_by
-        FROM created_tenders t
+            IF(t.latest_update_at >= CURDATE(), t.latest_update_message, NULL) AS today_update_message,
+            IF(t.latest_update_at >= CURDATE(), t.latest_update_by, NULL) AS today_update_by
+        """
+        from_sql = """
+        created_tenders t
         LEFT JOIN users u ON t.created_by = u.id
         LEFT JOIN users u2 ON t.updated_by = u2.id
         LEFT JOIN users ucoor ON t.project_coordinator_id = ucoor.id
         LEFT JOIN vendors v ON t.assigned_vendor_id = v.id
-        LEFT JOIN (
-            SELECT 
-                y.tender_id, 
-                y.update_message, 
-                COALESCE(u3.name, 'Unknown') AS employee_name
-            FROM tender_updates y
-            INNER JOIN (
-                SELECT tender_id, MAX(id) AS latest_id
-                FROM tender_updates
-                WHERE DATE(created_at) = CURDATE()
-                GROUP BY tender_id
-            ) x ON y.id = x.latest_id
-            LEFT JOIN users u3 ON y.employee_id = u3.id
-        ) tu ON tu.tender_id = t.id
         """
-        
+        conditions, params = [], []
         if tender_type != 'all':
-            query += " WHERE t.tender_type = %s"
-            query += " ORDER BY t.created_at DESC"
-            tenders = execute_query(query, (tender_type,), fetch_all=True)
-        else:
-            query += " ORDER BY t.created_at DESC"
-            tenders = execute_query(query, fetch_all=True)
-        
-        # Debug: Print first tender's update_by if exists
-        if tenders and len(tenders) > 0:
-            first_tender = tenders[0]
-            print(f"DEBUG: First tender update_by: {first_tender.get('today_update_by')}, update_message: {first_tender.get('today_update_message')}")
+            conditions.append("t.tender_type = %s")
+            params.append(tender_type)
+        if request.args.get('status'):
+            conditions.append("t.status = %s")
+            params.append(request.args['status'])
+        if request.args.get('assignee'):
+            conditions.append("t.project_coordinator_id = %s")
+            params.append(request.args['assignee'])
+        add_date_range_filter('t.created_at', conditions, params)
+        order = [timestamp_sort_key('t.created_at', 'created_at'), ('t.id', 'id')]
+
+        page = page_request_args()
+        if page:
+            return jsonify(keyset_page(select_sql, from_sql, conditions, params, order, *page))
+
+        tenders = stream_query(
+            f"SELECT {select_sql} FROM {from_sql}{where_sql(conditions)} ORDER BY t.created_at DESC, t.id DESC",
+            params
+        )
         
-        return jsonify(tenders if tenders else [])
+        # Rows are serialized as they come off the cursor
+        return stream_json_array(tenders)
         
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter or cursor: {e}'}), 400
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         print(f"Error getting tenders: {e}")
         return jsonify([])
@@ -8511,25 +10282,10 @@ def export_tenders_report():
             t.tender_number,
             t.status,
             t.submission_deadline,
-            tu.update_message AS today_update_message,
-            tu.employee_name AS today_update_by,
-            tu.updated_at AS today_update_at
+            IF(t.latest_update_at >= CURDATE(), t.latest_update_message, NULL) AS today_update_message,
+            IF(t.latest_update_at >= CURDATE(), t.latest_update_by, NULL) AS today_update_by,
+            IF(t.latest_update_at >= CURDATE(), t.latest_update_at, NULL) AS today_update_at
         FROM created_tenders t
-        LEFT JOIN (
-            SELECT 
-                y.tender_id, 
-                y.update_message, 
-                COALESCE(u.name, 'Unknown') AS employee_name,
-                y.created_at AS updated_at
-            FROM tender_updates y
-            INNER JOIN (
-                SELECT tender_id, MAX(id) AS latest_id
-                FROM tender_updates
-                WHERE DATE(created_at) = CURDATE()
-                GROUP BY tender_id
-            ) x ON y.id = x.latest_id
-            LEFT JOIN users u ON y.employee_id = u.id
-        ) tu ON tu.tender_id = t.id
         ORDER BY t.created_at DESC
         """
 
@@ -8592,44 +10348,6 @@ def update_employee_tender(tender_id):
         if not update_message:
             return jsonify({'success': False, 'message': 'Update message is required'}), 400
         
-        # Ensure tender_updates table exists (no foreign key on tender_id to avoid constraint issues)
-        try:
-            execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS tender_updates (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tender_id INT NOT NULL,
-                    employee_id INT NULL,
-                    update_message TEXT NULL,
-                    status VARCHAR(50) NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (employee_id) REFERENCES users(id) ON DELETE SET NULL
-                )
-                """
-            )
-            # Remove foreign key on tender_id if it exists (causes issues with table switching)
-            try:
-                constraints = execute_query("""
-                    SELECT CONSTRAINT_NAME 
-                    FROM information_schema.KEY_COLUMN_USAGE 
-                    WHERE TABLE_NAME = 'tender_updates' 
-                    AND TABLE_SCHEMA = DATABASE()
-                    AND COLUMN_NAME = 'tender_id'
-                    AND REFERENCED_TABLE_NAME IS NOT NULL
-                """, fetch_all=True)
-                if constraints:
-                    for constraint in constraints:
-                        constraint_name = constraint.get('CONSTRAINT_NAME')
-                        if constraint_name:
-                            try:
-                                execute_query(f"ALTER TABLE tender_updates DROP FOREIGN KEY {constraint_name}")
-                            except Exception:
-                                pass
-            except Exception:
-                pass
-        except Exception:
-            pass
-        
         # Verify employee is assigned to this tender (in project_coordinator_id or project_team_ids)
         tender_query = "SELECT project_coordinator_id, project_team_ids FROM created_tenders WHERE id = %s"
         tender_data = execute_query(tender_query, (tender_id,), fetch_one=True)
@@ -8662,17 +10380,29 @@ def update_employee_tender(tender_id):
         if not is_assigned:
             return jsonify({'success': False, 'message': 'You are not assigned to this tender'}), 403
         
-        # Insert update record
-        insert_query = """
-        INSERT INTO tender_updates (tender_id, employee_id, update_message, status)
-        VALUES (%s, %s, %s, %s)
-        """
-        execute_query(insert_query, (tender_id, employee_id, update_message, status))
-        
-        # Optionally update tender status if provided
-        if status:
-            update_tender_query = "UPDATE created_tenders SET status = %s WHERE id = %s"
-            execute_query(update_tender_query, (status, tender_id))
+        # Log the update and refresh the tender's latest-update projection together
+        with db_transaction():
+            insert_query = """
+            INSERT INTO tender_updates (tender_id, employee_id, update_message, status)
+            VALUES (%s, %s, %s, %s)
+            """
+            execute_query(insert_query, (tender_id, employee_id, update_message, status))
+            execute_query("""
+            UPDATE created_tenders t
+            JOIN tender_updates y ON y.id = LAST_INSERT_ID()
+            LEFT JOIN users u ON y.employee_id = u.id
+            SET t.latest_update_id = y.id,
+                t.latest_update_message = y.update_message,
+                t.latest_update_by = COALESCE(u.name, 'Unknown'),
+                t.latest_update_at = y.created_at,
+                t.updated_at = t.updated_at
+            WHERE t.id = %s
+            """, (tender_id,))
+            
+            # Optionally update tender status if provided
+            if status:
+                update_tender_query = "UPDATE created_tenders SET status = %s WHERE id = %s"
+                execute_query(update_tender_query, (status, tender_id))
         
         # Broadcast database change for real-time updates
         try:
@@ -8974,25 +10704,6 @@ def delete_tender(tender_id):
 def manage_tender_extensions(tender_id):
     """Create and list tender date extensions. If a date field is extended, update the tender record too."""
     try:
-        # Ensure log table exists
-        try:
-            execute_query(
-                """
-                CREATE TABLE IF NOT EXISTS tender_extensions (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tender_id INT NOT NULL,
-                    date_field VARCHAR(50) NOT NULL,
-                    old_date DATE NULL,
-                    new_date DATE NULL,
-                    reason TEXT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (tender_id) REFERENCES created_tenders(id) ON DELETE CASCADE
-                )
-                """
-            )
-        except Exception:
-            pass
-
         # CORS preflight
         if request.method == 'OPTIONS':
             return make_response(('', 204))
@@ -9072,11 +10783,28 @@ def assign_vendor_to_tender(tender_id):
         print(f"Error assigning vendor to tender: {e}")
         return jsonify({'success': False, 'message': 'Failed to assign vendor'}), 500
 
-# Start the background email scheduler
-email_scheduler_thread = threading.Thread(target=check_and_send_scheduled_emails, daemon=True)
-email_scheduler_thread.start()
+if __name__ == '__main__' and sys.argv[1:2] == ['migrate']:
+    sys.exit(0 if run_migrations() is not None else 1)
+
+if DB_MIGRATE_ON_STARTUP:
+    run_migrations()
+schema_registry.refresh()
+
+# Email scheduler + outbox workers: embedded in every web worker by default (claims are safe
+# across processes), or only in dedicated `python flask_backend_mysql.py email-workers` processes
+RUN_EMAIL_WORKERS_ONLY = __name__ == '__main__' and sys.argv[1:2] == ['email-workers']
+if EMAIL_WORKERS_EMBEDDED or RUN_EMAIL_WORKERS_ONLY:
+    start_email_workers()
+
+counter_reconciler_thread = threading.Thread(target=run_counter_reconciler, daemon=True)
+counter_reconciler_thread.start()
 # print("🚀 Email scheduler started - checking every 30 seconds")
 
+if RUN_EMAIL_WORKERS_ONLY:
+    print(f"📮 Email scheduler and outbox workers running as {email_worker_id()} (no web server)")
+    while True:
+        time.sleep(3600)
+
 if __name__ == '__main__':
     print("Starting Flask server with WebSocket support...")
     socketio.run(app, debug=False, host='0.0.0.0', port=8000)
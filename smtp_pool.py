@@ -0,0 +1,190 @@
+# Pooled SMTP sessions shared by every email sender in flask_backend_mysql.py
+#
+# Sessions are keyed by (server, port, username, password), so saving new SMTP settings
+# simply starts a fresh set of sessions. Standard library only, so it can be exercised
+# against a local stub server (see benchmarks/smtp_pool_benchmark.py) without the app.
+
+import smtplib
+import socket
+import threading
+import time
+
+# Reply codes that mean "this session is finished, open another one"
+SMTP_RECONNECT_CODES = {421}
+
+
+class SmtpSession:
+    def __init__(self, key, server):
+        self.key = key
+        self.server = server
+        self.messages = 0
+        self.last_used = time.time()
+
+
+class SmtpSessionPool:
+    """Bounded pool of logged-in SMTP sessions.
+
+    - idle sessions are probed with NOOP before reuse once they have sat for probe_after seconds
+    - sessions are closed after max_messages sends or max_idle seconds without use
+    - a send that hits a 421 reply, a disconnect or a timeout is retried once on a new session
+    - allow_plaintext permits servers without STARTTLS/AUTH (local stub servers only)
+    """
+
+    def __init__(self, size=4, max_messages=100, probe_after=30, max_idle=240, timeout=30,
+                 allow_plaintext=False):
+        self.size = max(1, int(size))
+        self.max_messages = max(1, int(max_messages))
+        self.probe_after = probe_after
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.allow_plaintext = allow_plaintext
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._stats = {
+            'opened': 0,
+            'reused': 0,
+            'probes': 0,
+            'probe_failures': 0,
+            'reconnects': 0,
+            'retired': 0,
+            'messages': 0,
+            'errors': 0
+        }
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    @staticmethod
+    def _key(smtp):
+        return (smtp['smtp_server'], int(smtp['smtp_port']), smtp.get('smtp_username') or '', smtp.get('smtp_password') or '')
+
+    def _open(self, key):
+        host, port, username, password = key
+        if port == 465:
+            server = smtplib.SMTP_SSL(host, port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(host, port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if port != 465:
+                if server.has_extn('starttls'):
+                    server.starttls()
+                    server.ehlo()
+                elif not self.allow_plaintext:
+                    raise smtplib.SMTPNotSupportedError(f"{host}:{port} does not offer STARTTLS")
+            if username and (server.has_extn('auth') or not self.allow_plaintext):
+                server.login(username, password)
+        except Exception:
+            self._close(server)
+            raise
+        self._bump('opened')
+        return SmtpSession(key, server)
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _usable(self, session):
+        idle_for = time.time() - session.last_used
+        if idle_for > self.max_idle or session.messages >= self.max_messages:
+            self._bump('retired')
+            return False
+        if idle_for > self.probe_after:
+            self._bump('probes')
+            try:
+                code, _ = session.server.noop()
+            except Exception:
+                code = None
+            if code != 250:
+                self._bump('probe_failures')
+                return False
+        return True
+
+    def _checkout(self, key):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise smtplib.SMTPException(f"No SMTP session free within {self.timeout}s ({self.size} in use)")
+        try:
+            while True:
+                with self._lock:
+                    index = next((i for i in range(len(self._idle) - 1, -1, -1) if self._idle[i].key == key), None)
+                    session = self._idle.pop(index) if index is not None else None
+                if session is None:
+                    return self._open(key)
+                if self._usable(session):
+                    self._bump('reused')
+                    return session
+                self._close(session.server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, session, healthy=True):
+        session.last_used = time.time()
+        stale = []
+        if healthy and session.messages < self.max_messages:
+            with self._lock:
+                # Sessions for replaced settings are never checked out again
+                stale = [s for s in self._idle if s.key != session.key]
+                self._idle = [s for s in self._idle if s.key == session.key] + [session]
+        else:
+            if healthy:
+                self._bump('retired')
+            stale = [session]
+        for old in stale:
+            self._close(old.server)
+        self._slots.release()
+
+    @staticmethod
+    def _needs_reconnect(error):
+        if isinstance(error, (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError)):
+            return True
+        return getattr(error, 'smtp_code', None) in SMTP_RECONNECT_CODES
+
+    def send(self, smtp, from_addr, to_addrs, message):
+        """sendmail() over a pooled session for the given settings; returns the refused-recipients map"""
+        key = self._key(smtp)
+        for attempt in range(2):
+            session = self._checkout(key)
+            try:
+                refused = session.server.sendmail(from_addr, to_addrs, message)
+            except Exception as e:
+                self._bump('errors')
+                if self._needs_reconnect(e):
+                    self._release(session, healthy=False)
+                    if attempt == 0:
+                        self._bump('reconnects')
+                        continue
+                    raise
+                # The session itself is fine (e.g. a refused recipient); clear the transaction and keep it
+                try:
+                    session.server.rset()
+                    self._release(session)
+                except Exception:
+                    self._release(session, healthy=False)
+                raise
+            session.messages += 1
+            self._bump('messages')
+            self._release(session)
+            return refused
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._close(session.server)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['size'] = self.size
+        stats['max_messages'] = self.max_messages
+        return stats